@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+离线回放引擎
+把记录模式 (RECORD_SNAPSHOTS=1) 保存的全量快照按扫描周期重放，
+经过 SqueezeSignalAnalyzer 的评分、冷却和阶段跟踪逻辑，输出信号、阶段转换和前向收益。
+指标 (OI激增比、多空比趋势、前向收益) 全部用 pandas 向量化预先计算，
+逐周期循环只处理通过核心条件的币种和正在跟踪的币种。
+
+用法:
+    python backtest.py --start 2026-01-01 --end 2026-02-01
+    python backtest.py --funding-threshold -0.001 --oi-surge-ratio 2.0
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from squeeze_monitor import (
+    Config, SqueezeSignalAnalyzer, SignalLogStore, TimeSeriesStore, OIHistoryBuffer, CycleSnapshot,
+    MARKET_SNAPSHOT_DTYPE, log,
+)
+
+# 前向收益的观察窗口 {名称: 秒}
+FORWARD_HORIZONS = {"1h": 3600, "4h": 4 * 3600, "24h": 24 * 3600}
+
+# 多空比趋势的回看时间 (与实盘接口的取数范围一致)
+GLOBAL_TREND_LOOKBACK = 9 * 3600  # globalLongShortAccountRatio: 1h周期取10个点
+TOP_TREND_STEP = 15 * 60  # topLongShortPositionRatio: 15m周期
+
+
+# ==================== 数据加载 ====================
+def load_snapshots(start: Optional[float] = None, end: Optional[float] = None,
+                   symbols: Optional[List[str]] = None, root: str = Config.TIMESERIES_DIR) -> pd.DataFrame:
+    """读取快照数据集为长表 (每行一个币种一个周期)"""
+    store = TimeSeriesStore("snapshots", MARKET_SNAPSHOT_DTYPE, root=root)
+    frames = []
+    for symbol in symbols or store.symbols():
+        records = store.read(symbol, start, end)
+        if len(records):
+            df = pd.DataFrame(records)
+            df["symbol"] = symbol
+            frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=list(MARKET_SNAPSHOT_DTYPE.names) + ["symbol"])
+
+    df = pd.concat(frames, ignore_index=True)
+    # float32 -> float64，避免后续计算精度损失
+    for name in MARKET_SNAPSHOT_DTYPE.names:
+        if df[name].dtype == np.float32:
+            df[name] = df[name].astype(np.float64)
+    return df
+
+
+# ==================== 向量化指标 ====================
+def _lookup(df: pd.DataFrame, prices: pd.DataFrame, col: str, offset: float,
+            direction: str, tolerance: Optional[float] = None) -> pd.Series:
+    """按币种查找 ts+offset 附近的 col 值 (merge_asof)，返回与 df 行对齐的序列"""
+    left = pd.DataFrame({"key": df["ts"] + offset, "sid": df["sid"].values, "row": np.arange(len(df))})
+    left = left.sort_values("key")
+    right = prices[["ts", "sid", col]].dropna().sort_values("ts").rename(columns={"ts": "key", col: "value"})
+
+    merged = pd.merge_asof(left, right, on="key", by="sid", direction=direction, tolerance=tolerance)
+    return pd.Series(merged.sort_values("row")["value"].values, index=df.index)
+
+
+def _bucket_surge(oi: pd.DataFrame) -> np.ndarray:
+    """
+    逐行计算激增比 (oi 为有效OI行，按币种/时间排序)
+    当前行所在的桶取本行的值，之前的桶取各桶最后一个样本，
+    与实盘在该时刻写入后调用 OIHistoryBuffer.surge_ratio 的结果相同
+    """
+    layout = OIHistoryBuffer()
+    if oi.empty:
+        return np.ones(0)
+    bucket = (oi["ts"].to_numpy() // layout.period).astype(np.int64)
+    sid = oi["sid"].to_numpy()
+    first = bucket.min()
+
+    # 桶 × 币种 的矩阵，每格为该桶最后一个样本，缺失为NaN
+    closes = pd.DataFrame({"b": bucket - first, "sid": sid, "oi": oi["oi"].to_numpy()})
+    closes = closes.drop_duplicates(["b", "sid"], keep="last")
+    wide = np.full((bucket.max() - first + 1, sid.max() + 1), np.nan)
+    wide[closes["b"], closes["sid"]] = closes["oi"]
+    wide = pd.DataFrame(wide)
+
+    def previous_buckets(k: int):
+        """本桶之前 k-1 个桶的样本和与样本数"""
+        if k <= 1:
+            return np.zeros(len(oi)), np.zeros(len(oi))
+        shifted = wide.shift(1)
+        total = shifted.rolling(k - 1, min_periods=1).sum().fillna(0.0).to_numpy()
+        count = shifted.notna().rolling(k - 1, min_periods=1).sum().to_numpy()
+        rows = bucket - first
+        return total[rows, sid], count[rows, sid]
+
+    values = oi["oi"].to_numpy()
+    long_sum, long_n = previous_buckets(layout.window)
+    short_sum, short_n = previous_buckets(layout.short_window)
+    long_sum, long_n = long_sum + values, long_n + 1
+    short_sum, short_n = short_sum + values, short_n + 1
+
+    ready = (long_n >= layout.min_samples) & (long_sum > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = (short_sum / short_n) / (long_sum / long_n)
+    return np.where(ready, ratio, 1.0)
+
+
+def compute_indicators(df: pd.DataFrame, interval: float = Config.SCAN_INTERVAL_SECONDS) -> pd.DataFrame:
+    """
+    为每行计算回放所需的指标
+    - cycle: 周期编号 (ts按扫描间隔分桶)，同一周期同一币种只保留最后一行
+    - surge / oi_change_pct: 与实盘一致，只在OI有效时计入历史，按 OI_SAMPLE_SECONDS 分桶的近3桶/近10桶均值
+    - global_trend / top_trend: 由记录的多空比序列回看得到
+    - core: 是否满足核心条件 (费率 + 成交量 + OI激增)
+    """
+    df = df.copy()
+    df["cycle"] = (df["ts"] // interval).astype(np.int64)
+    df = df.sort_values(["symbol", "ts"]).drop_duplicates(["cycle", "symbol"], keep="last")
+    df = df.reset_index(drop=True)
+    df["sid"] = pd.factorize(df["symbol"])[0]  # 整数币种编号，merge_asof 分组比字符串快
+
+    # OI激增比 (与实盘缓冲区一致: 按墙钟时间分桶，同一桶保留最后一个样本)
+    oi = df.loc[df["oi"] > 0, ["symbol", "sid", "ts", "oi"]]
+    previous = oi.groupby("symbol")["oi"].shift(1)
+    df["surge"] = pd.Series(_bucket_surge(oi), index=oi.index).reindex(df.index).fillna(1.0)
+    df["oi_change_pct"] = ((oi["oi"] - previous) / previous * 100).reindex(df.index).fillna(0.0)
+
+    # 多空比趋势
+    first_global = _lookup(df, df, "global_ls_ratio", -GLOBAL_TREND_LOOKBACK, "forward")
+    df["global_trend"] = np.where(df["global_ls_ratio"] < first_global.fillna(df["global_ls_ratio"]), "下降", "上升")
+
+    top_prev1 = _lookup(df, df, "top_ls_ratio", -TOP_TREND_STEP, "backward")
+    top_prev2 = _lookup(df, df, "top_ls_ratio", -2 * TOP_TREND_STEP, "backward")
+    trend_up = (top_prev2 <= top_prev1) & (top_prev1 <= df["top_ls_ratio"])
+    df["top_trend"] = np.where(trend_up, "上升", "下降或震荡")
+
+    df["core"] = (
+        (df["funding_rate"] < Config.FUNDING_RATE_THRESHOLD)
+        & (df["volume_24h"] >= Config.MIN_VOLUME_USD)
+        & (df["oi"] > 0)
+        & (df["surge"] > Config.OI_SURGE_RATIO)
+    )
+    return df
+
+
+def forward_returns(rows: pd.DataFrame, prices: pd.DataFrame,
+                    horizons: Dict[str, float] = FORWARD_HORIZONS,
+                    interval: float = Config.SCAN_INTERVAL_SECONDS) -> pd.DataFrame:
+    """为 rows 的每一行计算各窗口的前向收益 (向量化 merge_asof)"""
+    result = pd.DataFrame(index=rows.index)
+    for name, seconds in horizons.items():
+        future_price = _lookup(rows, prices, "price", seconds, "forward", tolerance=interval * 2)
+        result[f"ret_{name}"] = future_price / rows["price"] - 1
+    return result
+
+
+# ==================== 回放数据源 ====================
+class DiscardSeries:
+    """回放不写时序存储 (接口与 TimeSeriesStore.add 一致)"""
+
+    def add(self, symbol: str, row: Dict):
+        pass
+
+
+class ReplayDataClient:
+    """
+    回放用数据源，接口与分析器用到的 BinanceDataClient / CoinglassClient 部分一致
+    数据来自当前周期的快照行，不发任何网络请求
+    """
+
+    COLUMNS = ["oi", "global_ls_ratio", "global_short_account", "global_trend",
+               "top_ls_ratio", "top_trend", "taker_ratio"]
+
+    def __init__(self, frame: pd.DataFrame):
+        # 周期 -> {币种: 行号}，列数据转为numpy数组，逐行查询不经过pandas索引
+        self._rows_by_cycle = {}
+        for row, (cycle, symbol) in enumerate(zip(frame["cycle"].tolist(), frame["symbol"].tolist())):
+            self._rows_by_cycle.setdefault(cycle, {})[symbol] = row
+        self._columns = {name: frame[name].to_numpy() for name in self.COLUMNS}
+        self._rows = {}  # 当前周期的 {币种: 行号}
+        self.cycle_id = None  # 当前周期编号
+        self.cycle = CycleSnapshot()
+        self.snapshot_series = None
+        self.signal_series = DiscardSeries()
+        self.market_table = None
+        self.cross_oi = None
+        self.oi_history = OIHistoryBuffer()
+
+        # 每个币种的有效OI序列，用于跟踪时补写OI历史；_oi_written 为已写入的样本数
+        valid = frame.loc[frame["oi"] > 0, ["symbol", "cycle", "ts", "oi"]]
+        self._oi_series = {
+            symbol: (group["cycle"].to_numpy(), group["ts"].to_numpy(), group["oi"].to_numpy())
+            for symbol, group in valid.groupby("symbol")
+        }
+        self._oi_written = {}
+
+    def _value(self, symbol: str, column: str):
+        """当前周期某币种的字段值，无记录时返回None"""
+        row = self._rows.get(symbol)
+        return None if row is None else self._columns[column][row]
+
+    def set_cycle(self, cycle: int):
+        """切换到指定周期，同时开启新的周期快照 (与实盘每周期 start_cycle 一致)"""
+        self.cycle_id = cycle
+        self._rows = self._rows_by_cycle.get(cycle, {})
+        self.cycle = CycleSnapshot()
+
+    def sync_oi_history(self, tracked: List[str]):
+        """
+        把正在跟踪的币种截至当前周期的OI样本写入历史
+        缓冲区在整个回放中复用，每个币种只补写上次之后的新样本 (最多一个长窗口)，
+        过期的桶由缓冲区按桶号自动忽略
+        """
+        horizon = self.oi_history.window * self.oi_history.period
+        for symbol in tracked:
+            series = self._oi_series.get(symbol)
+            if series is None:
+                continue
+            cycles, timestamps, values = series
+            end = int(np.searchsorted(cycles, self.cycle_id, side="right"))
+            if end == 0:
+                continue
+            start = max(self._oi_written.get(symbol, 0),
+                        int(np.searchsorted(timestamps, timestamps[end - 1] - horizon)))
+            if start < end:
+                self.oi_history.extend(symbol, list(zip(timestamps[start:end].tolist(), values[start:end].tolist())))
+            self._oi_written[symbol] = end
+
+    def get_open_interest(self, symbol: str, cycle=None) -> Optional[float]:
+        oi = self._value(symbol, "oi")
+        if oi is None or not oi > 0:
+            return None
+        return float(oi)
+
+    def get_global_long_short_ratio(self, symbol: str, cycle=None) -> Optional[Dict]:
+        ratio = self._value(symbol, "global_ls_ratio")
+        if ratio is None or np.isnan(ratio):
+            return None
+        return {
+            "current_ratio": float(ratio),
+            "short_account": float(self._value(symbol, "global_short_account")),
+            "trend": self._value(symbol, "global_trend"),
+        }
+
+    def get_top_trader_long_short_ratio(self, symbol: str) -> Optional[Dict]:
+        ratio = self._value(symbol, "top_ls_ratio")
+        if ratio is None or np.isnan(ratio):
+            return None
+        return {"current_ratio": float(ratio), "trend": self._value(symbol, "top_trend")}
+
+    def get_taker_buy_sell_ratio(self, symbol: str) -> Optional[float]:
+        ratio = self._value(symbol, "taker_ratio")
+        if ratio is None or np.isnan(ratio):
+            return None
+        return float(ratio)
+
+
+# ==================== 回放引擎 ====================
+class ReplayEngine:
+    """按周期重放快照，复用实盘的评分、冷却和阶段跟踪逻辑"""
+
+    def __init__(self, frame: pd.DataFrame, out_dir: str = os.path.join(Config.DATA_DIR, "backtest"),
+                 interval: float = Config.SCAN_INTERVAL_SECONDS):
+        self.interval = interval
+        self.frame = compute_indicators(frame, interval)
+        self.out_dir = out_dir
+        self.current_ts = 0.0
+
+        os.makedirs(out_dir, exist_ok=True)
+        signal_file = os.path.join(out_dir, "replay_signals.jsonl")
+        if os.path.exists(signal_file):
+            os.remove(signal_file)
+
+        self.data = ReplayDataClient(self.frame)
+        self.analyzer = SqueezeSignalAnalyzer(
+            self.data, self.data,  # 主动买卖比 (实盘来自 Coinglass) 同样从快照行读取
+            notify=lambda message: True,
+            signal_store=SignalLogStore(path=signal_file),
+            clock=lambda: self.current_ts,
+        )
+
+        self.signals = []
+        self.transitions = []
+
+    def _handle_candidate(self, row):
+        """通过核心条件的行: 经实盘的 enrich_candidate 取增强指标、评分并构建信号"""
+        candidate = {
+            "symbol_data": {"symbol": row.symbol, "funding_rate": row.funding_rate},
+            "market_data": {"price": row.price, "volume_24h": row.volume_24h},
+            "current_oi": row.oi,
+            "oi_surge_ratio": row.surge,
+            "oi_change_pct": row.oi_change_pct,
+        }
+        signal_data = self.analyzer.enrich_candidate(candidate, {})
+        score = signal_data["score"]
+
+        alerted = self.analyzer.check_alert_cooldown(row.symbol, score)
+        if alerted:
+            self.analyzer.record_signal(signal_data)
+            self.analyzer.track_active_signal(row.symbol, signal_data)
+
+        self.signals.append({"index": row.Index, "ts": row.ts, "symbol": row.symbol,
+                             "score": score, "alerted": alerted})
+
+    def _update_tracking(self):
+        before = {symbol: data["phase"] for symbol, data in self.analyzer.active_tracking.items()}
+        self.data.sync_oi_history(list(before))
+        self.analyzer.update_tracking()
+        after = {symbol: data["phase"] for symbol, data in self.analyzer.active_tracking.items()}
+
+        for symbol, phase in before.items():
+            new_phase = after.get(symbol)
+            if new_phase and new_phase != phase:
+                self.transitions.append({"ts": self.current_ts, "symbol": symbol, "from": phase, "to": new_phase})
+            elif new_phase is None:
+                # 跟踪结束: 进入阶段5或超过24小时
+                self.transitions.append({"ts": self.current_ts, "symbol": symbol, "from": phase, "to": "END"})
+
+    def run(self) -> Dict[str, pd.DataFrame]:
+        started = time.time()
+        # 候选行按 (周期, 费率) 排好序一次性取出，与周期循环同步推进
+        candidates = list(self.frame[self.frame["core"]].sort_values(["cycle", "funding_rate"]).itertuples())
+        cycle_ts = self.frame.groupby("cycle")["ts"].max()
+        pos = 0
+
+        for cycle, ts in cycle_ts.items():
+            self.current_ts = float(ts)
+            self.data.set_cycle(cycle)
+
+            while pos < len(candidates) and candidates[pos].cycle == cycle:
+                self._handle_candidate(candidates[pos])
+                pos += 1
+
+            if self.analyzer.active_tracking:
+                self._update_tracking()
+
+        signals = pd.DataFrame(self.signals, columns=["index", "ts", "symbol", "score", "alerted"])
+        if not signals.empty:
+            rows = self.frame.loc[signals["index"]]
+            returns = forward_returns(rows, self.frame, interval=self.interval)
+            signals = pd.concat([signals.reset_index(drop=True), returns.reset_index(drop=True)], axis=1)
+        signals = signals.drop(columns=["index"])
+
+        transitions = pd.DataFrame(self.transitions, columns=["ts", "symbol", "from", "to"])
+        log(f"回放完成: {len(cycle_ts)} 个周期, {self.frame['symbol'].nunique()} 个币种, "
+            f"{len(signals)} 个信号, 用时 {time.time() - started:.1f}秒", "SUCCESS")
+        return {"signals": signals, "transitions": transitions}
+
+
+def summarize(signals: pd.DataFrame) -> pd.DataFrame:
+    """按信号强度汇总: 数量、平均前向收益、胜率 (前向收益>0的比例)"""
+    if signals.empty:
+        return pd.DataFrame()
+
+    alerted = signals[signals["alerted"]].copy()
+    alerted["strength"] = pd.cut(alerted["score"], [-1, 49, 69, 100], labels=["弱", "中", "强"])
+    ret_cols = [c for c in alerted.columns if c.startswith("ret_")]
+
+    grouped = alerted.groupby("strength", observed=True)
+    summary = grouped[ret_cols].mean()
+    summary.insert(0, "count", grouped.size())
+    for col in ret_cols:
+        summary[f"hit_{col[4:]}"] = grouped[col].apply(lambda r: (r.dropna() > 0).mean())
+    return summary
+
+
+# ==================== 命令行 ====================
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放记录的快照数据")
+    parser.add_argument("--start", help="开始日期 (如 2026-01-01)")
+    parser.add_argument("--end", help="结束日期 (不含)")
+    parser.add_argument("--symbols", help="只回放指定币种，逗号分隔")
+    parser.add_argument("--interval", type=float, default=Config.SCAN_INTERVAL_SECONDS, help="周期长度(秒)")
+    parser.add_argument("--funding-threshold", type=float, help="覆盖 FUNDING_RATE_THRESHOLD")
+    parser.add_argument("--oi-surge-ratio", type=float, help="覆盖 OI_SURGE_RATIO")
+    parser.add_argument("--out", default=os.path.join(Config.DATA_DIR, "backtest"), help="输出目录")
+    args = parser.parse_args()
+
+    if args.funding_threshold is not None:
+        Config.FUNDING_RATE_THRESHOLD = args.funding_threshold
+    if args.oi_surge_ratio is not None:
+        Config.OI_SURGE_RATIO = args.oi_surge_ratio
+    Config.LOG_SILENT_LEVELS = {"INFO", "DEBUG"}
+
+    symbols = args.symbols.split(",") if args.symbols else None
+    frame = load_snapshots(_parse_date(args.start), _parse_date(args.end), symbols)
+    if frame.empty:
+        log("没有可回放的快照数据 (需先以 RECORD_SNAPSHOTS=1 运行)", "ERROR")
+        return
+
+    result = ReplayEngine(frame, out_dir=args.out, interval=args.interval).run()
+    for name, df in result.items():
+        df.to_csv(os.path.join(args.out, f"{name}.csv"), index=False)
+
+    summary = summarize(result["signals"])
+    print(summary.to_string() if not summary.empty else "无信号")
+    log(f"结果已保存到 {args.out}", "SUCCESS")
+
+
+if __name__ == "__main__":
+    main()
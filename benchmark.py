@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+扫描性能基准
+在本地桩服务器上运行 SqueezeMonitor.run_scan_cycle，不需要网络。
+桩服务器返回与真实接口同格式的响应: Coinglass 费率/主动买卖比 exchange-list、
+币安 futures/data 统计接口，以及 ccxt 使用的 fapi 行情/OI 接口 (市场元数据写入 ccxt 磁盘缓存)。
+币种数量、响应延迟和错误率可配置 (错误返回503，经连接池重试)，数据由随机种子确定。
+输出每组参数的 周期/秒、每周期请求数、p50/p99 周期耗时，以及全部周期内扫描到的候选占比 (覆盖率)。
+
+说明: 第一个周期 (冷启动: OI回填、响应缓存为空) 单独列出，不计入分位数；
+跨交易所OI和流式行情在基准中关闭，Telegram 消息发往桩服务器。
+
+用法:
+    python benchmark.py --symbols 300 --budget 50 --latency 0.05 --cycles 10
+    python benchmark.py --budget 10,25,50,100 --latency 0,0.05,0.2 --error-rate 0.01
+    python benchmark.py --no-rate-limit  # 去掉限流等待，只看代码路径和网络延迟
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from squeeze_monitor import Config, SqueezeMonitor, PERIOD_SECONDS, ccxt, rate_limiter, log
+
+
+# ==================== 桩交易所 ====================
+class StubExchange:
+    """
+    固定的合约宇宙: SYM0USDT ... SYM{n-1}USDT
+    negative 比例的币种费率低于阈值，其中约三分之一的当前OI相对历史激增 (会产生信号)
+    """
+
+    def __init__(self, symbols: int = 300, negative: float = 0.3, latency: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 42):
+        rng = np.random.default_rng(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.bases = [f"SYM{i}" for i in range(symbols)]
+        self.index = {f"{base}USDT": i for i, base in enumerate(self.bases)}
+
+        negative_count = int(symbols * negative)
+        self.funding = np.where(np.arange(symbols) < negative_count,
+                                rng.uniform(-0.004, -0.0011, symbols), rng.uniform(-0.0002, 0.0003, symbols))
+        self.price = rng.uniform(0.01, 50, symbols)
+        self.volume = np.where(rng.random(symbols) < 0.9, rng.uniform(2e7, 5e8, symbols), rng.uniform(1e5, 5e6, symbols))
+        self.oi = rng.uniform(1e6, 1e8, symbols)
+        self.surge = np.where(rng.random(symbols) < 1 / 3, rng.uniform(2.0, 3.5, symbols), 1.0)
+        self.short_account = rng.uniform(0.55, 0.75, symbols)
+        self.taker = rng.uniform(0.8, 1.6, symbols)
+
+        self.requests = Counter()  # {路径: 次数}
+        self.unknown = set()  # 桩服务器未实现的路径 (接口变化时提示)
+        self._lock = threading.Lock()
+
+    @property
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def markets(self) -> List[Dict]:
+        """ccxt 市场结构 (U本位永续)，写入 load_markets_cached 的缓存文件"""
+        exchange = ccxt.binance()
+        return [exchange.safe_market_structure({
+            "id": f"{base}USDT", "symbol": f"{base}/USDT:USDT", "base": base, "quote": "USDT", "settle": "USDT",
+            "baseId": base, "quoteId": "USDT", "settleId": "USDT", "type": "swap", "subType": "linear",
+            "swap": True, "linear": True, "contract": True, "contractSize": 1, "active": True,
+            "precision": {"amount": 0.001, "price": 0.0001},
+        }) for base in self.bases]
+
+    def write_markets_cache(self, data_dir: str):
+        os.makedirs(data_dir, exist_ok=True)
+        with open(os.path.join(data_dir, "markets_binance.pkl"), 'wb') as f:
+            pickle.dump((self.markets(), {}), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # ---------- 响应 ----------
+    def funding_board(self) -> Dict:
+        now = int(time.time() * 1000)
+        data = []
+        for i, base in enumerate(self.bases):
+            rate = float(self.funding[i])
+            data.append({"symbol": base, "stablecoin_margin_list": [
+                {"exchange": "Binance", "funding_rate": rate, "funding_rate_interval": 8, "next_funding_time": now},
+                {"exchange": "OKX", "funding_rate": rate * 0.8, "funding_rate_interval": 8, "next_funding_time": now},
+                {"exchange": "Bybit", "funding_rate": rate * 1.1, "funding_rate_interval": 4, "next_funding_time": now},
+            ]})
+        return {"code": "0", "data": data}
+
+    def taker_ratio(self, base: str) -> Dict:
+        i = self.bases.index(base) if base in self.bases else 0
+        return {"code": "0", "data": [{"exchangeName": "Binance", "buyVol": float(self.taker[i]) * 1e6, "sellVol": 1e6}]}
+
+    def ticker(self, symbol: str) -> Dict:
+        i = self.index[symbol]
+        price = float(self.price[i])
+        return {
+            "symbol": symbol, "lastPrice": str(price), "openPrice": str(price * 0.95),
+            "highPrice": str(price * 1.05), "lowPrice": str(price * 0.9), "priceChange": str(price * 0.05),
+            "priceChangePercent": "5.0", "volume": str(float(self.volume[i]) / price),
+            "quoteVolume": str(float(self.volume[i])), "closeTime": int(time.time() * 1000),
+        }
+
+    def open_interest(self, symbol: str) -> Dict:
+        i = self.index[symbol]
+        return {"symbol": symbol, "openInterest": str(float(self.oi[i] * self.surge[i])),
+                "time": int(time.time() * 1000)}
+
+    def open_interest_hist(self, symbol: str, period: str, limit: int) -> List[Dict]:
+        i = self.index[symbol]
+        step = PERIOD_SECONDS.get(period, 300) * 1000
+        end = int(time.time() * 1000) // step * step
+        return [{"symbol": symbol, "sumOpenInterest": str(float(self.oi[i])),
+                 "sumOpenInterestValue": str(float(self.oi[i] * self.price[i])),
+                 "timestamp": end - (limit - k) * step} for k in range(limit)]
+
+    def long_short(self, symbol: str, limit: int, rising: bool) -> List[Dict]:
+        i = self.index[symbol]
+        short = float(self.short_account[i])
+        ratio = (1 - short) / short
+        now = int(time.time() * 1000)
+        points = []
+        for k in range(limit):
+            drift = 1 + (0.01 if rising else -0.01) * (k - limit)
+            points.append({"symbol": symbol, "longShortRatio": str(ratio * drift), "longAccount": str(1 - short),
+                           "shortAccount": str(short), "timestamp": now - (limit - k) * 300000})
+        return points
+
+    def respond(self, method: str, path: str, query: Dict[str, str]):
+        """返回 (状态码, JSON对象)"""
+        if path.endswith("/futures/funding-rate/exchange-list"):
+            return 200, self.funding_board()
+        if path.endswith("/futures/taker-buy-sell-volume/exchange-list"):
+            return 200, self.taker_ratio(query.get("symbol", ""))
+        if path.endswith("/sendMessage") and method == "POST":
+            return 200, {"ok": True, "result": {}}
+
+        symbol = query.get("symbol")
+        if symbol is not None and symbol not in self.index:
+            return 400, {"code": -1121, "msg": "Invalid symbol."}
+        limit = int(query.get("limit", 30))
+        if path == "/fapi/v1/ticker/24hr":
+            return 200, self.ticker(symbol) if symbol else [self.ticker(s) for s in self.index]
+        if path == "/fapi/v1/openInterest":
+            return 200, self.open_interest(symbol)
+        if path == "/futures/data/openInterestHist":
+            return 200, self.open_interest_hist(symbol, query.get("period", "5m"), limit)
+        if path == "/futures/data/globalLongShortAccountRatio":
+            return 200, self.long_short(symbol, limit, rising=False)
+        if path == "/futures/data/topLongShortPositionRatio":
+            return 200, self.long_short(symbol, limit, rising=True)
+        self.unknown.add(path)
+        return 404, {"code": -1, "msg": f"stub: unknown path {path}"}
+
+
+class StubServer:
+    """后台线程上的桩HTTP服务 (Coinglass、币安和Telegram共用一个端口，按路径区分)"""
+
+    def __init__(self, exchange: StubExchange, host: str = "127.0.0.1", port: int = 0):
+        stub = exchange
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 长连接，与真实接口一样复用连接池
+
+            def _handle(self, method: str):
+                parts = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+                if method == "POST":
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.requests[parts.path] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, payload = (503, {"msg": "stub: injected error"}) if stub.should_fail() \
+                    else stub.respond(method, parts.path, query)
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ==================== 基准 ====================
+def configure(stub_url: str, rate_limits: bool):
+    """把所有外部接口指向桩服务器，关闭与基准无关的组件"""
+    Config.COINGLASS_BASE_URL = f"{stub_url}/api"
+    Config.BINANCE_FAPI_URL = stub_url
+    Config.TELEGRAM_API_URL = stub_url
+    Config.TELEGRAM_TOKEN = "bench"
+    Config.STREAM_MODE = "off"
+    Config.METRICS_PORT = 0
+    Config.PROXY = ""
+    if not rate_limits:
+        rate_limiter.buckets.clear()
+
+
+@contextmanager
+def data_paths(root: str):
+    """把监控器的数据目录、时序存储、检查点和信号日志指向 root，退出时恢复原配置"""
+    paths = {
+        "DATA_DIR": os.path.join(root, "data"),
+        "TIMESERIES_DIR": os.path.join(root, "data", "series"),
+        "CHECKPOINT_FILE": os.path.join(root, "data", "state.pkl"),
+        "SIGNALS_LOG_FILE": os.path.join(root, "signals_log.jsonl"),
+        "LEGACY_SIGNALS_LOG_FILE": os.path.join(root, "signals_log.json"),
+    }
+    saved = {name: getattr(Config, name) for name in paths}
+    for name, path in paths.items():
+        setattr(Config, name, path)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(Config, name, value)
+
+
+def run_case(stub: StubExchange, budget: int, cycles: int) -> Dict:
+    """在全新的临时数据目录中创建监控器，连续执行 cycles 个扫描周期 (结束后删除目录)"""
+    Config.SCAN_REQUEST_BUDGET = budget
+    with tempfile.TemporaryDirectory(prefix="squeeze-bench-") as root, data_paths(root):
+        stub.write_markets_cache(Config.DATA_DIR)
+        monitor = SqueezeMonitor()
+        monitor.binance.cross_oi.clients.clear()  # 跨交易所OI不经过桩服务器
+
+        durations, requests = [], []
+        for _ in range(cycles):
+            before = stub.total_requests
+            started = time.perf_counter()
+            monitor.run_scan_cycle()
+            durations.append(time.perf_counter() - started)
+            requests.append(stub.total_requests - before)
+
+    warm = np.array(durations[1:] or durations)
+    candidates = monitor.pipeline.counts.get("bulk", 0)
+    return {
+        "budget": budget,
+        "latency": stub.latency,
+        "error_rate": stub.error_rate,
+        "cold_s": durations[0],
+        "cold_requests": requests[0],
+        "cycles_per_s": len(warm) / warm.sum() if warm.sum() > 0 else float("inf"),
+        "requests_per_cycle": float(np.mean(requests[1:] or requests)),
+        "p50_s": float(np.percentile(warm, 50)),
+        "p99_s": float(np.percentile(warm, 99)),
+        "signals": monitor.total_signals_found,
+        "coverage": len(monitor.pipeline.planner.seen) / candidates if candidates else 1.0,
+    }
+
+
+def _floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描周期性能基准 (本地桩服务器，无需网络)")
+    parser.add_argument("--symbols", type=int, default=300, help="桩服务器上的合约数量")
+    parser.add_argument("--negative", type=float, default=0.3, help="负费率币种比例")
+    parser.add_argument("--budget", default="50", help="SCAN_REQUEST_BUDGET，逗号分隔多个值")
+    parser.add_argument("--latency", default="0", help="每个响应的延迟(秒)，逗号分隔多个值")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回503的请求比例")
+    parser.add_argument("--cycles", type=int, default=5, help="每组参数的扫描周期数 (含冷启动周期)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-rate-limit", action="store_true", help="关闭全局限流器")
+    parser.add_argument("--verbose", action="store_true", help="输出监控器日志")
+    parser.add_argument("--out", help="结果另存为JSON文件")
+    args = parser.parse_args()
+    out = args.out
+
+    if not args.verbose:
+        Config.LOG_SILENT_LEVELS = {"INFO", "DEBUG", "CYCLE", "STATS", "ALERT", "SUCCESS", "WARN"}
+
+    results = []
+    for latency in _floats(args.latency):
+        stub = StubExchange(args.symbols, args.negative, latency, args.error_rate, args.seed)
+        server = StubServer(stub)
+        server.start()
+        configure(server.url, rate_limits=not args.no_rate_limit)
+        try:
+            for budget in _floats(args.budget):
+                results.append(run_case(stub, int(budget), args.cycles))
+        finally:
+            server.stop()
+        if stub.unknown:
+            log(f"桩服务器未实现的接口: {sorted(stub.unknown)}", "ERROR")
+
+    header = (f"{'budget':>6} {'latency':>8} {'err':>5} {'cold_s':>8} {'cold_req':>8} {'cyc/s':>8} {'req/cyc':>8} "
+              f"{'p50_s':>8} {'p99_s':>8} {'signals':>7} {'cover':>6}")
+    print(header)
+    for r in results:
+        print(f"{r['budget']:>6} {r['latency']:>8.3f} {r['error_rate']:>5.2f} {r['cold_s']:>8.2f} "
+              f"{r['cold_requests']:>8} {r['cycles_per_s']:>8.2f} {r['requests_per_cycle']:>8.1f} "
+              f"{r['p50_s']:>8.3f} {r['p99_s']:>8.3f} {r['signals']:>7} {r['coverage']:>6.0%}")
+
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+评分参数网格搜索
+在记录的历史快照上评估一组阈值/权重组合，输出每个组合的信号数、平均前向收益和胜率。
+评分与 SqueezeSignalAnalyzer.calculate_signal_score 使用同一套 Config 区间定义，
+但用 NumPy 矩阵运算一次算出一批组合的分数 (行=样本, 列=组合)，组合分块后由进程池并行计算。
+
+说明: 不模拟警报冷却，每个满足条件的周期都计为一个信号；需要精确复现冷却/跟踪时用 backtest.py。
+
+用法:
+    python param_sweep.py --start 2026-01-01 --end 2026-02-01 --workers 8
+    python param_sweep.py --grid grid.json --sort ret_4h
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from squeeze_monitor import Config, log
+from backtest import load_snapshots, compute_indicators, forward_returns, FORWARD_HORIZONS
+
+# 默认搜索网格 (可用 --grid 指定JSON文件覆盖，键相同)
+DEFAULT_GRID = {
+    "funding_threshold": [-0.0005, -0.001, -0.0015, -0.002],  # 核心条件: 费率低于
+    "oi_surge_ratio": [1.1, 1.5, 2.0, 2.5],  # 核心条件: OI激增比高于
+    "min_score": [0, 30, 50, 70],  # 只统计评分不低于此值的信号
+    "funding_band_scale": [0.75, 1.0, 1.25],  # 费率评分区间阈值整体缩放
+    "oi_band_scale": [0.75, 1.0, 1.25],  # OI激增评分区间阈值整体缩放
+    "w_funding_rate": [30, 40, 50],
+    "w_oi_surge": [20, 30, 40],
+    "w_global_short": [10, 15],
+    "w_top_trader": [5, 10],
+    "w_taker_ratio": [5],
+}
+
+WEIGHT_KEYS = ["funding_rate", "oi_surge", "global_short", "top_trader", "taker_ratio"]
+
+
+# ==================== 向量化评分 ====================
+def band_fraction(values: np.ndarray, bands, below: bool) -> np.ndarray:
+    """向量化的区间命中: 返回每个样本的得分比例 (与 _band_fraction 语义一致)"""
+    conditions = [(values < t) if below else (values > t) for t, _ in bands]
+    return np.select(conditions, [f for _, f in bands], default=0.0)
+
+
+def component_fractions(samples: Dict[str, np.ndarray], funding_scale: float, oi_scale: float) -> np.ndarray:
+    """
+    计算五个评分分量的得分比例矩阵 (样本数 × 5)
+    费率/OI区间阈值按 scale 缩放，其余分量与实盘规则相同
+    """
+    funding_bands = [(t * funding_scale, f) for t, f in Config.FUNDING_SCORE_BANDS]
+    oi_bands = [(t * oi_scale, f) for t, f in Config.OI_SURGE_SCORE_BANDS]
+
+    funding = band_fraction(samples["funding_rate"], funding_bands, below=True)
+    oi = band_fraction(samples["surge"], oi_bands, below=False)
+
+    short = np.nan_to_num(samples["global_short_account"], nan=0.0)
+    global_short = np.where(short > Config.GLOBAL_SHORT_THRESHOLD,
+                            band_fraction(short, Config.GLOBAL_SHORT_SCORE_BANDS, below=False), 0.0)
+
+    top = np.where(samples["top_present"],
+                   np.where(samples["top_up"], Config.TOP_TRADER_SCORE["up"], Config.TOP_TRADER_SCORE["data"]), 0.0)
+
+    taker_values = np.nan_to_num(samples["taker_ratio"], nan=0.0)
+    taker = np.select([taker_values > Config.TAKER_BUY_THRESHOLD, taker_values > 1.0],
+                      [Config.TAKER_SCORE["strong"], Config.TAKER_SCORE["buy"]], default=0.0)
+
+    return np.column_stack([funding, oi, global_short, top, taker])
+
+
+# ==================== 进程池 ====================
+_SAMPLES = None  # 工作进程中的样本数组 (初始化时传入一次，避免每个任务重复序列化)
+
+
+def _init_worker(samples: Dict[str, np.ndarray]):
+    global _SAMPLES
+    _SAMPLES = samples
+
+
+def evaluate_chunk(configs: List[Dict]) -> List[Dict]:
+    """评估一批组合 (同一批内 band_scale 相同，共享分量矩阵)"""
+    samples = _SAMPLES
+    fractions = component_fractions(samples, configs[0]["funding_band_scale"], configs[0]["oi_band_scale"])
+
+    weights = np.array([[c[f"w_{key}"] for key in WEIGHT_KEYS] for c in configs], dtype=np.float64)
+    # 与实盘一致: 每个分量单独四舍五入后求和，上限100 (逐分量累加，避免三维中间数组)
+    scores = np.zeros((fractions.shape[0], len(configs)))
+    for j in range(len(WEIGHT_KEYS)):
+        scores += np.rint(fractions[:, j, None] * weights[None, :, j])
+    scores = np.minimum(scores, 100)
+
+    funding_thr = np.array([c["funding_threshold"] for c in configs])
+    surge_thr = np.array([c["oi_surge_ratio"] for c in configs])
+    min_score = np.array([c["min_score"] for c in configs])
+
+    mask = (
+        (samples["funding_rate"][:, None] < funding_thr[None, :])
+        & (samples["surge"][:, None] > surge_thr[None, :])
+        & (scores >= min_score[None, :])
+    )
+
+    results = []
+    counts = mask.sum(axis=0)
+    metrics = {"signals": counts}
+    for name in FORWARD_HORIZONS:
+        returns = samples[f"ret_{name}"]
+        valid = mask & ~np.isnan(returns)[:, None]
+        filled = np.nan_to_num(returns, nan=0.0)[:, None]
+        n = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            metrics[f"ret_{name}"] = (valid * filled).sum(axis=0) / n
+            metrics[f"hit_{name}"] = (valid & (filled > 0)).sum(axis=0) / n
+
+    for i, config in enumerate(configs):
+        row = dict(config)
+        row.update({key: float(values[i]) for key, values in metrics.items()})
+        row["signals"] = int(counts[i])
+        results.append(row)
+    return results
+
+
+# ==================== 主流程 ====================
+def build_samples(frame: pd.DataFrame, grid: Dict[str, List], interval: float) -> Dict[str, np.ndarray]:
+    """
+    预计算样本: 只保留在最宽松的核心条件下可能成为信号的行，
+    并附上各窗口的前向收益
+    """
+    frame = compute_indicators(frame, interval)
+    candidates = frame[
+        (frame["funding_rate"] < max(grid["funding_threshold"]))
+        & (frame["surge"] > min(grid["oi_surge_ratio"]))
+        & (frame["volume_24h"] >= Config.MIN_VOLUME_USD)
+        & (frame["oi"] > 0)
+    ]
+    returns = forward_returns(candidates, frame, interval=interval)
+
+    samples = {
+        "funding_rate": candidates["funding_rate"].to_numpy(np.float64),
+        "surge": candidates["surge"].to_numpy(np.float64),
+        "global_short_account": candidates["global_short_account"].to_numpy(np.float64),
+        "taker_ratio": candidates["taker_ratio"].to_numpy(np.float64),
+        "top_present": candidates["top_ls_ratio"].notna().to_numpy(),
+        "top_up": (candidates["top_trend"] == "上升").to_numpy(),
+    }
+    for column in returns.columns:
+        samples[column] = returns[column].to_numpy(np.float64)
+    return samples
+
+
+def iter_chunks(grid: Dict[str, List], chunk_size: int):
+    """按 (funding_band_scale, oi_band_scale) 分组后切块，保证块内分量矩阵可以共享"""
+    keys = list(grid)
+    other_keys = [k for k in keys if k not in ("funding_band_scale", "oi_band_scale")]
+    for funding_scale, oi_scale in itertools.product(grid["funding_band_scale"], grid["oi_band_scale"]):
+        chunk = []
+        for values in itertools.product(*(grid[k] for k in other_keys)):
+            config = dict(zip(other_keys, values), funding_band_scale=funding_scale, oi_band_scale=oi_scale)
+            chunk.append(config)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def run_sweep(samples: Dict[str, np.ndarray], grid: Dict[str, List],
+              workers: int = os.cpu_count() or 1, chunk_size: int = 64) -> pd.DataFrame:
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(samples,)) as executor:
+        for chunk_result in executor.map(evaluate_chunk, iter_chunks(grid, chunk_size)):
+            results.extend(chunk_result)
+    return pd.DataFrame(results)
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评分阈值/权重网格搜索")
+    parser.add_argument("--start", help="开始日期 (如 2026-01-01)")
+    parser.add_argument("--end", help="结束日期 (不含)")
+    parser.add_argument("--grid", help="网格定义JSON文件 (键同 DEFAULT_GRID)")
+    parser.add_argument("--interval", type=float, default=Config.SCAN_INTERVAL_SECONDS, help="周期长度(秒)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--min-signals", type=int, default=20, help="信号数少于此值的组合不参与排名")
+    parser.add_argument("--sort", default="ret_4h", help="排序指标")
+    parser.add_argument("--out", default=os.path.join(Config.DATA_DIR, "backtest", "sweep.csv"))
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        with open(args.grid, 'r', encoding='utf-8') as f:
+            grid.update(json.load(f))
+    total = int(np.prod([len(v) for v in grid.values()]))
+
+    started = time.time()
+    frame = load_snapshots(_parse_date(args.start), _parse_date(args.end))
+    if frame.empty:
+        log("没有快照数据 (需先以 RECORD_SNAPSHOTS=1 运行)", "ERROR")
+        return
+
+    samples = build_samples(frame, grid, args.interval)
+    log(f"样本: {len(samples['surge'])} 行 (原始 {len(frame)} 行), 组合: {total} 个", "INFO")
+
+    results = run_sweep(samples, grid, workers=args.workers)
+    ranked = results[results["signals"] >= args.min_signals].sort_values(args.sort, ascending=False)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    ranked.to_csv(args.out, index=False)
+    print(ranked.head(20).to_string(index=False))
+    log(f"完成 {total} 个组合, 用时 {time.time() - started:.1f}秒, 结果: {args.out}", "SUCCESS")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,14 +14,56 @@ os.makedirs("logs", exist_ok=True)  # 如果需要日志目录
 
 import time
 import json
-import csv
+import re
+import bisect
+import random
+import pickle
+import signal
 import os
+import threading
+import queue
+import importlib
+import hashlib
+import socket
+import heapq
+import itertools
+import multiprocessing
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote
 from datetime import datetime, timedelta
-from collections import deque, defaultdict
+from collections import deque, defaultdict, OrderedDict
 import requests
-import ccxt
-import pandas as pd
-from typing import Dict, List, Optional, Tuple, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import MaxRetryError
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Any, Callable, Iterable, Iterator
+
+class LazyModule:
+    """延迟导入的模块代理: 首次访问属性时才真正导入 (ccxt + pandas 导入约需1秒)"""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+ccxt = LazyModule("ccxt")
+pd = LazyModule("pandas")  # 只有 read_frame 用到
+
+try:
+    import websocket  # websocket-client，可选: STREAM_MODE=binance 时使用
+except ImportError:
+    websocket = None
 
 # ==================== 配置类 (原config.py内容) ====================
 class Config:
@@ -34,13 +76,26 @@ class Config:
     # Telegram通知
     TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN", "8536935536:AAEm1rqdJ-Eo_Urd6-ISnlEYHgNF31M9Tf4")
     TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID", "838429342")
+    TELEGRAM_QUEUE_SIZE = 200  # 发送队列上限，满了丢弃并告警
+    TELEGRAM_BATCH_WINDOW = 2.0  # 合并窗口(秒)，窗口内的多条消息合并发送
+    TELEGRAM_MAX_LENGTH = 4000  # 单条消息长度上限 (Telegram限制4096)
+    TELEGRAM_MAX_RETRIES = 4
+    TELEGRAM_RETRY_BACKOFF = 2.0  # 重试退避基数(秒)，指数增长
     
     # 策略核心
     FUNDING_RATE_THRESHOLD = -0.0005  # -0.1%
     OI_SURGE_RATIO = 1.1
-    OI_SHORT_WINDOW = 3
-    OI_LONG_WINDOW = 10
+    OI_SAMPLE_SECONDS = 60  # OI历史按墙钟时间分桶的桶长(秒)，与默认扫描间隔一致
+    OI_SHORT_WINDOW = 3  # 短窗口桶数 (3分钟，即默认间隔下的近3次扫描)
+    OI_LONG_WINDOW = 10  # 长窗口桶数 (10分钟，即默认间隔下的近10次扫描)
+    OI_BACKFILL_PERIOD = "5m"  # 回填用的 openInterestHist period (该接口最短5m)，采样点之间按阶梯保持写入各桶
+    OI_MIN_COVERAGE = 0.7  # 长窗口内有数据的桶占比低于此值时不计算激增比
+    OI_PEAK_WINDOW = 5  # 阶段5: 最近N个桶内OI的峰值
+    OI_BACKFILL_RETRY = 600  # 历史OI回填失败后，同一币种的重试间隔(秒)
     SCAN_INTERVAL_SECONDS = 60  # 5分钟
+    # 跟踪任务间隔: 只轮询跟踪中的币种；默认与扫描间隔相同 (每次扫描后重新计时，扫描正常时不额外发请求)
+    TRACKING_INTERVAL_SECONDS = int(os.environ.get("TRACKING_INTERVAL_SECONDS", SCAN_INTERVAL_SECONDS))
+    SCHEDULER_JITTER = 0.1  # 调度抖动，占间隔的比例 (±)
     
     # 多空比
     GLOBAL_LS_PERIOD = "1h"
@@ -54,15 +109,107 @@ class Config:
     
     # 过滤参数
     MIN_VOLUME_USD = 1000000
-    MAX_SYMBOLS_TO_ANALYZE = 50
+    
+    # 自适应扫描: 全部负费率币种按优先级排期，每周期的逐币种请求不超过预算，未选上的尾部逐周期轮转
+    # 预算包含: 跟踪更新的OI/多空比、OI与历史回填、按通过率估算的增强请求 (不含费率列表和批量行情两次固定请求)
+    SCAN_REQUEST_BUDGET = int(os.environ.get("SCAN_REQUEST_BUDGET", "50"))  # 每周期逐币种请求预算
+    SCAN_PASS_RATE_PRIOR = 0.5  # 还没有统计时假设的核心条件通过率
+    SCAN_PASS_RATE_ALPHA = 0.3  # 核心条件通过率的指数平滑系数
+    SCAN_PRIORITY_WEIGHTS = {"funding": 1.0, "surge": 1.0, "staleness": 1.0}  # 优先级各项权重
+    SCAN_PRIORITY_CAP = 10.0  # 每项上限: 避免极端费率长期独占预算；从未扫描的币种陈旧度按上限计
+    
+    # 分级筛选: 批量初筛 -> 并发取OI -> 只为最强的幸存者获取增强指标
+    SCREEN_CHUNK_SIZE = 256  # 批量初筛每块的币种数 (内存占用只与块大小有关)
+    MAX_ENRICH_PER_CYCLE = int(os.environ.get("MAX_ENRICH_PER_CYCLE", "20"))  # 每周期最多获取增强指标的币种数
+    
+    # 并发扫描
+    SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", "8"))  # 并发分析线程数，1为串行
+    
+    # 限流 (令牌桶，所有线程共享): {桶名: (每秒补充令牌数, 桶容量)}
+    # 币安按权重计数，同一个桶内不同接口按各自权重扣减
+    RATE_LIMITS = {
+        "coinglass": (0.5, 5),  # 初级会员 30次/分钟
+        "binance": (30.0, 300),  # fapi 2400权重/分钟，留25%余量
+        "binance_data": (3.0, 20),  # /futures/data/* 1000次/5分钟
+        "telegram": (1.0, 20),  # 同一聊天约1条/秒
+        "bybit": (10.0, 50),  # 公共接口 600次/5秒/IP，远低于上限
+        "okx": (5.0, 10),  # open-interest 20次/2秒
+    }
+    RATE_LIMIT_BAN_BACKOFF = 60  # 收到418/429且没有Retry-After时暂停的秒数
+    
+    # 比率类接口的响应缓存: 按接口 period 对齐过期 (多空比/买卖比每个周期才更新一次)
+    RESPONSE_CACHE_SIZE = 2000  # 每个接口最多缓存的币种数 (LRU)
+    RESPONSE_CACHE_GRACE = 30  # 周期边界后等上游出新数据的秒数
+    
+    # 多交易所: Coinglass exchange-list 一次返回各交易所费率，全部解析用于跨交易所聚合
+    FUNDING_EXCHANGES = ["binance", "okx", "bybit", "bitget", "gate", "hyperliquid"]
+    # 信号币种额外查询OI的交易所 (ccxt交易所id，逗号分隔，如 bybit,okx)；默认关闭: 每个候选会多出对这些交易所的请求
+    CROSS_OI_EXCHANGES = [x for x in os.environ.get("CROSS_OI_EXCHANGES", "").split(",") if x]
+    
+    # 流式行情 (币安合约 WebSocket 合并流): off=关闭 / binance=实盘
+    STREAM_MODE = os.environ.get("STREAM_MODE", "off")
+    BINANCE_STREAM_URL = "wss://fstream.binance.com/stream"
+    STREAM_CHANNELS = ["!markPrice@arr@1s", "!ticker@arr"]
+    STREAM_STALE_SECONDS = 30  # 超过此时间没有消息视为断流，回退REST
+    STREAM_RECONNECT_BACKOFF = 1.0  # 重连退避基数(秒)，指数增长
+    STREAM_RECONNECT_MAX = 60
+    
+    # 阶段3: 价格突破 (需要流式行情)
+    BREAKOUT_LOOKBACK_SECONDS = 3600  # 区间高点的回看窗口
+    BREAKOUT_MIN_PCT = 0.02  # 最新价高于区间高点的比例
+    
+    # 事件驱动评估 (需要流式行情): 费率/价格/OI相对上次评估变化超过阈值时立即重评该币种
+    EVENT_DRIVEN = os.environ.get("EVENT_DRIVEN", "1") == "1"
+    EVENT_DEBOUNCE_SECONDS = 3.0  # 防抖: 同一币种窗口内的多次变化合并为一次评估
+    EVENT_FUNDING_DELTA = 0.0002  # 费率绝对变化
+    EVENT_PRICE_DELTA = 0.01  # 价格相对变化
+    EVENT_OI_DELTA = 0.02  # OI相对变化
+    EVENT_ENHANCED_TTL = 300  # 事件评估复用增强指标 (多空比/买卖比) 的最长时间(秒)
+    
     DATA_DIR = "data"
-    OI_HISTORY_FILE = "oi_history.json"
-    SIGNALS_LOG_FILE = "signals_log.json"
+    TIMESERIES_DIR = os.path.join(DATA_DIR, "series")  # 定长二进制时序数据 (按数据集/日期/币种分区)
+    
+    # 记录模式: 每周期为所有候选币种保存完整抓取状态 (用于调参和回放)
+    RECORD_SNAPSHOTS = os.environ.get("RECORD_SNAPSHOTS", "0") == "1"
+    SNAPSHOT_RETENTION_DAYS = int(os.environ.get("SNAPSHOT_RETENTION_DAYS", "30"))
+    SNAPSHOT_MAX_MB = int(os.environ.get("SNAPSHOT_MAX_MB", "1024"))  # 超过后从最早的日期分区开始删除
+    CHECKPOINT_FILE = os.path.join(DATA_DIR, "state.pkl")  # 冷却/跟踪/OI历史/响应缓存的检查点
+    CHECKPOINT_INTERVAL_SECONDS = 60
+    CHECKPOINT_MAX_AGE = 6 * 3600  # 超过此时长的检查点视为过期，按冷启动处理
+    MARKETS_CACHE_TTL = 24 * 3600  # ccxt 市场元数据磁盘缓存 (data/markets_{交易所}.pkl) 有效期
+    
+    # 分片部署: SHARD_COUNT>1 时由协调进程启动 N 个工作进程，按一致性哈希分配负费率币种
+    SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+    SHARD_PROXIES = [p.strip() for p in os.environ.get("SHARD_PROXIES", "").split(",") if p.strip()]  # 第i个工作进程用第 i % len 个代理
+    SHARD_RING_REPLICAS = 100  # 每个分片在哈希环上的虚拟节点数
+    COORDINATOR_HOST = "127.0.0.1"  # 协调进程IPC监听地址 (端口自动分配)
+    
+    # 快速启动 (可选): API连通性测试与首次扫描并行，测试失败只告警不退出；默认先测试、失败即退出
+    FAST_START = os.environ.get("FAST_START", "0") == "1"
+    SIGNALS_LOG_FILE = "signals_log.jsonl"  # JSON Lines，每条信号追加一行
+    LEGACY_SIGNALS_LOG_FILE = "signals_log.json"  # 旧格式，启动时自动迁移
+    SIGNALS_LOG_TAIL = 200  # 内存中保留的最近信号条数
+    SIGNALS_LOG_MAX_RECORDS = 100000  # 超过后压缩，只保留最近的记录
+    LOG_SILENT_LEVELS = set()  # 不输出的日志级别 (回放等批量场景使用)
+    
+    # HTTP连接池 (币安原始REST接口和Telegram共用，保持长连接)
+    PROXY = os.environ.get("PROXY", "")
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "20"))  # 每个主机的最大连接数
+    HTTP_MAX_RETRIES = 2  # 连接错误/5xx自动重试次数 (仅GET)
+    HTTP_RETRY_BACKOFF = 0.5
+    BINANCE_FAPI_URL = "https://fapi.binance.com"
+    TELEGRAM_API_URL = "https://api.telegram.org"
+    
+    # 运行指标: Prometheus 文本格式 http://METRICS_HOST:METRICS_PORT/metrics (端口为0时关闭)
+    METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+    METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # 延迟直方图上界(秒)
+    SUMMARY_INTERVAL_SECONDS = int(os.environ.get("SUMMARY_INTERVAL_SECONDS", "300"))  # 运行摘要输出间隔
     
     # 币安配置
     BINANCE_CONFIG = {
-        'enableRateLimit': True,
-        'options': {'defaultType': 'future'},
+        'enableRateLimit': False,  # 由全局 rate_limiter 统一限流
+        'options': {'defaultType': 'future', 'fetchMarkets': {'types': ['linear']}},  # 只加载U本位合约
         'timeout': 15000,
         'rateLimit': 1200,
     }
@@ -75,42 +222,635 @@ class Config:
         'top_trader': 10,
         'taker_ratio': 5,
     }
-
-print("=" * 60)
-print("🔥 轧空监控机器人启动")
-print(f"🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 60)
-
-print("=" * 70)
-print("🔥 山寨币轧空监控机器人 - 完整逻辑版")
-print("📊 策略: 严格遵循原文五阶段逻辑链条")
-print(f"🕐 启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 70)
+    
+    # 评分区间: [(阈值, 得分比例), ...] 从强到弱，命中第一个区间即得 权重×比例 分
+    FUNDING_SCORE_BANDS = [(-0.003, 1.0), (-0.002, 0.75), (-0.0015, 0.5), (-0.001, 0.25)]  # 费率低于阈值
+    OI_SURGE_SCORE_BANDS = [(3.0, 1.0), (2.5, 5 / 6), (2.0, 2 / 3), (1.5, 1 / 3)]  # 激增比高于阈值
+    GLOBAL_SHORT_SCORE_BANDS = [(0.70, 1.0), (0.65, 2 / 3), (0.60, 1 / 3)]  # 散户空头占比高于阈值
+    TOP_TRADER_SCORE = {"up": 1.0, "data": 0.5}  # 大户多空比趋势上升 / 仅有数据
+    TAKER_SCORE = {"strong": 1.0, "buy": 0.6}  # 主动买盘比 > TAKER_BUY_THRESHOLD / > 1.0
 
 # ==================== 工具函数 ====================
+# 币安统计接口的 period 参数对应的秒数
+PERIOD_SECONDS = {
+    "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200,
+    "4h": 14400, "6h": 21600, "12h": 43200, "1d": 86400,
+}
+
 def log(msg: str, level: str = "INFO"):
     """统一日志格式"""
+    if level in Config.LOG_SILENT_LEVELS:
+        return
     timestamp = datetime.now().strftime('%H:%M:%S')
     print(f"[{timestamp}] [{level}] {msg}")
 
-def send_telegram(message: str):
-    """发送Telegram通知"""
-    if not Config.TELEGRAM_TOKEN or not Config.TELEGRAM_CHAT_ID:
-        return False
+class Histogram:
+    """累积分桶直方图 (Prometheus 语义: 上界 le 统计 <= le 的样本数，最后一桶为 +Inf)"""
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> float:
+        """按分桶估算分位数: 返回所在桶的上界 (落在 +Inf 桶时返回最大上界)"""
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.bounds[-1]
+
+class Metrics:
+    """
+    进程内运行指标: 计数器、仪表和直方图，按 (指标名, 标签) 区分
+    HTTP请求由 InstrumentedAdapter 自动记录，各阶段耗时用 stage() 记录
+    """
+    
+    def __init__(self, buckets: Tuple[float, ...] = Config.METRICS_BUCKETS, prefix: str = "squeeze"):
+        self.buckets = buckets
+        self.prefix = prefix
+        self.counters = defaultdict(float)  # {(name, labels): value}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted(labels.items()))
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self.counters[self._key(name, labels)] += value
+    
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+    
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+    
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个阶段的耗时 (discovery/analysis/tracking/persistence/event)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=name)
+    
+    def by_label(self, name: str, label: str) -> Dict[str, Histogram]:
+        """某个直方图指标按单个标签展开: {标签值: 直方图}"""
+        with self._lock:
+            return {dict(labels)[label]: histogram for (metric, labels), histogram in self.histograms.items()
+                    if metric == name}
+    
+    def counter_total(self, name: str, **labels) -> float:
+        """对计数器求和 (只匹配给出的标签)"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(value for (metric, keys), value in self.counters.items()
+                       if metric == name and wanted <= set(keys))
+    
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+        
+        lines = []
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({metric for metric, _ in series}):
+                    lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                    for (metric, labels), value in sorted(series.items()):
+                        if metric == name:
+                            lines.append(f"{self.prefix}_{name}{fmt(labels)} {value:g}")
+            
+            for name in sorted({metric for metric, _ in self.histograms}):
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip((*histogram.bounds, "+Inf"), histogram.counts):
+                        cumulative += n
+                        lines.append(f"{self.prefix}_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{self.prefix}_{name}_sum{fmt(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{self.prefix}_{name}_count{fmt(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+    
+    def summary_lines(self) -> List[str]:
+        """运行摘要: 各接口请求数/延迟分位/错误/重试，各阶段耗时"""
+        lines = []
+        for endpoint, h in sorted(self.by_label("http_request_seconds", "endpoint").items()):
+            errors = self.counter_total("http_errors_total", endpoint=endpoint)
+            retries = self.counter_total("http_retries_total", endpoint=endpoint)
+            lines.append(f"{endpoint}: {h.count}次 均值{h.sum / h.count:.2f}s p50≤{h.quantile(0.5):g}s "
+                         f"p95≤{h.quantile(0.95):g}s 错误{errors:.0f} 重试{retries:.0f}")
+        for bucket, h in sorted(self.by_label("ratelimit_wait_seconds", "bucket").items()):
+            lines.append(f"限流等待 {bucket}: {h.count}次 共{h.sum:.1f}s")
+        for stage, h in sorted(self.by_label("stage_seconds", "stage").items()):
+            lines.append(f"阶段 {stage}: {h.count}次 均值{h.sum / h.count:.2f}s p95≤{h.quantile(0.95):g}s")
+        return lines
+
+# 全局指标
+metrics = Metrics()
+
+class TokenBucket:
+    """线程安全的令牌桶"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self, weight: float = 1) -> float:
+        """阻塞直到拿到足够令牌，返回等待的秒数"""
+        weight = min(weight, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= weight:
+                    self.tokens -= weight
+                    return waited
+                else:
+                    wait = (weight - self.tokens) / self.rate
+            
+            time.sleep(wait)
+            waited += wait
+    
+    def scale(self, factor: float):
+        """按比例缩放速率和容量 (多个进程分摊同一份限额)"""
+        with self._lock:
+            self.rate *= factor
+            self.capacity = max(1.0, self.capacity * factor)
+            self.tokens = min(self.tokens, self.capacity)
+    
+    def penalize(self, seconds: float):
+        """被限流/封禁后暂停整个桶，并清空令牌"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class RateLimiter:
+    """按主机/权重类别划分的令牌桶集合，所有客户端发请求前先 acquire"""
+    
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self.buckets = {name: TokenBucket(rate, capacity) for name, (rate, capacity) in limits.items()}
     
+    def acquire(self, name: str, weight: float = 1) -> float:
+        bucket = self.buckets.get(name)
+        waited = bucket.acquire(weight) if bucket else 0.0
+        if waited > 0:
+            metrics.observe("ratelimit_wait_seconds", waited, bucket=name)
+        return waited
+    
+    def penalize(self, name: str, seconds: Optional[float] = None):
+        bucket = self.buckets.get(name)
+        if bucket:
+            seconds = seconds or Config.RATE_LIMIT_BAN_BACKOFF
+            bucket.penalize(seconds)
+            log(f"限流: {name} 暂停 {seconds:.0f} 秒", "WARN")
+    
+    def check_response(self, name: str, response) -> bool:
+        """检查HTTP响应，418/429时按Retry-After暂停该桶。返回是否被限流"""
+        if response.status_code not in (418, 429):
+            return False
+        
+        try:
+            retry_after = float(response.headers.get("Retry-After", 0))
+        except (TypeError, ValueError):
+            retry_after = 0
+        self.penalize(name, retry_after or None)
+        return True
+
+# 全局限流器
+rate_limiter = RateLimiter(Config.RATE_LIMITS)
+
+def endpoint_label(url: str) -> str:
+    """指标用的接口名: 主机+路径 (不含查询参数)，Telegram 路径中的 bot token 隐去"""
+    parts = urlsplit(url)
+    return f"{parts.hostname}{re.sub(r'/bot[^/]+', '/bot*', parts.path)}"
+
+class InstrumentedAdapter(HTTPAdapter):
+    """记录经过此适配器的每个请求的耗时、状态码、重试次数和失败 (ccxt 和 Telegram 也共用会话)"""
+    
+    def send(self, request, **kwargs):
+        endpoint = endpoint_label(request.url)
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            metrics.inc("http_errors_total", endpoint=endpoint)
+            if e.args and isinstance(e.args[0], MaxRetryError) and self.max_retries.total:
+                metrics.inc("http_retries_total", self.max_retries.total, endpoint=endpoint)  # 重试已用尽
+            raise
+        finally:
+            metrics.observe("http_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+        
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            metrics.inc("http_retries_total", len(retries.history), endpoint=endpoint)
+        metrics.inc("http_requests_total", endpoint=endpoint, status=str(response.status_code))
+        if response.status_code >= 400:
+            metrics.inc("http_errors_total", endpoint=endpoint)
+        return response
+
+class MetricsServer:
+    """指标端点: 后台线程上的 HTTP 服务，GET /metrics 返回 Prometheus 文本格式"""
+    
+    def __init__(self, registry: Metrics, host: str = Config.METRICS_HOST, port: int = Config.METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+    
+    def start(self) -> bool:
+        registry = self.registry
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if urlsplit(self.path).path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            log(f"指标端点启动失败 {self.host}:{self.port}: {e}", "WARN")
+            return False
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+        log(f"指标端点: http://{self.host}:{self.port}/metrics", "INFO")
+        return True
+    
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+def create_http_session(pool_size: int = Config.HTTP_POOL_SIZE) -> requests.Session:
+    """
+    创建带连接池的HTTP会话
+    复用TCP+TLS连接 (经代理时握手开销很大)，连接错误和5xx自动重试，
+    429/418不在此重试，交给 rate_limiter 处理
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=Config.HTTP_MAX_RETRIES,
+        backoff_factor=Config.HTTP_RETRY_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+    )
+    adapter = InstrumentedAdapter(pool_connections=10, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    
+    if Config.PROXY:
+        session.proxies = {"http": Config.PROXY, "https": Config.PROXY}
+    return session
+
+def load_markets_cached(exchange, ttl: float = Config.MARKETS_CACHE_TTL) -> int:
+    """
+    加载ccxt交易所的市场元数据: 缓存文件未过期时直接读盘，否则请求交易所后写回缓存
+    (临时文件 + 原子替换)。返回市场数量
+    """
+    path = os.path.join(Config.DATA_DIR, f"markets_{exchange.id}.pkl")
     try:
-        url = f"https://api.telegram.org/bot{Config.TELEGRAM_TOKEN}/sendMessage"
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path, 'rb') as f:
+                markets, currencies = pickle.load(f)
+            exchange.set_markets(markets, currencies)
+            return len(exchange.markets)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"读取 {exchange.id} 市场缓存失败: {e}", "WARN")
+    
+    rate_limiter.acquire(exchange.id)
+    exchange.load_markets()
+    try:
+        tmp_path = f"{path}.{os.getpid()}.tmp"  # 分片模式下多个进程可能同时写
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((list(exchange.markets.values()), exchange.currencies), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        log(f"保存 {exchange.id} 市场缓存失败: {e}", "WARN")
+    return len(exchange.markets)
+
+class PeriodCache:
+    """
+    按接口周期对齐过期的响应缓存 (LRU)
+    上游数据每个周期 (如1h) 最多更新一次，缓存到下一个周期边界 + grace 为止；
+    grace 给上游出新数据留时间，边界后 grace 内取到的数据只缓存到 grace 结束。
+    失败的None不缓存
+    """
+    
+    def __init__(self, name: str, period: int, max_entries: int = Config.RESPONSE_CACHE_SIZE,
+                 grace: float = Config.RESPONSE_CACHE_GRACE):
+        self.name = name
+        self.period = period
+        self.max_entries = max_entries
+        self.grace = grace
+        self.entries = OrderedDict()  # {key: (过期时间, 值)}，按最近使用排序
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+    
+    def expires_at(self, now: float) -> float:
+        return (now - self.grace) // self.period * self.period + self.period + self.grace
+    
+    def fresh(self, key: str, now: Optional[float] = None) -> bool:
+        """是否有未过期的缓存 (只检查，不计命中)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[0] > now
+    
+    def get_or_fetch(self, key: str, fetcher: Callable[[str], Any], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        
+        value = fetcher(key)
+        with self._lock:
+            self.misses += 1
+            if value is not None:
+                self.entries[key] = (self.expires_at(now), value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+    
+    def state(self, now: Optional[float] = None) -> List[Tuple[str, float, Any]]:
+        """未过期的条目 [(key, 过期时间, 值)]，按最近使用排序"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [(key, expires, value) for key, (expires, value) in self.entries.items() if expires > now]
+    
+    def restore(self, entries: List[Tuple[str, float, Any]], now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            for key, expires, value in entries[-self.max_entries:]:
+                if expires > now:
+                    self.entries[key] = (expires, value)
+            return len(self.entries)
+    
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return f"{self.name}: 命中 {self.hits} / 请求 {self.misses} (命中率 {rate:.0%}), 淘汰 {self.evictions}"
+
+def post_telegram(message: str, session: Optional[requests.Session] = None,
+                  parse_mode: Optional[str] = "Markdown") -> Tuple[int, Optional[float]]:
+    """
+    发送一条Telegram消息 (传入session时复用其连接池，parse_mode=None 按纯文本发送)
+    返回: (HTTP状态码, retry_after秒数)，网络异常时状态码为0
+    """
+    try:
+        url = f"{Config.TELEGRAM_API_URL}/bot{Config.TELEGRAM_TOKEN}/sendMessage"
         payload = {
             "chat_id": Config.TELEGRAM_CHAT_ID,
             "text": message,
-            "parse_mode": "Markdown",
             "disable_web_page_preview": True
         }
-        response = requests.post(url, json=payload, timeout=10)
-        return response.status_code == 200
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        rate_limiter.acquire("telegram")
+        response = (session or requests).post(url, json=payload, timeout=10)
+        
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json().get("parameters", {}).get("retry_after", 0)) or None
+            except Exception:
+                retry_after = None
+        return response.status_code, retry_after
     except Exception as e:
         log(f"Telegram发送失败: {e}", "ERROR")
+        return 0, None
+
+def send_telegram(message: str, session: Optional[requests.Session] = None):
+    """同步发送Telegram通知 (仅用于启动测试等场景，扫描流程请使用发送队列)"""
+    if not Config.TELEGRAM_TOKEN or not Config.TELEGRAM_CHAT_ID:
         return False
+    
+    status, _ = post_telegram(message, session)
+    return status == 200
+
+class TelegramDispatcher:
+    """
+    后台Telegram发送队列
+    有界队列 + 单个工作线程，支持失败重试/指数退避、429 retry_after，
+    合并窗口内的多条消息合并成尽量少的请求发送，不阻塞扫描流程
+    """
+    
+    SEPARATOR = "\n\n"
+    
+    def __init__(self, maxsize: int = Config.TELEGRAM_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.session = None  # 由 SqueezeMonitor 注入共享连接池
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        
+        # 统计
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+    
+    def start(self):
+        """启动工作线程 (重复调用无副作用)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._worker, name="telegram", daemon=True)
+            self._thread.start()
+    
+    def enqueue(self, message: str) -> bool:
+        """消息入队，立即返回；队列满或未配置Telegram时返回False"""
+        if not Config.TELEGRAM_TOKEN or not Config.TELEGRAM_CHAT_ID:
+            return False
+        
+        self.start()
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            log(f"Telegram发送队列已满，丢弃消息 (累计丢弃 {self.dropped})", "WARN")
+            return False
+    
+    def flush(self, timeout: float = 30) -> bool:
+        """等待队列中的消息发送完毕"""
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks > 0:
+            if time.time() > deadline or not (self._thread and self._thread.is_alive()):
+                return False
+            time.sleep(0.1)
+        return True
+    
+    def stop(self, timeout: float = 30):
+        """发送剩余消息后停止工作线程"""
+        self.flush(timeout)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+    
+    def _collect_batch(self) -> List[str]:
+        """取出第一条消息后，在合并窗口内继续收集"""
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        
+        deadline = time.time() + Config.TELEGRAM_BATCH_WINDOW
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    @staticmethod
+    def _truncate(message: str) -> str:
+        """超长消息在行边界截断，避免把Markdown实体截成半个"""
+        limit = Config.TELEGRAM_MAX_LENGTH
+        if len(message) <= limit:
+            return message
+        cut = message.rfind("\n", 0, limit)
+        return message[:cut] if cut > 0 else message[:limit]
+    
+    def _merge(self, messages: List[str]) -> List[List[str]]:
+        """把多条消息分组，每组用分隔符拼接后不超过长度上限"""
+        groups = []
+        current = []
+        length = 0
+        for message in messages:
+            message = self._truncate(message)
+            if current and length + len(self.SEPARATOR) + len(message) > Config.TELEGRAM_MAX_LENGTH:
+                groups.append(current)
+                current = []
+                length = 0
+            length += len(message) + (len(self.SEPARATOR) if current else 0)
+            current.append(message)
+        if current:
+            groups.append(current)
+        return groups
+    
+    def _send_with_retry(self, text: str, parse_mode: Optional[str] = "Markdown") -> int:
+        """
+        发送单条消息，失败按指数退避重试，429按retry_after等待
+        返回最后一次的HTTP状态码 (200为成功)
+        """
+        status = 0
+        for attempt in range(Config.TELEGRAM_MAX_RETRIES):
+            status, retry_after = post_telegram(text, self.session, parse_mode)
+            if status == 200:
+                return status
+            
+            if status == 429:
+                wait = retry_after or Config.TELEGRAM_RETRY_BACKOFF * (2 ** attempt)
+                log(f"Telegram限流，{wait:.0f}秒后重试", "WARN")
+            elif 400 <= status < 500:
+                # 其他4xx (如消息格式错误) 原样重试无意义，交给调用方拆分或降级
+                log(f"Telegram拒绝消息 (HTTP {status})", "ERROR")
+                return status
+            else:
+                wait = Config.TELEGRAM_RETRY_BACKOFF * (2 ** attempt)
+            
+            if attempt < Config.TELEGRAM_MAX_RETRIES - 1:
+                time.sleep(wait)
+        
+        return status
+    
+    def _deliver(self, parts: List[str]):
+        """
+        发送一组合并消息；被拒绝(非429的4xx)时逐条重发，
+        单条仍被拒绝则去掉Markdown按纯文本发送，一条格式错误不会拖累整批
+        """
+        status = self._send_with_retry(self.SEPARATOR.join(parts))
+        if status == 200:
+            self.sent += 1
+            return
+        
+        if 400 <= status < 500 and status != 429:
+            if len(parts) > 1:
+                log(f"Telegram: 合并消息被拒绝，逐条重发 {len(parts)} 条", "WARN")
+                for part in parts:
+                    self._deliver([part])
+                return
+            if self._send_with_retry(parts[0], parse_mode=None) == 200:
+                log("Telegram: 消息格式被拒绝，已按纯文本重发", "WARN")
+                self.sent += 1
+                return
+        
+        self.failed += 1
+        log("Telegram消息重试后仍发送失败", "ERROR")
+    
+    def _worker(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            
+            try:
+                for parts in self._merge(batch):
+                    self._deliver(parts)
+                if len(batch) > 1:
+                    log(f"Telegram: 合并发送 {len(batch)} 条消息", "INFO")
+            except Exception as e:
+                self.failed += 1
+                log(f"Telegram发送线程异常: {e}", "ERROR")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+# 全局发送队列 (首次入队时启动工作线程)
+telegram_dispatcher = TelegramDispatcher()
 
 # ==================== Coinglass客户端 ====================
 class CoinglassClient:
@@ -123,68 +863,63 @@ class CoinglassClient:
             "CG-API-KEY": Config.COINGLASS_API_KEY,
             "User-Agent": "Mozilla/5.0"
         })
+        self.session.mount("https://", InstrumentedAdapter())
         self.base_url = Config.COINGLASS_BASE_URL
+        self.taker_cache = PeriodCache("taker", PERIOD_SECONDS[Config.TAKER_RATIO_PERIOD])
     
-    def get_negative_funding_symbols(self) -> List[Dict]:
-        """获取所有负费率币种"""
+    def get_funding_board(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        请求一次 exchange-list，把每个币种各交易所的费率全部解析出来
+        返回: {币种(不含USDT): {交易所: {funding_rate, funding_8h, interval, next_funding}}}
+        """
         try:
             url = f"{self.base_url}/futures/funding-rate/exchange-list"
+            rate_limiter.acquire("coinglass")
             response = self.session.get(url, timeout=15)
+            rate_limiter.check_response("coinglass", response)
         
             if response.status_code == 200:
                 data = response.json()
             
                 if str(data.get("code")) in ["0", "200"] and "data" in data:
-                    symbols = []
-                
-                    for item in data["data"]:
-                        try:
-                            symbol = item.get("symbol", "")
-                            # 核心修复：跳过币安没有的指数代码
-                            if "INDEX" in symbol or "TOTAL" in symbol or "ALL" in symbol:
-                                continue
-                        
-                            # 🔧 修复这里：stablecoin_margin_list 不是 token_margin_list
-                            exchange_list = item.get("stablecoin_margin_list", [])
-                        
-                            for exchange_data in exchange_list:
-                                exchange = exchange_data.get("exchange", "").lower()
-                            
-                                if "binance" in exchange:
-                                    rate = exchange_data.get("funding_rate", 0)
-                                    if isinstance(rate, str):
-                                        rate = float(rate)
-                                
-                                    if rate < Config.FUNDING_RATE_THRESHOLD:
-                                        full_symbol = f"{symbol}USDT"
-                                        symbols.append({
-                                            "symbol": full_symbol,
-                                            "funding_rate": rate,
-                                            "next_funding": exchange_data.get("next_funding_time", ""),
-                                            "exchange": "binance",
-                                            "timestamp": datetime.now().isoformat()
-                                        })
-                                        break
-                                    
-                        except Exception as e:
-                            continue
-                
-                    log(f"Coinglass: 发现 {len(symbols)} 个负费率(<-0.1%)币种", "INFO")
-                    # 按资金费率排序（最负的排前面）
-                    symbols.sort(key=lambda x: x["funding_rate"])
-        
-                    # 限制分析数量
-                    symbols = symbols[:Config.MAX_SYMBOLS_TO_ANALYZE]
-        
-                    log(f"筛选后分析 {len(symbols)} 个最负费率的币种", "INFO")
-                    return symbols
+                    return parse_funding_board(data["data"])
                 
         except Exception as e:
             log(f"Coinglass获取费率失败: {e}", "ERROR")
     
-        return []
+        return {}
+    
+    def get_negative_funding_symbols(self) -> List[Dict]:
+        """
+        获取所有负费率币种 (以币安费率为准)
+        同一份数据顺带算出跨交易所聚合费率，放在 cross_exchange 字段，不增加请求
+        """
+        symbols = []
+        for base, quotes in self.get_funding_board().items():
+            binance = quotes.get("binance")
+            if not binance or binance["funding_rate"] >= Config.FUNDING_RATE_THRESHOLD:
+                continue
+            
+            symbols.append({
+                "symbol": f"{base}USDT",
+                "funding_rate": binance["funding_rate"],
+                "next_funding": binance["next_funding"],
+                "exchange": "binance",
+                "timestamp": datetime.now().isoformat(),
+                "cross_exchange": aggregate_funding(quotes),
+            })
+        
+        log(f"Coinglass: 发现 {len(symbols)} 个负费率(<-0.1%)币种", "INFO")
+        # 按资金费率排序（最负的排前面）
+        # 不截断: 每周期扫描哪些币种由 ScanPlanner 按请求预算排期
+        symbols.sort(key=lambda x: x["funding_rate"])
+        return symbols
     
     def get_taker_buy_sell_ratio(self, symbol: str) -> Optional[float]:
+        """获取主动买卖比，同一个 TAKER_RATIO_PERIOD 周期内读缓存"""
+        return self.taker_cache.get_or_fetch(symbol, self._fetch_taker_buy_sell_ratio)
+    
+    def _fetch_taker_buy_sell_ratio(self, symbol: str) -> Optional[float]:
         """
         获取主动买卖比 (用于信号增强)
         返回: 买盘/卖盘比率，>1表示买盘强
@@ -194,7 +929,9 @@ class CoinglassClient:
             url = f"{self.base_url}/futures/taker-buy-sell-volume/exchange-list"
             params = {"symbol": clean_symbol, "range": Config.TAKER_RATIO_PERIOD}
             
+            rate_limiter.acquire("coinglass")
             response = self.session.get(url, params=params, timeout=10)
+            rate_limiter.check_response("coinglass", response)
             
             if response.status_code == 200:
                 data = response.json()
@@ -214,6 +951,744 @@ class CoinglassClient:
         
         return None
 
+def normalize_exchange(name: str) -> str:
+    """Coinglass 交易所名 -> 统一小写名 (与ccxt的交易所id一致)"""
+    name = name.strip().lower()
+    if "binance" in name:
+        return "binance"
+    return {"okex": "okx", "gate.io": "gate"}.get(name, name)
+
+def parse_funding_board(items: List[Dict]) -> Dict[str, Dict[str, Dict]]:
+    """
+    解析 exchange-list 数据为 {币种: {交易所: 费率信息}}
+    只保留 Config.FUNDING_EXCHANGES 中的交易所；跳过币安没有的指数代码。
+    funding_8h 为按结算间隔折算到8小时的费率，便于不同结算周期的交易所比较
+    """
+    board = {}
+    for item in items:
+        symbol = item.get("symbol", "")
+        # 核心修复：跳过币安没有的指数代码
+        if not symbol or "INDEX" in symbol or "TOTAL" in symbol or "ALL" in symbol:
+            continue
+        
+        quotes = {}
+        # 🔧 修复这里：stablecoin_margin_list 不是 token_margin_list
+        for exchange_data in item.get("stablecoin_margin_list", []):
+            try:
+                exchange = normalize_exchange(exchange_data.get("exchange", ""))
+                if exchange not in Config.FUNDING_EXCHANGES or exchange in quotes:
+                    continue
+                rate = float(exchange_data.get("funding_rate", 0))
+                interval = float(exchange_data.get("funding_rate_interval") or 8)
+                quotes[exchange] = {
+                    "funding_rate": rate,
+                    "funding_8h": rate * 8 / interval if interval > 0 else rate,
+                    "interval": interval,
+                    "next_funding": exchange_data.get("next_funding_time", ""),
+                }
+            except (TypeError, ValueError):
+                continue
+        if quotes:
+            board[symbol] = quotes
+    return board
+
+def aggregate_funding(quotes: Dict[str, Dict]) -> Dict:
+    """跨交易所费率聚合 (按8小时折算): 均值、最低值及所在交易所、低于阈值的交易所数"""
+    rates = {exchange: quote["funding_8h"] for exchange, quote in quotes.items()}
+    lowest = min(rates, key=rates.get)
+    return {
+        "exchanges": len(rates),
+        "negative": sum(1 for rate in rates.values() if rate < Config.FUNDING_RATE_THRESHOLD),
+        "mean_rate": sum(rates.values()) / len(rates),
+        "min_rate": rates[lowest],
+        "min_exchange": lowest,
+        "rates": rates,
+    }
+
+# ==================== OI历史缓冲区 ====================
+class OIHistoryBuffer:
+    """
+    OI历史环形缓冲区 (按墙钟时间分桶)
+    所有币种共用一个 numpy 矩阵 (币种 × 窗口)。样本时间戳按采样周期分桶，桶号 % 窗口 即写入位置:
+    同一桶内重复写入覆盖旧值，跳过的桶视为缺失。短/长窗口取 "当前桶往前N个桶" 内的样本，
+    扫描变慢或漏掉周期时窗口仍对应固定的时间跨度。批量接口一次向量化处理所有币种
+    不维护运行和: 窗口随墙钟时间过期，每次计算都对 (币种 × 窗口) 切片按桶号做掩码求和，
+    每个币种 O(窗口桶数)；窗口只有十几个桶，按行向量化后这部分开销可以忽略
+    """
+    
+    def __init__(self, window: int = Config.OI_LONG_WINDOW, short_window: int = Config.OI_SHORT_WINDOW,
+                 period: Optional[int] = None):
+        self.window = window
+        self.short_window = min(short_window, window)
+        self.period = period or Config.OI_SAMPLE_SECONDS
+        # 长窗口内至少要有这么多个桶有数据才计算激增比
+        self.min_samples = max(self.short_window, int(np.ceil(window * Config.OI_MIN_COVERAGE)))
+        self.index = {}  # {symbol: 行号}
+        self.symbols = []
+        self.values = np.zeros((0, window))
+        self.buckets = np.full((0, window), -1, dtype=np.int64)  # 每个位置当前保存的桶号，-1为空
+        self.latest = np.full(0, -1, dtype=np.int64)  # 每行最新的桶号
+        self._lock = threading.RLock()
+    
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.index
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def bucket_of(self, ts: float) -> int:
+        return int(ts // self.period)
+    
+    def _now_bucket(self, now: Optional[float]) -> int:
+        return self.bucket_of(time.time() if now is None else now)
+    
+    def _row(self, symbol: str) -> int:
+        """获取币种行号，不存在时新增 (容量按倍数扩展)"""
+        row = self.index.get(symbol)
+        if row is not None:
+            return row
+        
+        row = len(self.symbols)
+        if row >= len(self.latest):
+            capacity = max(64, len(self.latest) * 2)
+            size = len(self.latest)
+            values = np.zeros((capacity, self.window))
+            values[:size] = self.values
+            buckets = np.full((capacity, self.window), -1, dtype=np.int64)
+            buckets[:size] = self.buckets
+            latest = np.full(capacity, -1, dtype=np.int64)
+            latest[:size] = self.latest
+            self.values, self.buckets, self.latest = values, buckets, latest
+        
+        self.index[symbol] = row
+        self.symbols.append(symbol)
+        return row
+    
+    def _write(self, rows: np.ndarray, buckets: np.ndarray, new_values: np.ndarray):
+        """
+        向量化写入 (rows 内不能重复)
+        位置上已有更新的桶 (落后超过一个窗口的旧样本) 时跳过
+        """
+        slots = buckets % self.window
+        fresh = buckets >= self.buckets[rows, slots]
+        rows, slots, buckets = rows[fresh], slots[fresh], buckets[fresh]
+        self.values[rows, slots] = new_values[fresh]
+        self.buckets[rows, slots] = buckets
+        self.latest[rows] = np.maximum(self.latest[rows], buckets)
+    
+    def _window(self, rows: np.ndarray, now_bucket: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """每行在 (now_bucket - k, now_bucket] 内的样本掩码和值"""
+        buckets = self.buckets[rows]
+        mask = (buckets > now_bucket[:, None] - k) & (buckets <= now_bucket[:, None])
+        return mask, self.values[rows]
+    
+    def append(self, symbol: str, value: float, ts: Optional[float] = None) -> Optional[float]:
+        """写入一个样本 (ts默认当前时间)，返回写入前的最新值 (没有历史时返回None)"""
+        with self._lock:
+            row = self._row(symbol)
+            previous = self.last(symbol)
+            bucket = self._now_bucket(ts)
+            self._write(np.array([row]), np.array([bucket]), np.array([float(value)]))
+            return previous
+    
+    def append_many(self, symbols: List[str], values, ts: Optional[float] = None) -> np.ndarray:
+        """批量写入同一时刻的样本 (每个币种最多出现一次)，返回这些币种写入后的激增比"""
+        with self._lock:
+            rows = np.array([self._row(symbol) for symbol in symbols], dtype=np.int64)
+            bucket = self._now_bucket(ts)
+            self._write(rows, np.full(len(rows), bucket, dtype=np.int64), np.asarray(values, dtype=np.float64))
+            return self._surge(rows, np.full(len(rows), bucket, dtype=np.int64))
+    
+    def extend(self, symbol: str, samples: List[Tuple[float, float]]) -> int:
+        """
+        写入一个币种的一批带时间戳样本 [(ts, value), ...] (如历史接口回填)
+        同一桶保留时间最晚的样本，返回实际写入的桶数
+        """
+        with self._lock:
+            row = self._row(symbol)
+            latest = {}
+            for ts, value in sorted(samples):
+                latest[self.bucket_of(ts)] = float(value)
+            if not latest:
+                return 0
+            buckets = np.array(list(latest), dtype=np.int64)
+            keep = buckets > buckets.max() - self.window  # 同一次写入里位置不能重复
+            buckets = buckets[keep]
+            values = np.array(list(latest.values()))[keep]
+            before = self.buckets[row].copy()
+            self._write(np.full(len(buckets), row, dtype=np.int64), buckets, values)
+            return int((self.buckets[row] != before).sum())
+    
+    def last(self, symbol: str) -> Optional[float]:
+        row = self.index.get(symbol)
+        if row is None or self.latest[row] < 0:
+            return None
+        return float(self.values[row, self.latest[row] % self.window])
+    
+    def coverage(self, symbol: str, now: Optional[float] = None) -> int:
+        """长窗口内有数据的桶数"""
+        with self._lock:
+            row = self.index.get(symbol)
+            if row is None:
+                return 0
+            mask, _ = self._window(np.array([row]), np.array([self._now_bucket(now)]), self.window)
+            return int(mask.sum())
+    
+    def history(self, symbol: str) -> List[Tuple[float, float]]:
+        """按时间顺序 (旧 -> 新) 返回最新桶往前一个窗口内的 (桶起始时间戳, 值)"""
+        row = self.index.get(symbol)
+        if row is None:
+            return []
+        oldest = self.latest[row] - self.window
+        order = np.argsort(self.buckets[row])
+        return [(float(self.buckets[row, i] * self.period), float(self.values[row, i]))
+                for i in order if self.buckets[row, i] > max(oldest, -1)]
+    
+    def _surge(self, rows: np.ndarray, now_bucket: np.ndarray) -> np.ndarray:
+        """
+        激增比 = 短窗口均值 / 长窗口均值 (均值只取窗口内有数据的桶)
+        长窗口数据不足 min_samples 个桶或短窗口为空时为1.0
+        """
+        mask, values = self._window(rows, now_bucket, self.window)
+        long_n = mask.sum(axis=1)
+        long_sum = np.where(mask, values, 0.0).sum(axis=1)
+        short_mask = mask & (self.buckets[rows] > now_bucket[:, None] - self.short_window)
+        short_n = short_mask.sum(axis=1)
+        short_sum = np.where(short_mask, values, 0.0).sum(axis=1)
+        
+        ready = (long_n >= self.min_samples) & (short_n > 0) & (long_sum > 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = (short_sum / short_n) / (long_sum / long_n)
+        return np.where(ready, ratio, 1.0)
+    
+    def surge_ratio(self, symbol: str, now: Optional[float] = None) -> float:
+        with self._lock:
+            row = self.index.get(symbol)
+            if row is None:
+                return 1.0
+            return float(self._surge(np.array([row]), np.array([self._now_bucket(now)]))[0])
+    
+    def peak_and_last(self, symbols: List[str], k: int = Config.OI_PEAK_WINDOW,
+                      now: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一次向量化计算多个币种最近 k 个桶内的峰值、最新值和样本数
+        不存在或窗口内没有样本的币种: 峰值/最新值为NaN，样本数为0
+        """
+        with self._lock:
+            known = np.array([symbol in self.index for symbol in symbols], dtype=bool)
+            rows = np.array([self.index.get(symbol, 0) for symbol in symbols], dtype=np.int64)[known]
+            peaks = np.full(len(symbols), np.nan)
+            lasts = np.full(len(symbols), np.nan)
+            counts = np.zeros(len(symbols), dtype=np.int64)
+            if len(rows):
+                now_bucket = np.full(len(rows), self._now_bucket(now), dtype=np.int64)
+                mask, values = self._window(rows, now_bucket, min(k, self.window))
+                n = mask.sum(axis=1)
+                latest = self.latest[rows]
+                has = n > 0
+                peaks[known] = np.where(has, np.where(mask, values, -np.inf).max(axis=1), np.nan)
+                lasts[known] = np.where(has, values[np.arange(len(rows)), latest % self.window], np.nan)
+                counts[known] = n
+            return peaks, lasts, counts
+    
+    def state(self) -> Dict:
+        """紧凑状态 (已用行的原始数组)，用于检查点"""
+        with self._lock:
+            n = len(self.symbols)
+            return {
+                "window": self.window, "short_window": self.short_window, "period": self.period,
+                "symbols": list(self.symbols),
+                "values": self.values[:n].copy(),
+                "buckets": self.buckets[:n].copy(),
+                "latest": self.latest[:n].copy(),
+            }
+    
+    @classmethod
+    def from_state(cls, state: Dict) -> "OIHistoryBuffer":
+        """从 state() 恢复；窗口或采样周期配置已改变时抛出 ValueError"""
+        buffer = cls()
+        layout = (state["window"], state["short_window"], state["period"])
+        if layout != (buffer.window, buffer.short_window, buffer.period):
+            raise ValueError(f"OI缓冲区配置已改变: {layout}")
+        for symbol in state["symbols"]:
+            buffer._row(symbol)
+        n = len(state["symbols"])
+        buffer.values[:n] = state["values"]
+        buffer.buckets[:n] = state["buckets"]
+        buffer.latest[:n] = state["latest"]
+        return buffer
+
+# ==================== 流式行情 ====================
+class MarketTable:
+    """
+    流式行情表 (内存)
+    由 WebSocket 线程持续更新标记价格/资金费率 (!markPrice@arr) 和24h行情 (!ticker@arr)，
+    扫描线程直接读取，费率初筛和成交量过滤不再需要逐周期请求。
+    另按分钟记录每个币种的最高价，用于阶段3价格突破判断
+    """
+    
+    def __init__(self, lookback_seconds: int = Config.BREAKOUT_LOOKBACK_SECONDS):
+        self.rows = {}  # {symbol: 字段}
+        self.highs = {}  # {symbol: deque([分钟, 最高价])}
+        self.lookback_minutes = max(1, lookback_seconds // 60)
+        self.updated = 0.0  # 最近一次收到消息的本地时间
+        self.listeners = []  # 更新回调 f([(symbol, {字段: 值}), ...])，在流式线程中调用
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def _emit(self, updates: List[Tuple[str, Dict]]):
+        for listener in self.listeners:
+            try:
+                listener(updates)
+            except Exception as e:
+                log(f"行情回调失败: {e}", "DEBUG")
+    
+    def apply_mark_prices(self, items: List[Dict], now: Optional[float] = None):
+        """markPriceUpdate: s=交易对 p=标记价格 i=指数价格 r=资金费率 T=下次结算时间(ms)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for item in items:
+                row = self.rows.setdefault(item["s"], {})
+                row.update(
+                    mark_price=float(item["p"]),
+                    index_price=float(item.get("i") or 0),
+                    funding_rate=float(item.get("r") or 0),
+                    next_funding_time=int(item.get("T") or 0),
+                    funding_updated=now,
+                )
+            self.updated = now
+        self._emit([(item["s"], {"funding_rate": float(item.get("r") or 0)}) for item in items])
+    
+    def apply_tickers(self, items: List[Dict], now: Optional[float] = None):
+        """24hrTicker: c=最新价 q=24h成交额(USDT) h/l=24h最高/最低 P=24h涨跌幅(%)"""
+        now = time.time() if now is None else now
+        minute = int(now // 60)
+        with self._lock:
+            for item in items:
+                symbol = item["s"]
+                price = float(item["c"])
+                row = self.rows.setdefault(symbol, {})
+                row.update(
+                    price=price,
+                    volume_24h=float(item.get("q") or 0),
+                    high_24h=float(item.get("h") or 0),
+                    low_24h=float(item.get("l") or 0),
+                    change_24h=float(item.get("P") or 0),
+                    ticker_updated=now,
+                )
+                
+                highs = self.highs.get(symbol)
+                if highs is None:
+                    highs = self.highs[symbol] = deque(maxlen=self.lookback_minutes + 1)
+                if highs and highs[-1][0] == minute:
+                    highs[-1][1] = max(highs[-1][1], price)
+                else:
+                    highs.append([minute, price])
+            self.updated = now
+        self._emit([(item["s"], {"price": float(item["c"])}) for item in items])
+    
+    def row(self, symbol: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.rows.get(symbol)
+            return dict(row) if row else None
+    
+    def is_fresh(self, max_age: float = Config.STREAM_STALE_SECONDS) -> bool:
+        return bool(self.rows) and time.time() - self.updated <= max_age
+    
+    def market_data(self, symbol: str) -> Optional[Dict]:
+        """与 BinanceDataClient._ticker_to_market_data 相同的结构"""
+        with self._lock:
+            row = self.rows.get(symbol)
+            if not row or "price" not in row:
+                return None
+            return {key: row[key] for key in ("price", "volume_24h", "high_24h", "low_24h", "change_24h")}
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """所有已收到ticker的币种，作为周期行情快照"""
+        with self._lock:
+            symbols = [symbol for symbol, row in self.rows.items() if "price" in row]
+        return {symbol: self.market_data(symbol) for symbol in symbols}
+    
+    def negative_funding(self, threshold: float = Config.FUNDING_RATE_THRESHOLD) -> List[Dict]:
+        """费率低于阈值的USDT合约，结构与 CoinglassClient.get_negative_funding_symbols 一致 (按费率升序)"""
+        symbols = []
+        with self._lock:
+            for symbol, row in self.rows.items():
+                if not symbol.endswith("USDT") or "funding_rate" not in row:
+                    continue
+                if row["funding_rate"] < threshold:
+                    symbols.append({
+                        "symbol": symbol,
+                        "funding_rate": row["funding_rate"],
+                        "next_funding": row["next_funding_time"],
+                        "exchange": "binance",
+                        "timestamp": datetime.fromtimestamp(row["funding_updated"]).isoformat()
+                    })
+        symbols.sort(key=lambda x: x["funding_rate"])
+        return symbols
+    
+    def breakout(self, symbol: str, min_pct: float = Config.BREAKOUT_MIN_PCT) -> Optional[Dict]:
+        """
+        阶段3: 最新价高于回看窗口内 (不含当前分钟) 的最高价 min_pct 以上
+        回看数据不足半个窗口时不判断。返回 {price, range_high, pct} 或 None
+        """
+        with self._lock:
+            row = self.rows.get(symbol)
+            highs = self.highs.get(symbol)
+            if not row or "price" not in row or not highs or len(highs) <= self.lookback_minutes // 2:
+                return None
+            price = row["price"]
+            range_high = max(high for _, high in list(highs)[:-1])
+        
+        if range_high > 0 and price > range_high * (1 + min_pct):
+            return {"price": price, "range_high": range_high, "pct": (price / range_high - 1) * 100}
+        return None
+
+class MarketStream:
+    """
+    币安合约合并流客户端 (后台线程)
+    订阅 Config.STREAM_CHANNELS，收到的消息写入 MarketTable；
+    断线后按指数退避重连，收到数据后退避复位。币安每24小时主动断开一次，同样走重连
+    https://developers.binance.com/docs/derivatives/usds-margined-futures/websocket-market-streams
+    """
+    
+    # 代理协议未写端口时的默认端口
+    PROXY_DEFAULT_PORTS = {"http": 80, "https": 443, "socks4": 1080, "socks4a": 1080, "socks5": 1080, "socks5h": 1080}
+    
+    def __init__(self, table: MarketTable, url: str = Config.BINANCE_STREAM_URL,
+                 channels: List[str] = Config.STREAM_CHANNELS, proxy: Optional[str] = None):
+        self.table = table
+        self.url = f"{url}?streams={'/'.join(channels)}"
+        self.proxy = self.proxy_options(Config.PROXY if proxy is None else proxy)  # 格式错误在启动时报错，不进入重连循环
+        self.reconnects = 0
+        self.messages = 0
+        self.backoff = Config.STREAM_RECONNECT_BACKOFF  # 最近一次断线后的重连等待(秒)
+        self._stop = threading.Event()
+        self._ws = None
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="market-stream", daemon=True)
+        self._thread.start()
+        log(f"流式行情已启动: {self.url}", "INFO")
+    
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            # 先关闭读方向唤醒阻塞在 select 上的读循环，由它自行收尾；
+            # 直接 close 会先释放套接字，epoll 不再通知，读循环要等到 ping_timeout 才退出
+            raw = getattr(ws.sock, "sock", None)
+            try:
+                if raw is not None:
+                    raw.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if ws is not None:
+            ws.close()
+    
+    @classmethod
+    def proxy_options(cls, proxy: str) -> Dict:
+        """
+        代理URL -> run_forever 的代理参数
+        支持 user:pass@ 认证和 socks4/socks5 代理 (socks 需要 python-socks)；未写协议按 http，未写端口按协议默认端口
+        """
+        if not proxy:
+            return {}
+        parts = urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+        scheme = parts.scheme.lower()
+        if scheme not in cls.PROXY_DEFAULT_PORTS or not parts.hostname:
+            raise ValueError(f"不支持的代理: {proxy}")
+        
+        options = {
+            "http_proxy_host": parts.hostname,
+            "http_proxy_port": parts.port or cls.PROXY_DEFAULT_PORTS[scheme],  # 端口不是数字时 parts.port 抛 ValueError
+            "proxy_type": "http" if scheme == "https" else scheme,  # websocket-client 的 HTTP 代理一律走 CONNECT
+        }
+        if parts.username:
+            options["http_proxy_auth"] = (unquote(parts.username), unquote(parts.password or ""))
+        return options
+    
+    def handle_message(self, raw: str):
+        """解析合并流消息 {"stream": 名称, "data": [...]}"""
+        try:
+            message = json.loads(raw)
+            stream, data = message.get("stream", ""), message.get("data")
+            if not isinstance(data, list):
+                return
+            if stream.startswith("!markPrice@arr"):
+                self.table.apply_mark_prices(data)
+            elif stream.startswith("!ticker@arr"):
+                self.table.apply_tickers(data)
+            self.messages += 1
+        except Exception as e:
+            log(f"流式消息解析失败: {e}", "DEBUG")
+    
+    def _run(self):
+        delay = Config.STREAM_RECONNECT_BACKOFF
+        while not self._stop.is_set():
+            received = self.messages
+            try:
+                self._ws = websocket.WebSocketApp(
+                    self.url,
+                    on_message=lambda ws, raw: self.handle_message(raw),
+                    on_error=lambda ws, e: self._stop.is_set() or log(f"流式行情错误: {e}", "WARN"),
+                )
+                self._ws.run_forever(ping_interval=180, ping_timeout=10, **self.proxy)
+            except Exception as e:
+                log(f"流式行情连接失败: {e}", "WARN")
+            
+            if self._stop.is_set():
+                break
+            if self.messages > received:
+                delay = Config.STREAM_RECONNECT_BACKOFF  # 连接曾经正常，退避复位
+            self.reconnects += 1
+            self.backoff = delay
+            log(f"流式行情断开，{delay:.1f}秒后重连 (第 {self.reconnects} 次)", "WARN")
+            self._stop.wait(delay)
+            delay = min(delay * 2, Config.STREAM_RECONNECT_MAX)
+
+def create_market_stream() -> Optional[MarketStream]:
+    """按 STREAM_MODE 创建并启动流式行情；关闭或缺少 websocket-client 时返回None (回退REST轮询)"""
+    mode = Config.STREAM_MODE
+    if mode == "off":
+        return None
+    if mode != "binance":
+        log(f"未知的 STREAM_MODE={mode}，使用REST轮询", "WARN")
+        return None
+    
+    if websocket is None:
+        log("未安装 websocket-client，流式行情不可用，使用REST轮询", "WARN")
+        return None
+    
+    table = MarketTable()
+    try:
+        stream = MarketStream(table)
+    except ValueError as e:
+        log(f"流式行情配置错误，使用REST轮询: {e}", "ERROR")
+        return None
+    stream.start()
+    return stream
+
+# ==================== 事件驱动评估 ====================
+class SignalEventEngine:
+    """
+    事件驱动的单币种重评估
+    行情表 (费率/价格) 或 OI 更新时，与该币种上次评估时的值比较，变化超过阈值才排入待评估集合；
+    同一币种在防抖窗口内的多次变化合并为一次评估，由后台线程按到期时间依次处理。
+    只关心费率满足核心条件的币种，平静行情下几乎不产生评估
+    """
+    
+    DELTAS = {  # 字段: (比较方式, 阈值)
+        "funding_rate": ("abs", Config.EVENT_FUNDING_DELTA),
+        "price": ("rel", Config.EVENT_PRICE_DELTA),
+        "oi": ("rel", Config.EVENT_OI_DELTA),
+    }
+    
+    def __init__(self, evaluate: Callable[[str], None], debounce: float = Config.EVENT_DEBOUNCE_SECONDS):
+        self.evaluate = evaluate
+        self.debounce = debounce
+        self.baseline = {}  # {symbol: {字段: 上次评估时的值}}
+        self.latest = {}  # {symbol: {字段: 最新值}}
+        self.pending = {}  # {symbol: 到期时间}
+        self.triggered = 0
+        self.coalesced = 0
+        self.evaluated = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="signal-events", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+    
+    def _exceeds(self, field: str, old: float, new: float) -> bool:
+        mode, threshold = self.DELTAS[field]
+        if mode == "abs":
+            return abs(new - old) >= threshold
+        return old > 0 and abs(new / old - 1) >= threshold
+    
+    def observe(self, symbol: str, now: Optional[float] = None, **values):
+        """传入币种的最新值 (funding_rate / price / oi)，相对上次评估变化超过阈值时排入评估"""
+        now = time.time() if now is None else now
+        with self._cond:
+            latest = self.latest.setdefault(symbol, {})
+            base = self.baseline.setdefault(symbol, {})
+            changed = False
+            for field, value in values.items():
+                if value is None:
+                    continue
+                latest[field] = value
+                if field not in base:
+                    base[field] = value  # 首次出现只作为基准
+                    continue
+                if field == "funding_rate" and base[field] >= Config.FUNDING_RATE_THRESHOLD > value:
+                    changed = True  # 费率刚跌破阈值
+                elif self._exceeds(field, base[field], value):
+                    changed = True
+            
+            funding = latest.get("funding_rate")
+            if not changed or funding is None or funding >= Config.FUNDING_RATE_THRESHOLD:
+                return
+            
+            if symbol in self.pending:
+                self.coalesced += 1
+            else:
+                self.pending[symbol] = now + self.debounce
+                self.triggered += 1
+                self._cond.notify()
+    
+    def mark_evaluated(self, symbol: str, **values):
+        """币种已被评估 (事件或周期扫描)，以当时的值作为新基准并取消待评估"""
+        with self._cond:
+            base = self.baseline.setdefault(symbol, {})
+            base.update(self.latest.get(symbol, {}))
+            base.update({field: value for field, value in values.items() if value is not None})
+            self.pending.pop(symbol, None)
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    now = time.time()
+                    due = [symbol for symbol, at in self.pending.items() if at <= now]
+                    if due:
+                        break
+                    wait = min(self.pending.values()) - now if self.pending else None
+                    self._cond.wait(wait)
+                if self._stop:
+                    return
+                for symbol in due:
+                    self.pending.pop(symbol, None)
+            
+            for symbol in due:
+                try:
+                    self.evaluate(symbol)
+                except Exception as e:
+                    log(f"事件评估 {symbol} 失败: {e}", "ERROR")
+                self.evaluated += 1
+    
+    def summary(self) -> str:
+        return f"事件: 触发 {self.triggered} 次, 合并 {self.coalesced} 次, 评估 {self.evaluated} 次"
+
+# ==================== 多交易所OI ====================
+class ExchangeOIClient:
+    """单个交易所的OI客户端 (ccxt，USDT线性永续 BASE/USDT:USDT)，经全局限流器按交易所分桶"""
+    
+    def __init__(self, exchange_id: str, session: Optional[requests.Session] = None):
+        self.exchange_id = exchange_id
+        self.session = session
+        self._exchange = None
+        self._lock = threading.Lock()
+    
+    @property
+    def exchange(self):
+        """首次查询时才创建ccxt客户端并加载市场元数据"""
+        with self._lock:
+            if self._exchange is None:
+                if not hasattr(ccxt, self.exchange_id):
+                    raise ValueError(f"ccxt 不支持交易所 {self.exchange_id}")
+                options = {"enableRateLimit": False, "timeout": 15000, "options": {"defaultType": "swap"}}
+                if self.session is not None:
+                    options["session"] = self.session
+                exchange = getattr(ccxt, self.exchange_id)(options)
+                load_markets_cached(exchange)
+                self._exchange = exchange
+            return self._exchange
+    
+    def fetch_open_interest(self, base: str) -> Optional[float]:
+        """返回币本位OI (与币安 openInterestAmount 同单位)，失败返回None"""
+        rate_limiter.acquire(self.exchange_id)
+        try:
+            data = self.exchange.fetch_open_interest(f"{base}/USDT:USDT")
+            return data.get("openInterestAmount") or None
+        except ccxt.DDoSProtection:
+            rate_limiter.penalize(self.exchange_id)
+        except Exception as e:
+            log(f"获取 {self.exchange_id} OI失败 {base}: {e}", "DEBUG")
+        return None
+
+class CrossExchangeOI:
+    """
+    多交易所OI聚合
+    clients 为 {交易所: 客户端}，客户端只需实现 fetch_open_interest(base)；
+    默认按 Config.CROSS_OI_EXCHANGES 创建 ccxt 客户端，也可用 register 接入其他实现
+    """
+    
+    def __init__(self, exchanges: List[str] = Config.CROSS_OI_EXCHANGES,
+                 session: Optional[requests.Session] = None):
+        self.clients = {}
+        for exchange_id in exchanges:
+            self.register(exchange_id, ExchangeOIClient(exchange_id, session))
+    
+    def __bool__(self) -> bool:
+        return bool(self.clients)
+    
+    def register(self, exchange: str, client):
+        self.clients[exchange] = client
+    
+    def fetch(self, base: str, binance_oi: Optional[float] = None) -> Dict:
+        """汇总各交易所OI: {by_exchange, total, binance_share}"""
+        by_exchange = {"binance": binance_oi} if binance_oi else {}
+        for exchange, client in self.clients.items():
+            oi = client.fetch_open_interest(base)
+            if oi:
+                by_exchange[exchange] = oi
+        total = sum(by_exchange.values())
+        return {
+            "by_exchange": by_exchange,
+            "total": total,
+            "binance_share": (binance_oi / total) if binance_oi and total else None,
+        }
+
+# ==================== 周期数据快照 ====================
+class CycleSnapshot:
+    """
+    单个扫描周期内已抓取的数据，主扫描和跟踪阶段共用
+    market 为批量行情，其余序列按 {symbol: 数据} 缓存；同一周期内同一序列每个币种只请求一次
+    """
+    
+    SERIES = ("oi", "global_ls", "top_ls", "taker", "cross_oi")
+    
+    def __init__(self, market: Optional[Dict[str, Dict]] = None, ts: Optional[float] = None):
+        self.ts = time.time() if ts is None else ts
+        self.market = market or {}
+        self.series = {name: {} for name in self.SERIES}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def has(self, name: str, symbol: str) -> bool:
+        with self._lock:
+            return symbol in self.series[name]
+    
+    def get(self, name: str, symbol: str):
+        with self._lock:
+            return self.series[name].get(symbol)
+    
+    def fetch(self, name: str, symbol: str, fetcher: Callable[[str], Any]):
+        """本周期已有数据时直接返回，否则调用 fetcher 获取 (失败的None不缓存，下次仍会重试)"""
+        with self._lock:
+            if symbol in self.series[name]:
+                self.hits += 1
+                return self.series[name][symbol]
+        
+        value = fetcher(symbol)
+        with self._lock:
+            self.misses += 1
+            if value is not None:
+                self.series[name][symbol] = value
+        return value
+
 # ==================== 币安数据客户端 ====================
 class BinanceDataClient:
     """
@@ -222,110 +1697,235 @@ class BinanceDataClient:
     """
     
     def __init__(self):
-        self.exchange = ccxt.binance(Config.BINANCE_CONFIG)
+        # 共享连接池: 原始REST接口、ccxt 和 Telegram 都复用这个会话
+        self.http = create_http_session(Config.HTTP_POOL_SIZE)
+        self._exchange = None  # ccxt客户端，首次调用时创建 (见 exchange)
+        self._exchange_lock = threading.Lock()
+        
+        # OI历史环形缓冲区 (币种 × 长窗口的桶)，由检查点恢复；新币种首次出现时从历史接口回填
+        self.oi_history = OIHistoryBuffer()
+        self._backfill_attempts = {}  # {symbol: 上次尝试回填的时间}
+        
+        # 本周期的数据快照 (批量行情 + 已取过的OI/多空比)，每周期开始时重建
+        self.cycle = CycleSnapshot(ts=0)
+        self._cache_lock = threading.Lock()
+        
+        # 流式行情表 (启用流式行情时由 SqueezeMonitor 设置)，新鲜时替代批量ticker请求
+        self.market_table = None
+        self.oi_listeners = []  # 取到新OI时的回调 f(symbol, oi)
+        
+        # 多空比响应缓存 (按各自 period 对齐过期)，跨周期复用
+        self.ratio_caches = {
+            "global_ls": PeriodCache("global_ls", PERIOD_SECONDS[Config.GLOBAL_LS_PERIOD]),
+            "top_ls": PeriodCache("top_ls", PERIOD_SECONDS[Config.TOP_LS_PERIOD]),
+        }
         
-        # OI历史数据缓存 {symbol: deque([oi1, oi2, ...], maxlen=10)}
-        self.oi_history = self.load_oi_history()
+        # 其他交易所的OI (只对通过核心条件的信号币种查询)
+        self.cross_oi = CrossExchangeOI(session=self.http)
         
         # 活跃信号跟踪 {symbol: {signal_data}}
         self.active_signals = {}
         
         # 确保数据目录存在
         os.makedirs(Config.DATA_DIR, exist_ok=True)
+        
+        # 信号时序数据 (替代 data/{symbol}.csv，每周期批量落盘)
+        self.signal_series = TimeSeriesStore("signals", SIGNAL_SERIES_DTYPE)
+        
+        # 全量候选快照 (记录模式)
+        self.snapshot_series = None
+        if Config.RECORD_SNAPSHOTS:
+            self.snapshot_series = TimeSeriesStore(
+                "snapshots", MARKET_SNAPSHOT_DTYPE,
+                retention_days=Config.SNAPSHOT_RETENTION_DAYS,
+                max_bytes=Config.SNAPSHOT_MAX_MB * 1024 * 1024,
+            )
+    
+    @property
+    def exchange(self):
+        """ccxt客户端: 首次使用时导入ccxt、创建客户端并加载市场元数据 (优先读磁盘缓存)"""
+        with self._exchange_lock:
+            if self._exchange is None:
+                exchange = ccxt.binance(dict(Config.BINANCE_CONFIG, session=self.http))
+                # 合约接口与原始REST请求使用同一个 BINANCE_FAPI_URL (镜像/本地桩服务器)
+                api = exchange.urls["api"]
+                for key, url in api.items():
+                    if isinstance(url, str) and url.startswith("https://fapi.binance.com"):
+                        api[key] = Config.BINANCE_FAPI_URL + url[len("https://fapi.binance.com"):]
+                count = load_markets_cached(exchange)
+                log(f"币安市场元数据: {count} 个合约", "DEBUG")
+                self._exchange = exchange
+            return self._exchange
     
-    def load_oi_history(self) -> Dict[str, deque]:
-        """加载OI历史数据"""
+    def _ccxt_call(self, method: str, *args, weight: float = 1):
+        """经全局限流器调用ccxt方法，被限流时暂停整个币安桶"""
+        rate_limiter.acquire("binance", weight)
         try:
-            if os.path.exists(Config.OI_HISTORY_FILE):
-                with open(Config.OI_HISTORY_FILE, 'r') as f:
-                    data = json.load(f)
-                    # 转换回deque
-                    history = {}
-                    for symbol, values in data.items():
-                        history[symbol] = deque(values, maxlen=Config.OI_LONG_WINDOW)
-                    log(f"已加载 {len(history)} 个币种的OI历史数据", "INFO")
-                    return history
-        except Exception as e:
-            log(f"加载OI历史失败: {e}", "WARN")
-        
-        return {}
+            return getattr(self.exchange, method)(*args)
+        except ccxt.DDoSProtection:
+            # 包含 RateLimitExceeded (429) 和 418 封禁
+            rate_limiter.penalize("binance")
+            raise
     
-    def save_oi_history(self):
-        """保存OI历史数据"""
+    def refresh_market_snapshot(self) -> int:
+        """
+        批量拉取所有合约ticker (一次请求)，并以此开启新周期的数据快照
+        (上一周期取过的OI/多空比一并作废)。流式行情新鲜时直接取内存表，零请求。
+        返回快照中的币种数量
+        https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/24hr-Ticker-Price-Change-Statistics
+        """
+        if self.market_table is not None and self.market_table.is_fresh():
+            self.start_cycle(self.market_table.snapshot())
+            log(f"行情快照 (流式): {len(self.cycle.market)} 个合约", "INFO")
+            return len(self.cycle.market)
+        
+        snapshot = {}
         try:
-            # 转换deque为list以便JSON序列化
-            data = {symbol: list(history) for symbol, history in self.oi_history.items()}
-            with open(Config.OI_HISTORY_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            tickers = self._ccxt_call("fetch_tickers", weight=40)
+            for ticker in tickers.values():
+                market_id = (ticker.get('info') or {}).get('symbol')
+                if market_id and ticker.get('last') is not None:
+                    snapshot[market_id] = self._ticker_to_market_data(ticker)
         except Exception as e:
-            log(f"保存OI历史失败: {e}", "WARN")
+            log(f"批量获取行情失败，回退为逐个获取: {e}", "WARN")
+        
+        self.start_cycle(snapshot)
+        
+        if snapshot:
+            log(f"行情快照: {len(snapshot)} 个合约", "INFO")
+        return len(snapshot)
     
-    def get_open_interest(self, symbol: str) -> Optional[float]:
+    def start_cycle(self, market: Optional[Dict[str, Dict]] = None):
+        """开启新的周期快照"""
+        self.cycle = CycleSnapshot(market)
+    
+    def get_open_interest(self, symbol: str, cycle: Optional[CycleSnapshot] = None) -> Optional[float]:
+        """获取当前OI，同一周期内重复调用直接读周期快照 (cycle 默认为扫描周期的快照)"""
+        return (cycle or self.cycle).fetch("oi", symbol, self._fetch_open_interest)
+    
+    def _fetch_open_interest(self, symbol: str) -> Optional[float]:
         """
-        获取当前OI (原始接口)
+        请求当前OI (原始接口)
+        币安没有全市场批量OI接口，只对通过成交量过滤的币种逐个请求
         https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/Open-Interest
         """
         try:
             # 使用ccxt获取，更稳定
-            oi_data = self.exchange.fetch_open_interest(symbol)
-            return oi_data.get('openInterestAmount', 0)
+            oi_data = self._ccxt_call("fetch_open_interest", symbol)
+            current_oi = oi_data.get('openInterestAmount', 0)
         except Exception as e:
             log(f"获取OI失败 {symbol}: {e}", "DEBUG")
             return None
+        
+        for listener in self.oi_listeners:
+            listener(symbol, current_oi)
+        return current_oi
+    
+    def backfill_oi_history(self, symbol: str) -> int:
+        """
+        从历史持仓量接口回填最近一个长窗口的OI，冷启动第一个周期即可计算激增比
+        接口粒度 (OI_BACKFILL_PERIOD) 比桶粗，OI是存量，每个采样点的值保持到下一个采样点 (最后一个保持到当前)
+        sumOpenInterest 与 fetch_open_interest 的 openInterestAmount 同为币本位数量
+        https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/Open-Interest-Statistics
+        返回写入的桶数
+        """
+        try:
+            url = f"{Config.BINANCE_FAPI_URL}/futures/data/openInterestHist"
+            step = PERIOD_SECONDS[Config.OI_BACKFILL_PERIOD]
+            span = self.oi_history.window * self.oi_history.period
+            params = {
+                "symbol": symbol,
+                "period": Config.OI_BACKFILL_PERIOD,
+                "limit": -(-span // step) + 1
+            }
+            
+            rate_limiter.acquire("binance_data")
+            response = self.http.get(url, params=params, timeout=10)
+            rate_limiter.check_response("binance_data", response)
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data, list):
+                    points = sorted(
+                        (int(point["timestamp"]) / 1000, float(point["sumOpenInterest"]))
+                        for point in data if float(point.get("sumOpenInterest", 0)) > 0
+                    )
+                    ends = [ts for ts, _ in points[1:]] + [time.time()]
+                    samples = [
+                        (ts, value)
+                        for (start, value), end in zip(points, ends)
+                        for ts in np.arange(start, end, self.oi_history.period)
+                    ]
+                    written = self.oi_history.extend(symbol, samples)
+                    log(f"已回填OI历史 {symbol}: {written} 个桶", "DEBUG")
+                    return written
+                    
+        except Exception as e:
+            log(f"回填OI历史失败 {symbol}: {e}", "DEBUG")
+        
+        return 0
+    
+    def backfill_pending(self, symbol: str, now: float) -> bool:
+        """下次计算激增比时是否会回填 (只检查，不记录尝试)"""
+        if self.oi_history.coverage(symbol, now) >= self.oi_history.min_samples:
+            return False
+        with self._cache_lock:
+            return now - self._backfill_attempts.get(symbol, 0) >= Config.OI_BACKFILL_RETRY
+    
+    def _needs_backfill(self, symbol: str, now: float) -> bool:
+        """长窗口覆盖不足，且距上次尝试超过重试间隔 (检查和记录尝试在同一把锁内)"""
+        if self.oi_history.coverage(symbol, now) >= self.oi_history.min_samples:
+            return False
+        with self._cache_lock:
+            if now - self._backfill_attempts.get(symbol, 0) < Config.OI_BACKFILL_RETRY:
+                return False
+            self._backfill_attempts[symbol] = now
+        return True
     
     def calculate_oi_surge_ratio(self, symbol: str, current_oi: float) -> Tuple[float, float]:
         """
         计算OI激增比率 (阶段2: OI异常增多)
-        严格按照原文: 最近3次均值 / 最近10次均值 > 2
+        最近3个桶均值 / 最近10个桶均值 (按墙钟时间，桶长 OI_SAMPLE_SECONDS)
         返回: (激增比率, OI变化百分比)
         """
-        # 初始化或获取历史队列
-        if symbol not in self.oi_history:
-            self.oi_history[symbol] = deque(maxlen=Config.OI_LONG_WINDOW)
+        now = time.time()
+        if self._needs_backfill(symbol, now):
+            self.backfill_oi_history(symbol)
         
-        history = self.oi_history[symbol]
-        previous_oi = history[-1] if len(history) > 0 else current_oi
+        # 添加当前值到历史 (缓冲区内部加锁，并发扫描安全)
+        previous_oi = self.oi_history.append(symbol, current_oi, now)
+        if previous_oi is None:
+            previous_oi = current_oi
         
         # 计算OI变化
         oi_change_pct = 0
         if previous_oi > 0:
             oi_change_pct = (current_oi - previous_oi) / previous_oi * 100
         
-        # 添加当前值到历史
-        history.append(current_oi)
-        
-        # 计算激增比率 (当有足够数据时)
-        if len(history) >= Config.OI_LONG_WINDOW:
-            # 最近3次均值
-            short_window = min(Config.OI_SHORT_WINDOW, len(history))
-            recent_values = list(history)[-short_window:]
-            short_avg = sum(recent_values) / short_window
-            
-            # 最近10次均值
-            long_avg = sum(history) / len(history)
-            
-            if long_avg > 0:
-                surge_ratio = short_avg / long_avg
-                return surge_ratio, oi_change_pct
-        
-        # 数据不足时返回默认值
-        return 1.0, oi_change_pct
+        # 激增比率: 长窗口覆盖不足时为1.0
+        return self.oi_history.surge_ratio(symbol, now), oi_change_pct
+    
+    def get_global_long_short_ratio(self, symbol: str, cycle: Optional[CycleSnapshot] = None) -> Optional[Dict]:
+        """获取全平台多空比: 周期快照 -> 按 GLOBAL_LS_PERIOD 对齐的响应缓存 -> 请求"""
+        cache = self.ratio_caches["global_ls"]
+        return (cycle or self.cycle).fetch("global_ls", symbol,
+                                           lambda s: cache.get_or_fetch(s, self._fetch_global_long_short_ratio))
     
-    def get_global_long_short_ratio(self, symbol: str) -> Optional[Dict]:
+    def _fetch_global_long_short_ratio(self, symbol: str) -> Optional[Dict]:
         """
-        获取全平台多空比 (用于阶段4: Long/Short Ratio减少监控)
+        请求全平台多空比 (用于阶段4: Long/Short Ratio减少监控)
         https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/Long-Short-Ratio
         """
         try:
-            clean_symbol = symbol.replace("USDT", "")
-            url = "https://fapi.binance.com/futures/data/globalLongShortAccountRatio"
+            url = f"{Config.BINANCE_FAPI_URL}/futures/data/globalLongShortAccountRatio"
             params = {
-                "symbol": clean_symbol,
+                "symbol": symbol,  # 币安要求完整交易对 (如 BTCUSDT)
                 "period": Config.GLOBAL_LS_PERIOD,
                 "limit": 10  # 获取最近10个数据点看趋势
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            rate_limiter.acquire("binance_data")
+            response = self.http.get(url, params=params, timeout=10)
+            rate_limiter.check_response("binance_data", response)
             if response.status_code == 200:
                 data = response.json()
                 if isinstance(data, list) and len(data) > 0:
@@ -353,20 +1953,27 @@ class BinanceDataClient:
         return None
     
     def get_top_trader_long_short_ratio(self, symbol: str) -> Optional[Dict]:
+        """获取顶级交易员多空比: 周期快照 -> 按 TOP_LS_PERIOD 对齐的响应缓存 -> 请求"""
+        cache = self.ratio_caches["top_ls"]
+        return self.cycle.fetch("top_ls", symbol,
+                                lambda s: cache.get_or_fetch(s, self._fetch_top_trader_long_short_ratio))
+    
+    def _fetch_top_trader_long_short_ratio(self, symbol: str) -> Optional[Dict]:
         """
-        获取顶级交易员多空比 (用于信号增强)
+        请求顶级交易员多空比 (用于信号增强)
         https://developers.binance.com/docs/derivatives/usds-margined-futures/market-data/rest-api/Long-Short-Ratio
         """
         try:
-            clean_symbol = symbol.replace("USDT", "")
-            url = "https://fapi.binance.com/futures/data/topLongShortPositionRatio"
+            url = f"{Config.BINANCE_FAPI_URL}/futures/data/topLongShortPositionRatio"
             params = {
-                "symbol": clean_symbol,
+                "symbol": symbol,  # 币安要求完整交易对 (如 BTCUSDT)
                 "period": Config.TOP_LS_PERIOD,
                 "limit": Config.TOP_TREND_WINDOW + 2
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            rate_limiter.acquire("binance_data")
+            response = self.http.get(url, params=params, timeout=10)
+            rate_limiter.check_response("binance_data", response)
             if response.status_code == 200:
                 data = response.json()
                 if isinstance(data, list) and len(data) >= Config.TOP_TREND_WINDOW:
@@ -391,39 +1998,432 @@ class BinanceDataClient:
         
         return None
     
-    def save_to_csv(self, symbol: str, data: Dict):
-        """
-        保存数据到CSV (原文要求)
-        文件: data/{symbol}.csv
-        """
+    def flush_series(self):
+        """把本周期缓存的时序数据批量落盘"""
+        self.signal_series.flush()
+        if self.snapshot_series:
+            self.snapshot_series.flush()
+    
+    @staticmethod
+    def _ticker_to_market_data(ticker: Dict) -> Dict:
+        """ccxt ticker -> 市场数据字典"""
+        return {
+            "price": ticker['last'],
+            "volume_24h": ticker.get('quoteVolume') or 0,
+            "high_24h": ticker.get('high') or 0,
+            "low_24h": ticker.get('low') or 0,
+            "change_24h": ticker.get('percentage') or 0
+        }
+    
+    def get_market_data(self, symbol: str) -> Optional[Dict]:
+        """获取市场数据 (价格、交易量等)，优先读流式行情表，其次本周期快照"""
+        if self.market_table is not None and self.market_table.is_fresh():
+            market_data = self.market_table.market_data(symbol)
+            if market_data:
+                return market_data
+        
+        market_data = self.cycle.market.get(symbol)
+        if market_data:
+            return market_data
+        
         try:
-            filename = os.path.join(Config.DATA_DIR, f"{symbol}.csv")
-            file_exists = os.path.isfile(filename)
+            ticker = self._ccxt_call("fetch_ticker", symbol)
+            return self._ticker_to_market_data(ticker)
+        except Exception as e:
+            log(f"获取市场数据失败 {symbol}: {e}", "DEBUG")
+            return None
+
+# ==================== 信号记录存储 ====================
+class SignalLogStore:
+    """
+    信号记录存储 (JSON Lines 追加写)
+    每条信号只追加一行，写入成本 O(1)；启动时流式读取，只在内存保留最近的记录和汇总统计。
+    遇到损坏行 (写入中途崩溃) 或记录数超限时压缩: 写临时文件后原子替换
+    """
+    
+    def __init__(self, path: Optional[str] = None, tail_size: int = Config.SIGNALS_LOG_TAIL):
+        self.path = path or Config.SIGNALS_LOG_FILE
+        self.tail = deque(maxlen=tail_size)
+        self.count = 0
+        self.stats = self._empty_stats()
+        self._lock = threading.Lock()
+        
+        self._migrate_legacy()
+        self._load()
+    
+    @staticmethod
+    def _empty_stats() -> Dict:
+        return {"total": 0, "strong": 0, "medium": 0, "weak": 0, "score_sum": 0}
+    
+    def _update_stats(self, stats: Dict, signal: Dict):
+        score = signal.get("score", 0)
+        stats["total"] += 1
+        stats["score_sum"] += score
+        if score >= 70:
+            stats["strong"] += 1
+        elif score >= 50:
+            stats["medium"] += 1
+        else:
+            stats["weak"] += 1
+    
+    def _iter_file(self):
+        """逐行读取，返回 (记录, 是否损坏)"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line), False
+                except ValueError:
+                    yield None, True
+    
+    def _migrate_legacy(self):
+        """把旧的整文件JSON格式迁移为JSON Lines"""
+        legacy = Config.LEGACY_SIGNALS_LOG_FILE
+        if self.path != Config.SIGNALS_LOG_FILE or os.path.exists(self.path) or not os.path.exists(legacy):
+            return
+        
+        try:
+            with open(legacy, 'r', encoding='utf-8') as f:
+                signals = json.load(f).get("signals", [])
+            self._write_atomic(signals)
+            os.replace(legacy, legacy + ".migrated")
+            log(f"已迁移 {len(signals)} 条旧格式信号记录", "INFO")
+        except Exception as e:
+            log(f"迁移旧信号记录失败: {e}", "WARN")
+    
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        
+        corrupted = 0
+        try:
+            for record, bad in self._iter_file():
+                if bad:
+                    corrupted += 1
+                    continue
+                self.count += 1
+                self.tail.append(record)
+                self._update_stats(self.stats, record)
+            log(f"已加载 {self.count} 条历史信号", "INFO")
+        except Exception as e:
+            log(f"加载信号记录失败: {e}", "WARN")
+            return
+        
+        if corrupted or self.count > Config.SIGNALS_LOG_MAX_RECORDS:
+            log(f"信号记录压缩 (损坏行 {corrupted}, 总数 {self.count})", "INFO")
+            self.compact()
+    
+    def _write_atomic(self, signals):
+        """写临时文件 -> fsync -> 原子替换"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in signals:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def append(self, record: Dict):
+        """追加一条信号"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._write_line(line)
+            self.count += 1
+            self.tail.append(record)
+            self._update_stats(self.stats, record)
             
-            with open(filename, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=data.keys())
-                if not file_exists:
-                    writer.writeheader()
-                writer.writerow(data)
+            needs_compaction = self.count > Config.SIGNALS_LOG_MAX_RECORDS * 1.1
+        
+        if needs_compaction:
+            self.compact()
+    
+    def _write_line(self, line: str):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except Exception as e:
+            log(f"保存信号记录失败: {e}", "WARN")
+    
+    def compact(self):
+        """丢弃损坏行，只保留最近 SIGNALS_LOG_MAX_RECORDS 条，原子替换原文件"""
+        with self._lock:
+            try:
+                kept = deque(maxlen=Config.SIGNALS_LOG_MAX_RECORDS)
+                for record, bad in self._iter_file():
+                    if not bad:
+                        kept.append(record)
+                self._write_atomic(kept)
                 
+                stats = self._empty_stats()
+                for record in kept:
+                    self._update_stats(stats, record)
+                self.stats = stats
+                self.count = len(kept)
+            except Exception as e:
+                log(f"压缩信号记录失败: {e}", "WARN")
+    
+    def recent(self, n: int) -> List[Dict]:
+        return list(self.tail)[-n:]
+
+class MemorySignalLogStore(SignalLogStore):
+    """只在内存保留最近记录和统计，不读写信号日志文件 (分片工作进程用: 日志只由协调进程写入)"""
+    
+    def _migrate_legacy(self):
+        pass
+    
+    def _load(self):
+        pass
+    
+    def _write_line(self, line: str):
+        pass
+    
+    def compact(self):
+        pass
+
+# ==================== 时序数据存储 ====================
+# 信号阶段编码 (时序存储中用1字节保存)
+PHASE_CODES = {"PHASE_1_2": 1, "PHASE_3": 3, "PHASE_4": 4, "PHASE_5": 5}
+
+# 信号快照的定长记录格式
+SIGNAL_SERIES_DTYPE = np.dtype([
+    ("ts", "<f8"),  # Unix时间戳(秒)
+    ("funding_rate", "<f8"),
+    ("oi_surge_ratio", "<f8"),
+    ("oi_current", "<f8"),
+    ("price", "<f8"),
+    ("score", "<i2"),
+    ("phase", "u1"),
+])
+
+# 每周期全量候选快照的定长记录格式 (未抓取的字段为NaN)
+MARKET_SNAPSHOT_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("price", "<f8"),
+    ("funding_rate", "<f4"),
+    ("volume_24h", "<f4"),
+    ("change_24h", "<f4"),
+    ("oi", "<f4"),
+    ("oi_surge_ratio", "<f4"),
+    ("taker_ratio", "<f4"),
+    ("global_ls_ratio", "<f4"),
+    ("global_short_account", "<f4"),
+    ("top_ls_ratio", "<f4"),
+    ("score", "<i2"),  # 未通过核心条件时为-1
+])
+
+class TimeSeriesStore:
+    """
+    按币种的定长二进制时序存储
+    文件: {TIMESERIES_DIR}/{dataset}/{YYYYMMDD}/{symbol}.bin，内容是 numpy 结构化数组的原始字节。
+    写入先缓存在内存，每周期 flush 一次批量追加；读取时 memmap 并按 ts 二分定位时间范围。
+    可选保留策略: 按天数和总字节数删除最早的日期分区
+    """
+    
+    PRUNE_INTERVAL = 3600  # 保留策略检查间隔(秒)
+    
+    def __init__(self, dataset: str, dtype: np.dtype, root: Optional[str] = None,
+                 retention_days: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.dataset = dataset
+        self.dtype = np.dtype(dtype)
+        self.path = os.path.join(root or Config.TIMESERIES_DIR, dataset)
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self._last_prune = 0.0
+        self._buffer = defaultdict(list)  # {(day, symbol): [row_tuple, ...]}
+        self._lock = threading.Lock()
+        
+        os.makedirs(self.path, exist_ok=True)
+        self._check_schema()
+    
+    def _check_schema(self):
+        """记录格式变更时，把旧数据目录改名保留，避免按新格式误读"""
+        schema_file = os.path.join(self.path, "schema.json")
+        schema = [list(field) for field in self.dtype.descr]
+        
+        try:
+            if os.path.exists(schema_file):
+                with open(schema_file, 'r') as f:
+                    if json.load(f) == schema:
+                        return
+                archived = f"{self.path}.{int(time.time())}"
+                os.replace(self.path, archived)
+                os.makedirs(self.path, exist_ok=True)
+                log(f"时序数据格式变更，旧数据已移至 {archived}", "WARN")
+            
+            with open(schema_file, 'w') as f:
+                json.dump(schema, f)
         except Exception as e:
-            log(f"保存CSV失败 {symbol}: {e}", "WARN")
+            log(f"检查时序数据格式失败 {self.dataset}: {e}", "WARN")
     
-    def get_market_data(self, symbol: str) -> Optional[Dict]:
-        """获取市场数据 (价格、交易量等)"""
+    @staticmethod
+    def _day(ts: float) -> str:
+        return time.strftime("%Y%m%d", time.gmtime(ts))
+    
+    def add(self, symbol: str, row: Dict):
+        """缓存一行记录 (缺失字段按0/NaN填充)"""
+        values = []
+        for name in self.dtype.names:
+            value = row.get(name)
+            if value is None:
+                value = np.nan if self.dtype[name].kind == "f" else 0
+            values.append(value)
+        
+        with self._lock:
+            self._buffer[(self._day(row["ts"]), symbol)].append(tuple(values))
+    
+    def flush(self) -> int:
+        """把缓存的记录批量追加到文件，返回写入行数"""
+        with self._lock:
+            buffer, self._buffer = self._buffer, defaultdict(list)
+        
+        written = 0
+        for (day, symbol), rows in buffer.items():
+            try:
+                day_dir = os.path.join(self.path, day)
+                os.makedirs(day_dir, exist_ok=True)
+                records = np.array(rows, dtype=self.dtype)
+                records.sort(order="ts")
+                with open(os.path.join(day_dir, f"{symbol}.bin"), 'ab') as f:
+                    f.write(records.tobytes())
+                written += len(records)
+            except Exception as e:
+                log(f"写入时序数据失败 {self.dataset}/{symbol}: {e}", "WARN")
+        
+        if time.time() - self._last_prune > self.PRUNE_INTERVAL:
+            self.prune()
+        return written
+    
+    def prune(self):
+        """执行保留策略: 删除超期的日期分区，总大小超限时继续删除最早的分区"""
+        self._last_prune = time.time()
+        if not self.retention_days and not self.max_bytes:
+            return
+        
         try:
-            ticker = self.exchange.fetch_ticker(symbol)
+            days = self.days()
+            # 当天分区总是保留
+            removable = days[:-1]
             
-            return {
-                "price": ticker['last'],
-                "volume_24h": ticker.get('quoteVolume', 0),
-                "high_24h": ticker.get('high', 0),
-                "low_24h": ticker.get('low', 0),
-                "change_24h": ticker.get('percentage', 0)
-            }
+            if self.retention_days:
+                cutoff = self._day(time.time() - self.retention_days * 86400)
+                for day in [d for d in removable if d < cutoff]:
+                    self._remove_day(day)
+                    removable.remove(day)
+            
+            if self.max_bytes:
+                sizes = {day: self._day_size(day) for day in self.days()}
+                total = sum(sizes.values())
+                for day in list(removable):
+                    if total <= self.max_bytes:
+                        break
+                    self._remove_day(day)
+                    total -= sizes[day]
         except Exception as e:
-            log(f"获取市场数据失败 {symbol}: {e}", "DEBUG")
+            log(f"时序数据清理失败 {self.dataset}: {e}", "WARN")
+    
+    def _day_size(self, day: str) -> int:
+        day_dir = os.path.join(self.path, day)
+        return sum(os.path.getsize(os.path.join(day_dir, f)) for f in os.listdir(day_dir))
+    
+    def _remove_day(self, day: str):
+        day_dir = os.path.join(self.path, day)
+        for f in os.listdir(day_dir):
+            os.remove(os.path.join(day_dir, f))
+        os.rmdir(day_dir)
+        log(f"时序数据清理: 删除 {self.dataset}/{day}", "INFO")
+    
+    def days(self) -> List[str]:
+        """已有的日期分区 (升序)"""
+        return sorted(d for d in os.listdir(self.path) if d.isdigit())
+    
+    def symbols(self) -> List[str]:
+        """所有出现过的币种"""
+        found = set()
+        for day in self.days():
+            found.update(f[:-4] for f in os.listdir(os.path.join(self.path, day)) if f.endswith(".bin"))
+        return sorted(found)
+    
+    def read(self, symbol: str, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """读取某币种 [start, end) 时间范围内的记录"""
+        first_day = self._day(start) if start is not None else None
+        last_day = self._day(end) if end is not None else None
+        
+        chunks = []
+        for day in self.days():
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            
+            filename = os.path.join(self.path, day, f"{symbol}.bin")
+            if not os.path.exists(filename) or os.path.getsize(filename) < self.dtype.itemsize:
+                continue
+            
+            records = np.memmap(filename, dtype=self.dtype, mode='r',
+                                shape=(os.path.getsize(filename) // self.dtype.itemsize,))
+            lo = np.searchsorted(records["ts"], start, side="left") if start is not None else 0
+            hi = np.searchsorted(records["ts"], end, side="left") if end is not None else len(records)
+            if hi > lo:
+                chunks.append(np.array(records[lo:hi]))
+        
+        if not chunks:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(chunks)
+    
+    def read_frame(self, symbol: str, start: Optional[float] = None, end: Optional[float] = None) -> "pd.DataFrame":
+        """读取为DataFrame，索引为时间"""
+        df = pd.DataFrame(self.read(symbol, start, end))
+        if not df.empty:
+            df.index = pd.to_datetime(df["ts"], unit="s")
+        return df
+
+# ==================== 状态检查点 ====================
+class CheckpointStore:
+    """
+    运行状态检查点 (单文件 pickle)
+    写临时文件 -> fsync -> 原子替换，进程在任何时刻被杀都只会留下完整的旧文件或新文件；
+    版本不符或超过 max_age 的检查点忽略，按冷启动处理
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, path: Optional[str] = None, max_age: float = Config.CHECKPOINT_MAX_AGE):
+        self.path = path or Config.CHECKPOINT_FILE
+        self.max_age = max_age
+    
+    def save(self, state: Dict) -> int:
+        """写入检查点，返回字节数"""
+        payload = pickle.dumps({"version": self.VERSION, "saved_at": time.time(), "state": state},
+                               protocol=pickle.HIGHEST_PROTOCOL)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(payload)
+    
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
             return None
+        try:
+            with open(self.path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except Exception as e:
+            log(f"读取检查点失败: {e}", "WARN")
+            return None
+        
+        if checkpoint.get("version") != self.VERSION:
+            log("检查点版本不符，忽略", "WARN")
+            return None
+        age = time.time() - checkpoint.get("saved_at", 0)
+        if age > self.max_age:
+            log(f"检查点已过期 ({age / 3600:.1f} 小时前)，忽略", "WARN")
+            return None
+        return checkpoint["state"]
 
 # ==================== 信号分析与跟踪系统 ====================
 class SqueezeSignalAnalyzer:
@@ -432,53 +2432,108 @@ class SqueezeSignalAnalyzer:
     完整实现五阶段逻辑链条的监控
     """
     
-    def __init__(self, coinglass_client, binance_client):
+    # 评分分量: (名称, 计算方法)，顺序与 calculate_signal_score 的参数一致
+    SCORE_COMPONENTS = (
+        ("funding", "_score_funding"),
+        ("oi_surge", "_score_oi_surge"),
+        ("global_short", "_score_global_short"),
+        ("top_trader", "_score_top_trader"),
+        ("taker_ratio", "_score_taker"),
+    )
+    
+    def __init__(self, coinglass_client, binance_client, notify=None,
+                 signal_store: Optional[SignalLogStore] = None, clock=time.time):
         self.coinglass = coinglass_client
         self.binance = binance_client
-        self.signals_log = self.load_signals_log()
+        self.notify = notify or telegram_dispatcher.enqueue  # 通知出口 (默认异步发送队列)
+        self.signal_store = signal_store or SignalLogStore()
+        self.clock = clock  # 时间来源 (回放时注入模拟时钟)
         self.alert_cooldown = {}  # 警报冷却 {symbol: last_alert_time}
         self.active_tracking = {}  # 正在跟踪的信号 {symbol: {phase, start_time, data}}
+        # 增强指标 {symbol: (获取时间, (taker, global_ls, top_ls))}，扫描线程和事件线程共用，每周期清除过期条目
+        self._enhanced_cache = {}
+        self._enhanced_lock = threading.Lock()
         
         # 信号强度阈值
         self.STRONG_SIGNAL_SCORE = 70
         self.MEDIUM_SIGNAL_SCORE = 50
     
-    def load_signals_log(self) -> List[Dict]:
-        """加载信号历史记录"""
-        try:
-            if os.path.exists(Config.SIGNALS_LOG_FILE):
-                with open(Config.SIGNALS_LOG_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    log(f"已加载 {len(data.get('signals', []))} 条历史信号", "INFO")
-                    return data.get("signals", [])
-        except Exception as e:
-            log(f"加载信号记录失败: {e}", "WARN")
-        
-        return []
+    def _now(self) -> datetime:
+        return datetime.fromtimestamp(self.clock())
+    
+    def state(self) -> Dict:
+        """冷却和跟踪状态 (检查点用)"""
+        return {
+            "alert_cooldown": dict(self.alert_cooldown),
+            "active_tracking": {symbol: dict(data) for symbol, data in self.active_tracking.items()},
+        }
+    
+    def restore_state(self, state: Dict):
+        self.alert_cooldown.update(state.get("alert_cooldown", {}))
+        self.active_tracking.update(state.get("active_tracking", {}))
+    
+    @property
+    def signals_log(self) -> List[Dict]:
+        """最近的信号记录 (完整历史在 signal_store 的文件中)"""
+        return list(self.signal_store.tail)
+    
+    def record_signal(self, signal_data: Dict):
+        """记录一条信号 (追加写)"""
+        self.signal_store.append(signal_data)
     
-    def save_signals_log(self):
-        """保存信号记录"""
+    def record_candidate(self, symbol_data: Dict, state: Optional[Dict] = None):
+        """
+        记录模式: 保存候选币种本周期抓取到的完整状态
+        state 为分析过程中收集的字段；未分析的币种只有费率和行情快照
+        """
+        if not self.binance.snapshot_series:
+            return
+        
+        row = {"ts": self.clock(), "funding_rate": symbol_data["funding_rate"], "score": -1}
+        market_data = self.binance.cycle.market.get(symbol_data["symbol"])
+        if market_data:
+            row.update(price=market_data["price"], volume_24h=market_data["volume_24h"],
+                       change_24h=market_data["change_24h"])
+        if state:
+            row.update(state)
+        
         try:
-            data = {
-                "signals": self.signals_log,
-                "last_update": datetime.now().isoformat(),
-                "total_signals": len(self.signals_log)
-            }
-            with open(Config.SIGNALS_LOG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            self.binance.snapshot_series.add(symbol_data["symbol"], row)
         except Exception as e:
-            log(f"保存信号记录失败: {e}", "WARN")
+            log(f"记录快照失败 {symbol_data['symbol']}: {e}", "DEBUG")
     
-    def analyze_squeeze_potential(self, symbol_data: Dict) -> Optional[Dict]:
+    def analyze_squeeze_potential(self, symbol_data: Dict, incremental: bool = False) -> Optional[Dict]:
         """
         分析轧空潜力 (阶段1+2)
         返回信号数据，包含评分和详细指标
+        incremental: 事件触发的重评估，EVENT_ENHANCED_TTL 内复用上次取到的增强指标
+        """
+        state = {}
+        try:
+            return self._analyze(symbol_data, state, incremental)
+        finally:
+            self.record_candidate(symbol_data, state)
+    
+    def _analyze(self, symbol_data: Dict, state: Dict, incremental: bool = False) -> Optional[Dict]:
+        """分析主体，抓取到的数据同时写入 state 供记录模式使用"""
+        candidate = self.screen_candidate(symbol_data, state)
+        if not candidate:
+            return None
+        return self.enrich_candidate(candidate, state, incremental)
+    
+    def screen_candidate(self, symbol_data: Dict, state: Dict) -> Optional[Dict]:
+        """
+        廉价阶段: 行情 + OI激增比 + 核心条件 (每个币种最多一次OI请求)
+        满足核心条件时返回候选，交给 enrich_candidate 获取增强指标
         """
         symbol = symbol_data["symbol"]
         funding_rate = symbol_data["funding_rate"]
         
         # 获取市场数据
         market_data = self.binance.get_market_data(symbol)
+        if market_data:
+            state.update(price=market_data["price"], volume_24h=market_data["volume_24h"],
+                         change_24h=market_data["change_24h"])
         if not market_data or market_data["volume_24h"] < Config.MIN_VOLUME_USD:
             return None
         
@@ -488,6 +2543,7 @@ class SqueezeSignalAnalyzer:
             return None
         
         oi_surge_ratio, oi_change_pct = self.binance.calculate_oi_surge_ratio(symbol, current_oi)
+        state.update(oi=current_oi, oi_surge_ratio=oi_surge_ratio)
         
         # 严格按照原文核心条件
         core_condition_1 = funding_rate < Config.FUNDING_RATE_THRESHOLD
@@ -496,22 +2552,61 @@ class SqueezeSignalAnalyzer:
         if not (core_condition_1 and core_condition_2):
             return None
         
-        # 获取增强指标
-        taker_ratio = self.coinglass.get_taker_buy_sell_ratio(symbol)
-        global_ls = self.binance.get_global_long_short_ratio(symbol)
-        top_ls = self.binance.get_top_trader_long_short_ratio(symbol)
+        return {
+            "symbol_data": symbol_data,
+            "market_data": market_data,
+            "current_oi": current_oi,
+            "oi_surge_ratio": oi_surge_ratio,
+            "oi_change_pct": oi_change_pct,
+        }
+    
+    def enrich_candidate(self, candidate: Dict, state: Dict, incremental: bool = False) -> Dict:
+        """昂贵阶段: 为通过核心条件的候选获取增强指标和跨交易所OI，评分并构建信号数据"""
+        symbol_data = candidate["symbol_data"]
+        market_data = candidate["market_data"]
+        current_oi = candidate["current_oi"]
+        oi_surge_ratio = candidate["oi_surge_ratio"]
+        oi_change_pct = candidate["oi_change_pct"]
+        symbol = symbol_data["symbol"]
+        funding_rate = symbol_data["funding_rate"]
+        
+        # 获取增强指标 (按1h/15m周期更新，事件重评估时短时间内直接复用)
+        with self._enhanced_lock:
+            cached = self._enhanced_cache.get(symbol) if incremental else None
+        if cached and self.clock() - cached[0] < Config.EVENT_ENHANCED_TTL:
+            taker_ratio, global_ls, top_ls = cached[1]
+        else:
+            taker_ratio = self.binance.cycle.fetch("taker", symbol, self.coinglass.get_taker_buy_sell_ratio)
+            global_ls = self.binance.get_global_long_short_ratio(symbol)
+            top_ls = self.binance.get_top_trader_long_short_ratio(symbol)
+            with self._enhanced_lock:
+                self._enhanced_cache[symbol] = (self.clock(), (taker_ratio, global_ls, top_ls))
+        
+        # 跨交易所: 费率聚合来自初筛数据，OI只为通过核心条件的币种查询 (本周期内缓存)
+        cross_exchange = symbol_data.get("cross_exchange")
+        if cross_exchange and self.binance.cross_oi:
+            base = symbol[:-len("USDT")] if symbol.endswith("USDT") else symbol
+            cross_exchange = dict(cross_exchange, oi=self.binance.cycle.fetch(
+                "cross_oi", symbol, lambda _: self.binance.cross_oi.fetch(base, current_oi)))
         
         # 计算综合评分
         score, score_details = self.calculate_signal_score(
             funding_rate, oi_surge_ratio, global_ls, top_ls, taker_ratio
         )
+        state.update(
+            taker_ratio=taker_ratio,
+            global_ls_ratio=global_ls["current_ratio"] if global_ls else None,
+            global_short_account=global_ls["short_account"] if global_ls else None,
+            top_ls_ratio=top_ls["current_ratio"] if top_ls else None,
+            score=score,
+        )
         
         # 构建信号数据
         signal_data = {
             "symbol": symbol,
             "score": score,
             "phase": "PHASE_1_2",  # 处于阶段1+2
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": self._now().isoformat(),
             "core_indicators": {
                 "funding_rate": funding_rate,
                 "oi_surge_ratio": oi_surge_ratio,
@@ -523,26 +2618,35 @@ class SqueezeSignalAnalyzer:
             "enhanced_indicators": {
                 "taker_buy_ratio": taker_ratio,
                 "global_long_short": global_ls,
-                "top_trader_long_short": top_ls
+                "top_trader_long_short": top_ls,
+                "cross_exchange": cross_exchange
             },
             "score_details": score_details
         }
         
-        # 保存到CSV (原文要求)
-        csv_data = {
-            "timestamp": signal_data["timestamp"],
-            "symbol": symbol,
+        # 保存到时序存储 (周期结束时批量落盘)
+        self.binance.signal_series.add(symbol, {
+            "ts": self.clock(),
             "funding_rate": funding_rate,
             "oi_surge_ratio": oi_surge_ratio,
             "oi_current": current_oi,
             "price": market_data["price"],
             "score": score,
-            "phase": signal_data["phase"]
-        }
-        self.binance.save_to_csv(symbol, csv_data)
+            "phase": PHASE_CODES[signal_data["phase"]],
+        })
         
         return signal_data
     
+    def prune_enhanced_cache(self, now: Optional[float] = None) -> int:
+        """清除超过 EVENT_ENHANCED_TTL 的增强指标 (每个扫描周期调用)，返回清除数"""
+        now = self.clock() if now is None else now
+        with self._enhanced_lock:
+            expired = [symbol for symbol, (ts, _) in self._enhanced_cache.items()
+                       if now - ts >= Config.EVENT_ENHANCED_TTL]
+            for symbol in expired:
+                del self._enhanced_cache[symbol]
+        return len(expired)
+    
     def calculate_signal_score(self, funding_rate: float, oi_surge_ratio: float,
                               global_ls: Optional[Dict], top_ls: Optional[Dict], 
                               taker_ratio: Optional[float]) -> Tuple[int, Dict]:
@@ -550,71 +2654,76 @@ class SqueezeSignalAnalyzer:
         计算信号综合评分 (0-100)
         用于Telegram消息的强度分级
         """
+        inputs = (funding_rate, oi_surge_ratio, global_ls, top_ls, taker_ratio)
+        return self._sum_components(
+            (key, getattr(self, method)(value)) for (key, method), value in zip(self.SCORE_COMPONENTS, inputs)
+        )
+    
+    @staticmethod
+    def _sum_components(components) -> Tuple[int, Dict]:
         score = 0
         details = {}
-        
-        # 1. 资金费率评分 (0-40分)
-        if funding_rate < -0.003:
-            score += 40
-            details["funding"] = "极度负值(40分)"
-        elif funding_rate < -0.002:
-            score += 30
-            details["funding"] = "高度负值(30分)"
-        elif funding_rate < -0.0015:
-            score += 20
-            details["funding"] = "中度负值(20分)"
-        elif funding_rate < -0.001:
-            score += 10
-            details["funding"] = "临界负值(10分)"
-        
-        # 2. OI激增评分 (0-30分)
-        if oi_surge_ratio > 3.0:
-            score += 30
-            details["oi_surge"] = f"异常激增({oi_surge_ratio:.2f}x, 30分)"
-        elif oi_surge_ratio > 2.5:
-            score += 25
-            details["oi_surge"] = f"强烈激增({oi_surge_ratio:.2f}x, 25分)"
-        elif oi_surge_ratio > 2.0:
-            score += 20
-            details["oi_surge"] = f"显著激增({oi_surge_ratio:.2f}x, 20分)"
-        elif oi_surge_ratio > 1.5:
-            score += 10
-            details["oi_surge"] = f"温和增长({oi_surge_ratio:.2f}x, 10分)"
-        
-        # 3. 散户空头评分 (0-15分)
-        if global_ls and global_ls.get("short_account", 0) > Config.GLOBAL_SHORT_THRESHOLD:
-            short_pct = global_ls["short_account"] * 100
-            if short_pct > 70:
-                score += 15
-                details["global_short"] = f"极度拥挤({short_pct:.1f}%, 15分)"
-            elif short_pct > 65:
-                score += 10
-                details["global_short"] = f"高度拥挤({short_pct:.1f}%, 10分)"
-            elif short_pct > 60:
-                score += 5
-                details["global_short"] = f"中度拥挤({short_pct:.1f}%, 5分)"
-        
-        # 4. 大户动向评分 (0-10分)
-        if top_ls and top_ls.get("trend") == "上升":
-            score += 10
-            details["top_trader"] = "趋势上升(10分)"
-        elif top_ls:
-            score += 5
-            details["top_trader"] = "有数据(5分)"
-        
-        # 5. 主动买卖比评分 (0-5分)
-        if taker_ratio and taker_ratio > Config.TAKER_BUY_THRESHOLD:
-            score += 5
-            details["taker_ratio"] = f"买盘强劲({taker_ratio:.2f}, 5分)"
-        elif taker_ratio and taker_ratio > 1.0:
-            score += 3
-            details["taker_ratio"] = f"买盘占优({taker_ratio:.2f}, 3分)"
-        
+        for key, (points, detail) in components:
+            if points:
+                score += points
+                details[key] = detail
         return min(score, 100), details
     
+    @staticmethod
+    def _band_fraction(value: float, bands: List[Tuple[float, float]], below: bool) -> Tuple[int, float]:
+        """返回命中的区间序号和得分比例，未命中返回 (-1, 0)"""
+        for i, (threshold, fraction) in enumerate(bands):
+            if (value < threshold) if below else (value > threshold):
+                return i, fraction
+        return -1, 0.0
+    
+    def _score_funding(self, funding_rate: float) -> Tuple[int, str]:
+        """1. 资金费率评分 (0-40分)"""
+        labels = ["极度负值", "高度负值", "中度负值", "临界负值"]
+        i, fraction = self._band_fraction(funding_rate, Config.FUNDING_SCORE_BANDS, below=True)
+        points = round(Config.SCORE_WEIGHTS["funding_rate"] * fraction)
+        return points, f"{labels[min(i, len(labels) - 1)]}({points}分)" if points else ""
+    
+    def _score_oi_surge(self, oi_surge_ratio: float) -> Tuple[int, str]:
+        """2. OI激增评分 (0-30分)"""
+        labels = ["异常激增", "强烈激增", "显著激增", "温和增长"]
+        i, fraction = self._band_fraction(oi_surge_ratio, Config.OI_SURGE_SCORE_BANDS, below=False)
+        points = round(Config.SCORE_WEIGHTS["oi_surge"] * fraction)
+        return points, f"{labels[min(i, len(labels) - 1)]}({oi_surge_ratio:.2f}x, {points}分)" if points else ""
+    
+    def _score_global_short(self, global_ls: Optional[Dict]) -> Tuple[int, str]:
+        """3. 散户空头评分 (0-15分)"""
+        if not global_ls or global_ls.get("short_account", 0) <= Config.GLOBAL_SHORT_THRESHOLD:
+            return 0, ""
+        labels = ["极度拥挤", "高度拥挤", "中度拥挤"]
+        short_account = global_ls["short_account"]
+        i, fraction = self._band_fraction(short_account, Config.GLOBAL_SHORT_SCORE_BANDS, below=False)
+        points = round(Config.SCORE_WEIGHTS["global_short"] * fraction)
+        return points, f"{labels[min(i, len(labels) - 1)]}({short_account * 100:.1f}%, {points}分)" if points else ""
+    
+    def _score_top_trader(self, top_ls: Optional[Dict]) -> Tuple[int, str]:
+        """4. 大户动向评分 (0-10分)"""
+        if not top_ls:
+            return 0, ""
+        if top_ls.get("trend") == "上升":
+            points = round(Config.SCORE_WEIGHTS["top_trader"] * Config.TOP_TRADER_SCORE["up"])
+            return points, f"趋势上升({points}分)"
+        points = round(Config.SCORE_WEIGHTS["top_trader"] * Config.TOP_TRADER_SCORE["data"])
+        return points, f"有数据({points}分)"
+    
+    def _score_taker(self, taker_ratio: Optional[float]) -> Tuple[int, str]:
+        """5. 主动买卖比评分 (0-5分)"""
+        if taker_ratio and taker_ratio > Config.TAKER_BUY_THRESHOLD:
+            points = round(Config.SCORE_WEIGHTS["taker_ratio"] * Config.TAKER_SCORE["strong"])
+            return points, f"买盘强劲({taker_ratio:.2f}, {points}分)"
+        if taker_ratio and taker_ratio > 1.0:
+            points = round(Config.SCORE_WEIGHTS["taker_ratio"] * Config.TAKER_SCORE["buy"])
+            return points, f"买盘占优({taker_ratio:.2f}, {points}分)"
+        return 0, ""
+    
     def check_alert_cooldown(self, symbol: str, score: int) -> bool:
         """检查警报冷却时间"""
-        current_time = time.time()
+        current_time = self.clock()
         
         if symbol in self.alert_cooldown:
             last_alert = self.alert_cooldown[symbol]
@@ -653,7 +2762,7 @@ class SqueezeSignalAnalyzer:
         message = f"{emoji} *{strength}: {symbol}*\n"
         message += "══════════════════════\n"
         message += f"• **综合评分**: `{score}/100`\n"
-        message += f"• **信号阶段**: `阶段1+2 (预警期)`\n"
+        message += "• **信号阶段**: `阶段1+2 (预警期)`\n"
         message += f"• **资金费率**: `{indicators['funding_rate']:.4%}`\n"
         message += f"• **OI激增比**: `{indicators['oi_surge_ratio']:.2f}x`\n"
         message += f"• **OI变化**: `{indicators['oi_change_pct']:+.1f}%`\n"
@@ -670,7 +2779,16 @@ class SqueezeSignalAnalyzer:
         if enhanced["top_trader_long_short"]:
             message += f"• **大户动向**: `{enhanced['top_trader_long_short']['trend']}`\n"
         
-        message += f"• **时间**: {datetime.now().strftime('%H:%M:%S')}\n"
+        cross = enhanced.get("cross_exchange")
+        if cross:
+            message += (f"• **跨交易所费率**: 均值 `{cross['mean_rate']:.4%}` | "
+                        f"最低 `{cross['min_rate']:.4%}` ({cross['min_exchange']}) | "
+                        f"负费率 {cross['negative']}/{cross['exchanges']} 家\n")
+            oi = cross.get("oi")
+            if oi and oi["total"] and oi["binance_share"]:
+                message += f"• **全网OI**: `{oi['total']:,.0f}` (币安占 {oi['binance_share']:.0%})\n"
+        
+        message += f"• **时间**: {self._now().strftime('%H:%M:%S')}\n"
         message += "══════════════════════\n"
         
         # 添加评分详情
@@ -682,7 +2800,10 @@ class SqueezeSignalAnalyzer:
         message += "\n📈 **策略逻辑 (五阶段)**:\n"
         message += "1. ✅ 极端负费率 (庄家控盘)\n"
         message += "2. ✅ OI异常增多 (庄家建仓)\n"
-        message += "3. ⏳ 等待价格突破 (需人工确认)\n"
+        if self.binance.market_table is not None:
+            message += "3. ⏳ 等待价格突破 (自动检测)\n"
+        else:
+            message += "3. ⏳ 等待价格突破 (需人工确认)\n"
         message += "4. 🔍 监控多空比减少 (进行中)\n"
         message += "5. 📉 跟踪OI减少 & 费率回归\n"
         
@@ -701,28 +2822,80 @@ class SqueezeSignalAnalyzer:
     def track_active_signal(self, symbol: str, signal_data: Dict):
         """开始跟踪一个活跃信号"""
         self.active_tracking[symbol] = {
-            "start_time": datetime.now().isoformat(),
+            "start_time": self._now().isoformat(),
             "initial_data": signal_data,
-            "last_check": datetime.now().isoformat(),
+            "last_check": self._now().isoformat(),
             "phase": "PHASE_1_2",
             "check_count": 0
         }
         log(f"开始跟踪信号: {symbol}", "INFO")
     
-    def update_tracking(self):
-        """更新所有活跃信号的跟踪状态"""
+    def update_tracking(self, cycle: Optional["CycleSnapshot"] = None):
+        """
+        更新所有活跃信号的跟踪状态 (每周期在主扫描之后执行)
+        数据取自本周期快照，只补取主扫描没有取过的序列；新取到的OI写入历史后再判断阶段5
+        cycle: 快速跟踪任务传入自己的快照，不影响扫描周期的快照
+        """
         symbols_to_remove = []
+        tracked = list(self.active_tracking)
+        now = self.clock()
+        
+        # 增量取数: 主扫描已取过的直接命中周期快照
+        global_ls_map, oi_map = {}, {}
+        for symbol in tracked:
+            try:
+                global_ls_map[symbol] = self.binance.get_global_long_short_ratio(symbol, cycle=cycle)
+                oi_map[symbol] = self.binance.get_open_interest(symbol, cycle=cycle)
+            except Exception as e:
+                log(f"跟踪信号 {symbol} 取数失败: {e}", "ERROR")
+        
+        # 最新OI写入历史 (同一时间桶内重复写入只是覆盖)，再一次向量化算出峰值/最新值
+        fresh = [symbol for symbol in tracked if oi_map.get(symbol)]
+        if fresh:
+            self.binance.oi_history.append_many(fresh, [oi_map[symbol] for symbol in fresh], ts=now)
+        oi_peaks, oi_lasts, oi_counts = self.binance.oi_history.peak_and_last(tracked, now=now)
+        # 按币种取结果，不依赖 active_tracking 的遍历顺序
+        oi_stats = {
+            symbol: (float(peak), float(last), int(count))
+            for symbol, peak, last, count in zip(tracked, oi_peaks, oi_lasts, oi_counts)
+        }
         
-        for symbol, tracking_data in self.active_tracking.items():
+        for symbol in tracked:
+            tracking_data = self.active_tracking.get(symbol)
+            if tracking_data is None:
+                continue
             try:
+                # 检查是否进入阶段3: 价格突破区间高点 (需要流式行情)
+                table = self.binance.market_table
+                if table is not None and tracking_data["phase"] == "PHASE_1_2":
+                    breakout = table.breakout(symbol)
+                    if breakout:
+                        tracking_data["phase"] = "PHASE_3"
+                        tracking_data["phase3_start"] = self._now().isoformat()
+                        
+                        breakout_msg = (
+                            f"🚀 *信号阶段更新: {symbol}*\n"
+                            f"══════════════════════\n"
+                            f"• 进入 **阶段3**: 价格突破\n"
+                            f"• 最新价: `{breakout['price']:.6g}`\n"
+                            f"• 近{Config.BREAKOUT_LOOKBACK_SECONDS // 60}分钟高点: `{breakout['range_high']:.6g}`\n"
+                            f"• 突破幅度: `{breakout['pct']:.2f}%`\n"
+                            f"• 时间: {self._now().strftime('%H:%M:%S')}\n"
+                            f"══════════════════════\n"
+                            f"📈 策略进展: 庄家开始拉盘，关注多空比变化。"
+                        )
+                        
+                        if self.notify(breakout_msg):
+                            log(f"阶段更新已入队: {symbol} 进入阶段3", "INFO")
+                
                 # 检查是否进入阶段4: Long/Short Ratio减少
-                global_ls = self.binance.get_global_long_short_ratio(symbol)
+                global_ls = global_ls_map.get(symbol)
                 
                 if global_ls and global_ls.get("trend") == "下降":
-                    if tracking_data["phase"] == "PHASE_1_2":
+                    if tracking_data["phase"] in ("PHASE_1_2", "PHASE_3"):
                         # 进入阶段4
                         tracking_data["phase"] = "PHASE_4"
-                        tracking_data["phase4_start"] = datetime.now().isoformat()
+                        tracking_data["phase4_start"] = self._now().isoformat()
                         
                         # 发送阶段更新通知
                         update_msg = (
@@ -731,53 +2904,47 @@ class SqueezeSignalAnalyzer:
                             f"• 进入 **阶段4**: Long/Short Ratio开始减少\n"
                             f"• 散户空头比例: `{global_ls['short_account']*100:.1f}%`\n"
                             f"• 多空比趋势: `{global_ls['trend']}`\n"
-                            f"• 时间: {datetime.now().strftime('%H:%M:%S')}\n"
+                            f"• 时间: {self._now().strftime('%H:%M:%S')}\n"
                             f"══════════════════════\n"
                             f"📈 策略进展: 散户开始被止损/清算，轧空可能正在进行中。"
                         )
                         
-                        if send_telegram(update_msg):
-                            log(f"发送阶段更新: {symbol} 进入阶段4", "INFO")
+                        if self.notify(update_msg):
+                            log(f"阶段更新已入队: {symbol} 进入阶段4", "INFO")
                 
                 # 检查是否进入阶段5: OI减少，费率回归正常
-                current_oi = self.binance.get_open_interest(symbol)
-                if current_oi and symbol in self.binance.oi_history:
-                    history = list(self.binance.oi_history[symbol])
-                    if len(history) >= 3:
-                        # 检查OI是否从峰值下降超过15%
-                        oi_peak = max(history[-5:] if len(history) >= 5 else history)
-                        oi_current = history[-1]
-                        
-                        if oi_current < oi_peak * 0.85:  # 下降超过15%
-                            # 这里可以添加费率检查
-                            tracking_data["phase"] = "PHASE_5"
-                            tracking_data["phase5_start"] = datetime.now().isoformat()
-                            
-                            # 发送结束预警
-                            end_msg = (
-                                f"⚠️ *轧空可能接近尾声: {symbol}*\n"
-                                f"══════════════════════\n"
-                                f"• 进入 **阶段5**: OI开始减少\n"
-                                f"• OI峰值: `{oi_peak:,.0f}`\n"
-                                f"• OI当前: `{oi_current:,.0f}`\n"
-                                f"• 下降幅度: `{(1 - oi_current/oi_peak)*100:.1f}%`\n"
-                                f"• 时间: {datetime.now().strftime('%H:%M:%S')}\n"
-                                f"══════════════════════\n"
-                                f"📉 策略提示: 庄家可能正在退出，注意风险。"
-                            )
-                            
-                            if send_telegram(end_msg):
-                                log(f"发送结束预警: {symbol} 进入阶段5", "INFO")
-                            
-                            # 标记为待移除（跟踪结束）
-                            symbols_to_remove.append(symbol)
+                current_oi = oi_map.get(symbol)
+                oi_peak, oi_current, oi_count = oi_stats[symbol]
+                # 检查OI是否从峰值下降超过15%
+                if current_oi and oi_count >= 3 and oi_current < oi_peak * 0.85:
+                    tracking_data["phase"] = "PHASE_5"
+                    tracking_data["phase5_start"] = self._now().isoformat()
+                    
+                    # 发送结束预警
+                    end_msg = (
+                        f"⚠️ *轧空可能接近尾声: {symbol}*\n"
+                        f"══════════════════════\n"
+                        f"• 进入 **阶段5**: OI开始减少\n"
+                        f"• OI峰值: `{oi_peak:,.0f}`\n"
+                        f"• OI当前: `{oi_current:,.0f}`\n"
+                        f"• 下降幅度: `{(1 - oi_current/oi_peak)*100:.1f}%`\n"
+                        f"• 时间: {self._now().strftime('%H:%M:%S')}\n"
+                        f"══════════════════════\n"
+                        f"📉 策略提示: 庄家可能正在退出，注意风险。"
+                    )
+                    
+                    if self.notify(end_msg):
+                        log(f"结束预警已入队: {symbol} 进入阶段5", "INFO")
+                    
+                    # 标记为待移除（跟踪结束）
+                    symbols_to_remove.append(symbol)
                 
                 tracking_data["check_count"] += 1
-                tracking_data["last_check"] = datetime.now().isoformat()
+                tracking_data["last_check"] = self._now().isoformat()
                 
                 # 如果跟踪超过24小时，自动结束
                 start_time = datetime.fromisoformat(tracking_data["start_time"])
-                if datetime.now() - start_time > timedelta(hours=24):
+                if self._now() - start_time > timedelta(hours=24):
                     symbols_to_remove.append(symbol)
                     
             except Exception as e:
@@ -789,25 +2956,520 @@ class SqueezeSignalAnalyzer:
                 del self.active_tracking[symbol]
                 log(f"结束跟踪信号: {symbol}", "INFO")
 
+# ==================== 分级筛选 ====================
+class ScanPlanner:
+    """
+    自适应扫描排期: 每周期对全部候选计算优先级，在请求预算内从高到低选取
+    优先级 = 费率强度 + 上次OI激增比强度 + 陈旧度 (按 SCAN_PRIORITY_WEIGHTS 加权，每项不超过 SCAN_PRIORITY_CAP)
+    - 费率强度: 费率 / 阈值 (刚过阈值为1)
+    - 激增比强度: (上次激增比 - 1) / (OI_SURGE_RATIO - 1)，刚达到核心条件为1，从未扫描过按1计
+    - 陈旧度: 距上次扫描的周期数
+    没选上的币种陈旧度逐周期增加，尾部候选在后续周期轮转覆盖
+    预算按请求数计: 先扣除跟踪更新必发的请求，每个币种再按 OI(+回填) + 通过率 × 增强请求数 估算
+    """
+    
+    def __init__(self, analyzer: "SqueezeSignalAnalyzer", clock=time.time):
+        self.analyzer = analyzer
+        self.binance = analyzer.binance
+        self.clock = clock
+        self.seen = {}  # {symbol: (上次扫描时间, 上次OI激增比)}
+        self.spent = 0.0  # 本周期预计请求数
+        self.pass_rate = Config.SCAN_PASS_RATE_PRIOR  # 近期核心条件通过率 (指数平滑)
+        self._lock = threading.Lock()
+    
+    def state(self) -> Dict[str, Tuple[float, Optional[float]]]:
+        with self._lock:
+            return dict(self.seen)
+    
+    def restore(self, seen: Dict[str, Tuple[float, Optional[float]]]):
+        with self._lock:
+            self.seen.update(seen)
+    
+    def mark(self, symbol: str, surge_ratio: Optional[float], now: Optional[float] = None):
+        """币种已完成OI筛选 (取OI失败也计为已扫描，避免每周期反复重试)"""
+        with self._lock:
+            self.seen[symbol] = (now if now is not None else self.clock(), surge_ratio)
+    
+    def observe(self, screened: int, passed: int):
+        """本周期OI筛选结束后更新核心条件通过率"""
+        if screened:
+            alpha = Config.SCAN_PASS_RATE_ALPHA
+            self.pass_rate = (1 - alpha) * self.pass_rate + alpha * passed / screened
+    
+    def priorities(self, symbols: List[Dict], now: float) -> np.ndarray:
+        weights = Config.SCAN_PRIORITY_WEIGHTS
+        cap = Config.SCAN_PRIORITY_CAP
+        with self._lock:
+            entries = [self.seen.get(item["symbol"]) for item in symbols]
+        
+        n = len(symbols)
+        funding = np.fromiter((item["funding_rate"] for item in symbols), np.float64, n)
+        last_scan = np.fromiter((entry[0] if entry else np.nan for entry in entries), np.float64, n)
+        surge = np.fromiter((entry[1] if entry and entry[1] is not None else np.nan for entry in entries), np.float64, n)
+        
+        funding_term = funding / Config.FUNDING_RATE_THRESHOLD
+        surge_term = np.nan_to_num((surge - 1) / (Config.OI_SURGE_RATIO - 1), nan=1.0)
+        staleness = np.nan_to_num((now - last_scan) / Config.SCAN_INTERVAL_SECONDS, nan=cap)
+        return (weights["funding"] * np.clip(funding_term, 0, cap)
+                + weights["surge"] * np.clip(surge_term, 0, cap)
+                + weights["staleness"] * np.clip(staleness, 0, cap))
+    
+    def tracking_cost(self, now: float) -> int:
+        """跟踪更新本周期必发的请求: 每个跟踪中的币种 OI + 全平台多空比 (已有快照/缓存的不计)"""
+        global_ls = self.binance.ratio_caches["global_ls"]
+        return sum(
+            (not self.binance.cycle.has("oi", symbol)) + (not global_ls.fresh(symbol, now))
+            for symbol in list(self.analyzer.active_tracking)
+        )
+    
+    def enrich_cost(self, symbol: str, now: float) -> int:
+        """通过核心条件后的增强请求数: 主动买卖比/全平台多空比/大户多空比中没有缓存的，加跨交易所OI"""
+        caches = [self.analyzer.coinglass.taker_cache, self.binance.ratio_caches["top_ls"]]
+        if symbol not in self.analyzer.active_tracking:  # 跟踪中的币种多空比已计入 tracking_cost
+            caches.append(self.binance.ratio_caches["global_ls"])
+        return sum(not cache.fresh(symbol, now) for cache in caches) + len(self.binance.cross_oi.clients)
+    
+    def cost(self, symbol: str, now: float) -> int:
+        """
+        OI筛选的请求数: 本周期已有OI或正在跟踪 (OI已计入 tracking_cost，与扫描共用周期快照) 为0，
+        否则1次OI，需要回填历史时另加1次
+        """
+        if self.binance.cycle.has("oi", symbol) or symbol in self.analyzer.active_tracking:
+            return 0
+        return 1 + self.binance.backfill_pending(symbol, now)
+    
+    def select(self, symbols: Iterable[Dict], budget: int,
+               on_skip: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """
+        流式按块计算优先级，按优先级从高到低在预算内选取，返回选中列表；跳过的逐个回调 on_skip
+        每个要取OI的币种至少花1次请求，选中数不超过预算，所以只用容量为预算的最小堆保留优先级最高的，
+        被挤出的当场跳过；OI已付费 (跟踪中/本周期已有) 的币种数由现有状态限定，单独保留。
+        最终在这些币种上按优先级贪心: 预算放不下的跳过 (后面更便宜的仍可放入)
+        每个币种的预计请求 = OI筛选 + 通过率 × 增强请求 (预计通过数达到 MAX_ENRICH_PER_CYCLE 后不再计增强)
+        """
+        now = self.clock()
+        self.spent = float(self.tracking_cost(now))
+        self._prune(now)
+        skip = on_skip or (lambda item: None)
+        capacity = max(0, int(budget))
+        
+        heap, prepaid = [], []  # 堆: (优先级, -序号, 币种)，优先级相同时先到的优先
+        seq = 0
+        iterator = iter(symbols)
+        while True:
+            chunk = list(itertools.islice(iterator, Config.SCREEN_CHUNK_SIZE))
+            if not chunk:
+                break
+            for item, priority in zip(chunk, self.priorities(chunk, now)):
+                entry = (float(priority), -seq, item)
+                seq += 1
+                if self.cost(item["symbol"], now) == 0:
+                    prepaid.append(entry)
+                elif len(heap) < capacity:
+                    heapq.heappush(heap, entry)
+                elif capacity and entry[:2] > heap[0][:2]:
+                    skip(heapq.heapreplace(heap, entry)[2])
+                else:
+                    skip(item)
+        
+        selected = []
+        expected_core = 0.0
+        for _, _, item in sorted(heap + prepaid, key=lambda entry: entry[:2], reverse=True):
+            cost = self.cost(item["symbol"], now)
+            if expected_core < Config.MAX_ENRICH_PER_CYCLE:
+                cost += self.pass_rate * self.enrich_cost(item["symbol"], now)
+            if self.spent + cost <= budget:
+                self.spent += cost
+                expected_core += self.pass_rate
+                selected.append(item)
+            else:
+                skip(item)
+        return selected
+    
+    def _prune(self, now: float):
+        """超过陈旧度上限的记录与从未扫描等价，清除以免已下架/转正费率的币种堆积"""
+        horizon = Config.SCAN_PRIORITY_CAP * Config.SCAN_INTERVAL_SECONDS
+        with self._lock:
+            for symbol in [symbol for symbol, (ts, _) in self.seen.items() if now - ts > horizon]:
+                del self.seen[symbol]
+
+
+class ScreeningPipeline:
+    """
+    先廉价后昂贵的分级筛选，每一级都提前淘汰，只有幸存者进入下一级:
+    1. 批量初筛: 按块对行情快照做向量化比较 (费率/成交量/指数合约)，不发任何请求
+    2. OI筛选: ScanPlanner 在请求预算内按优先级排期，有界并发获取OI并计算激增比，只保留满足核心条件的币种
+    3. 增强: 按核心强度保留前 MAX_ENRICH_PER_CYCLE 个，并发获取主动买卖比/多空比并评分
+    1、2 级是生成器，在途请求只与并发数有关；排期逐块消费初筛结果，只保留预算大小的最小堆和已付费的跟踪币种
+    """
+    
+    def __init__(self, analyzer: SqueezeSignalAnalyzer):
+        self.analyzer = analyzer
+        self.binance = analyzer.binance
+        self.planner = ScanPlanner(analyzer)
+        self.counts = {}  # 本次各级的通过数 {级名: 数量}
+    
+    def _record(self, symbol_data: Dict, state: Optional[Dict] = None):
+        """记录模式: 被淘汰的候选也保存快照"""
+        if self.binance.snapshot_series:
+            self.analyzer.record_candidate(symbol_data, state)
+    
+    def bulk_filter(self, symbols: Iterable[Dict], chunk_size: int) -> Iterator[Dict]:
+        """
+        第1级: 用本周期行情快照按块过滤费率不足、24h成交量不足和指数合约 (零额外请求)
+        快照中缺失的币种保留，交由逐个获取兜底
+        """
+        market = self.binance.cycle.market or {}
+        iterator = iter(symbols)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            
+            rows = [market.get(item["symbol"]) for item in chunk]
+            funding = np.fromiter((item["funding_rate"] for item in chunk), np.float64, len(chunk))
+            volume = np.fromiter((row["volume_24h"] if row else np.inf for row in rows), np.float64, len(chunk))
+            index = np.fromiter(("INDEX" in item["symbol"] for item in chunk), bool, len(chunk))  # 不查 ALLINDEXUSDT
+            keep = (funding < Config.FUNDING_RATE_THRESHOLD) & (volume >= Config.MIN_VOLUME_USD) & ~index
+            
+            for item, kept in zip(chunk, keep):
+                if kept:
+                    self.counts["bulk"] += 1
+                    yield item
+                else:
+                    self._record(item)
+    
+    def plan(self, symbols: Iterable[Dict], budget: int) -> Iterator[Dict]:
+        """按优先级在预算内排期，高优先级先发请求；本周期跳过的仅在记录模式下保存快照 (排期只保留有界的候选)"""
+        selected = self.planner.select(symbols, budget, on_skip=self._record)
+        self.counts["planned"] = len(selected)
+        yield from selected
+    
+    def _screen_one(self, symbol_data: Dict) -> Tuple[Dict, Optional[Dict], Dict]:
+        """工作线程: 第2级单个币种 (异常不外抛，保证其他币种继续)"""
+        state = {}
+        try:
+            candidate = self.analyzer.screen_candidate(symbol_data, state)
+        except Exception as e:
+            log(f"分析 {symbol_data['symbol']} 失败: {e}", "ERROR")
+            candidate = None
+        return symbol_data, candidate, state
+    
+    def screen(self, symbols: Iterable[Dict], workers: int) -> Iterator[Tuple[Dict, Optional[Dict], Dict]]:
+        """
+        第2级: 有界并发获取OI (同时在途不超过 workers*2 个币种)，按完成顺序产出
+        (symbol_data, 候选或None, state)
+        """
+        if workers <= 1:
+            yield from map(self._screen_one, symbols)
+            return
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screen") as executor:
+            pending = set()
+            for symbol_data in symbols:
+                pending.add(executor.submit(self._screen_one, symbol_data))
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+    
+    @staticmethod
+    def priority(candidate: Dict) -> float:
+        """核心强度: OI激增比 × 负费率幅度，只用廉价阶段已有的数据"""
+        return candidate["oi_surge_ratio"] * -candidate["symbol_data"]["funding_rate"]
+    
+    def _enrich_one(self, entry: Tuple[Dict, Dict]) -> Optional[Dict]:
+        """工作线程: 第3级单个币种"""
+        candidate, state = entry
+        symbol_data = candidate["symbol_data"]
+        try:
+            return self.analyzer.enrich_candidate(candidate, state)
+        except Exception as e:
+            log(f"分析 {symbol_data['symbol']} 失败: {e}", "ERROR")
+            return None
+        finally:
+            self._record(symbol_data, state)
+    
+    def run(self, symbols: Iterable[Dict], on_evaluated: Optional[Callable[[str], None]] = None) -> List[Dict]:
+        """
+        执行三级筛选，返回信号列表 (按费率升序，保证信号记录和冷却表的合并顺序确定)
+        on_evaluated: 每个完成OI筛选的币种回调一次 (调用方线程)
+        """
+        workers = Config.SCAN_WORKERS
+        max_enrich = Config.MAX_ENRICH_PER_CYCLE
+        self.counts = {"bulk": 0, "planned": 0, "screened": 0, "core": 0, "enriched": 0}
+        
+        # 第1、2级流式执行，幸存者进入容量为 max_enrich 的最小堆，被挤出的只记录快照
+        survivors = []
+        stream = self.plan(self.bulk_filter(symbols, Config.SCREEN_CHUNK_SIZE), Config.SCAN_REQUEST_BUDGET)
+        for seq, (symbol_data, candidate, state) in enumerate(self.screen(stream, workers)):
+            self.counts["screened"] += 1
+            self.planner.mark(symbol_data["symbol"], state.get("oi_surge_ratio"))
+            if on_evaluated:
+                on_evaluated(symbol_data["symbol"])
+            if not candidate:
+                self._record(symbol_data, state)
+                continue
+            
+            self.counts["core"] += 1
+            entry = (self.priority(candidate), seq, (candidate, state))
+            if len(survivors) < max_enrich:
+                heapq.heappush(survivors, entry)
+            else:
+                dropped = heapq.heappushpop(survivors, entry)
+                self._record(dropped[2][0]["symbol_data"], dropped[2][1])
+        
+        self.planner.observe(self.counts["screened"], self.counts["core"])
+        
+        # 第3级: 只为幸存者并发获取增强指标
+        entries = [entry for _, _, entry in survivors]
+        self.counts["enriched"] = len(entries)
+        if workers <= 1 or len(entries) <= 1:
+            results = [self._enrich_one(entry) for entry in entries]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as executor:
+                results = list(executor.map(self._enrich_one, entries))
+        
+        signals = [signal_data for signal_data in results if signal_data]
+        signals.sort(key=lambda signal_data: (signal_data["core_indicators"]["funding_rate"], signal_data["symbol"]))
+        return signals
+    
+    def summary(self) -> str:
+        counts = self.counts
+        return (f"初筛 {counts['bulk']} -> 排期 {counts['planned']} (预计请求 {self.planner.spent:.0f}/"
+                f"{Config.SCAN_REQUEST_BUDGET}) -> OI筛选 {counts['screened']} -> "
+                f"核心条件 {counts['core']} -> 增强 {counts['enriched']}")
+
+
+# ==================== 任务调度 ====================
+class ScheduledJob:
+    """
+    定时任务
+    按计划时间累加排期 (不随执行耗时漂移)，每次附加随机抖动；
+    每次执行的截止时间为计划时间 + 间隔，超过即计入超时。落后整轮时跳过错过的轮次，不补跑
+    """
+    
+    def __init__(self, name: str, func: Callable[[], Any], interval: float,
+                 jitter: float = Config.SCHEDULER_JITTER):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.planned = None  # 当前轮次的计划时间 (不含抖动)，None 表示立即执行
+        self.next_run = 0.0
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+    
+    def due(self, now: float) -> bool:
+        return now >= self.next_run
+    
+    def run(self):
+        """执行一次并排下一轮"""
+        started = time.time()
+        planned = started if self.planned is None else self.planned
+        deadline = planned + self.interval
+        
+        try:
+            self.func()
+        except Exception as e:
+            self.failures += 1
+            log(f"任务 {self.name} 异常: {e}", "ERROR")
+        
+        finished = time.time()
+        self.runs += 1
+        self.last_duration = finished - started
+        self.total_duration += self.last_duration
+        if finished > deadline:
+            self.overruns += 1
+            log(f"任务 {self.name} 超时: 用时 {self.last_duration:.1f}秒, "
+                f"超出截止时间 {finished - deadline:.1f}秒 (累计 {self.overruns} 次)", "WARN")
+        
+        self.schedule(planned + self.interval, finished)
+    
+    def schedule(self, planned: float, now: float):
+        """排到 planned (加抖动)；planned 已落后一整轮以上时跳到最近的一轮"""
+        behind = now - planned
+        if behind >= self.interval:
+            missed = int(behind // self.interval)
+            self.skipped += missed
+            planned += missed * self.interval
+        
+        self.planned = planned
+        offset = random.uniform(-self.jitter, self.jitter) * self.interval
+        self.next_run = max(now, planned + offset)
+    
+    def postpone(self, now: Optional[float] = None):
+        """本轮的工作已由其他任务完成，从现在起重新计时"""
+        now = time.time() if now is None else now
+        self.schedule(now + self.interval, now)
+    
+    def summary(self) -> str:
+        avg = self.total_duration / self.runs if self.runs else 0
+        return (f"{self.name}: 运行 {self.runs} 次, 平均 {avg:.1f}秒, "
+                f"超时 {self.overruns} 次, 跳过 {self.skipped} 轮, 异常 {self.failures} 次")
+
+class Scheduler:
+    """单线程调度器: 到期任务按计划时间先后依次执行，任务之间不并发"""
+    
+    def __init__(self):
+        self.jobs = []
+    
+    def add(self, job: ScheduledJob) -> ScheduledJob:
+        self.jobs.append(job)
+        return job
+    
+    def run_pending(self) -> float:
+        """执行所有到期任务，返回距下一个任务到期的秒数"""
+        for job in sorted(self.jobs, key=lambda job: job.next_run):
+            if job.due(time.time()):
+                job.run()
+        return max(0.0, min(job.next_run for job in self.jobs) - time.time())
+
 # ==================== 主监控引擎 ====================
 class SqueezeMonitor:
     """主监控引擎 - 协调所有组件"""
     
-    def __init__(self):
+    def __init__(self, shard: Optional[Tuple[int, int]] = None, link: Optional["CoordinatorLink"] = None,
+                 signal_store: Optional[SignalLogStore] = None):
         self.coinglass = CoinglassClient()
         self.binance = BinanceDataClient()
-        self.analyzer = SqueezeSignalAnalyzer(self.coinglass, self.binance)
+        self.analyzer = SqueezeSignalAnalyzer(self.coinglass, self.binance, signal_store=signal_store)
+        self.pipeline = ScreeningPipeline(self.analyzer)
+        
+        # 分片模式: shard=(分片号, 分片数)，只分析哈希环分到本分片的币种；通知和信号记录经 link 交给协调进程
+        self.shard = shard
+        self.ring = HashRing(shard[1]) if shard else None
+        self.link = link
+        if link:
+            self.analyzer.notify = link.notify
+        
+        # Telegram复用币安客户端的连接池
+        telegram_dispatcher.session = self.binance.http
+        
+        # 流式行情 (可选): 费率初筛、成交量过滤和阶段3突破判断改用内存行情表
+        self.stream = create_market_stream()
+        if self.stream:
+            self.binance.market_table = self.stream.table
+        
+        # 事件驱动评估 (需要流式行情): 行情/OI变化超过阈值时在秒级内重评单个币种
+        # 事件线程与调度任务并发，修改冷却/跟踪状态时持有 _state_lock
+        self._state_lock = threading.RLock()
+        self.events = None
+        if self.stream and Config.EVENT_DRIVEN:
+            self.events = SignalEventEngine(self.evaluate_event)
+            self.stream.table.listeners.append(self._on_market_updates)
+            self.binance.oi_listeners.append(lambda symbol, oi: self.events.observe(symbol, oi=oi))
+            self.events.start()
         
         self.scan_count = 0
         self.total_signals_found = 0
         
+        # 热启动: 从检查点恢复冷却、跟踪、OI历史和响应缓存
+        self.checkpoint = CheckpointStore(
+            os.path.join(Config.DATA_DIR, f"state_shard{shard[0]}.pkl") if shard else Config.CHECKPOINT_FILE)
+        self.restore_checkpoint()
+        
+        # 发现扫描 (慢) 与跟踪轮询 (快) 各自独立排期，检查点定期落盘
+        self.scheduler = Scheduler()
+        self.discovery_job = self.scheduler.add(
+            ScheduledJob("discovery", self.run_scan_cycle, Config.SCAN_INTERVAL_SECONDS))
+        self.tracking_job = self.scheduler.add(
+            ScheduledJob("tracking", self.run_tracking_cycle, Config.TRACKING_INTERVAL_SECONDS))
+        self.checkpoint_job = self.scheduler.add(
+            ScheduledJob("checkpoint", self.save_checkpoint, Config.CHECKPOINT_INTERVAL_SECONDS))
+        self.summary_job = self.scheduler.add(
+            ScheduledJob("summary", self.print_summary, Config.SUMMARY_INTERVAL_SECONDS))
+        
+        # 指标端点 (Prometheus 文本格式)
+        self.metrics_server = None
+        if Config.METRICS_PORT:
+            self.metrics_server = MetricsServer(metrics, port=Config.METRICS_PORT)
+            self.metrics_server.start()
+        
         log("监控引擎初始化完成", "SUCCESS")
     
+    def owns(self, symbol: str) -> bool:
+        """币种是否归本进程分析 (非分片模式总是 True)"""
+        return self.ring is None or self.ring.owner(symbol) == self.shard[0]
+    
+    def report_tracking(self):
+        """分片模式: 把本分片的跟踪摘要发给协调进程"""
+        if not self.link:
+            return
+        with self._state_lock:
+            active = {
+                symbol: {"phase": data.get("phase"), "start_time": data["start_time"],
+                         "score": data.get("initial_data", {}).get("score")}
+                for symbol, data in self.analyzer.active_tracking.items()
+            }
+        self.link.send("tracking", active=active)
+    
+    def response_caches(self) -> List[PeriodCache]:
+        return [self.coinglass.taker_cache, *self.binance.ratio_caches.values()]
+    
+    def save_checkpoint(self):
+        """保存运行状态检查点 (状态在锁内复制，落盘在锁外)"""
+        started = time.time()
+        try:
+            with self._state_lock:
+                state = {
+                    "scan_count": self.scan_count,
+                    "total_signals_found": self.total_signals_found,
+                    "analyzer": self.analyzer.state(),
+                    "oi_history": self.binance.oi_history.state(),
+                    "scan_planner": self.pipeline.planner.state(),
+                    "caches": {cache.name: cache.state() for cache in self.response_caches()},
+                }
+            with metrics.stage("persistence"):
+                size = self.checkpoint.save(state)
+            log(f"检查点已保存 ({size / 1024:.0f}KB, {(time.time() - started) * 1000:.0f}ms)", "DEBUG")
+        except Exception as e:
+            log(f"保存检查点失败: {e}", "WARN")
+    
+    def restore_checkpoint(self):
+        """启动时恢复检查点；没有可用检查点时保持冷启动 (OI历史仍从旧格式文件读取)"""
+        started = time.time()
+        state = self.checkpoint.load()
+        if not state:
+            return
+        
+        self.scan_count = state.get("scan_count", 0)
+        self.total_signals_found = state.get("total_signals_found", 0)
+        self.analyzer.restore_state(state.get("analyzer", {}))
+        self.pipeline.planner.restore(state.get("scan_planner", {}))
+        
+        try:
+            self.binance.oi_history = OIHistoryBuffer.from_state(state["oi_history"])
+        except (KeyError, ValueError) as e:
+            log(f"检查点中的OI历史不可用: {e}", "WARN")
+        
+        cached = 0
+        entries = state.get("caches", {})
+        for cache in self.response_caches():
+            cached += cache.restore(entries.get(cache.name, []))
+        
+        log(f"已从检查点恢复: {len(self.analyzer.active_tracking)} 个跟踪信号, "
+            f"{len(self.analyzer.alert_cooldown)} 个冷却, {len(self.binance.oi_history)} 个币种OI历史, "
+            f"{cached} 条缓存响应 ({(time.time() - started) * 1000:.0f}ms)", "SUCCESS")
+    
     def test_apis(self) -> bool:
-        """测试所有API连接"""
+        """测试所有API连接 (Telegram 与币安并行)"""
         log("测试API连接...", "INFO")
-        
-        # 测试Telegram
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            telegram = pool.submit(self._test_telegram)
+            binance = pool.submit(self._test_binance)
+            telegram.result()
+            return binance.result()
+    
+    def _test_telegram(self):
+        if self.link:
+            return  # 分片模式只由协调进程发送Telegram
         if Config.TELEGRAM_TOKEN and Config.TELEGRAM_CHAT_ID:
             test_msg = (
                 "🤖 *轧空监控机器人启动测试*\n\n"
@@ -817,16 +3479,16 @@ class SqueezeMonitor:
                 "✅ 如果收到此消息，说明Telegram通知功能正常。"
             )
             
-            if send_telegram(test_msg):
+            if send_telegram(test_msg, self.binance.http):
                 log("✅ Telegram测试通知已发送", "SUCCESS")
             else:
                 log("⚠️ Telegram测试发送失败", "WARN")
         else:
             log("⚠️ Telegram配置缺失，通知功能禁用", "WARN")
-        
-        # 测试币安连接
+    
+    def _test_binance(self) -> bool:
         try:
-            ticker = self.binance.exchange.fetch_ticker('BTCUSDT')
+            ticker = self.binance._ccxt_call("fetch_ticker", 'BTCUSDT')
             log(f"✅ 币安API连接正常 | BTC: ${ticker['last']:.2f}", "SUCCESS")
             return True
         except Exception as e:
@@ -841,90 +3503,155 @@ class SqueezeMonitor:
         
         signals_found = 0
         
-        # 步骤1: 获取负费率币种 (Coinglass)
-        negative_symbols = self.coinglass.get_negative_funding_symbols()
+        with metrics.stage("discovery"):
+            # 步骤1: 获取负费率币种 (流式行情新鲜时读内存表；分片模式向协调进程取，所有分片共用一次Coinglass请求；否则请求Coinglass)
+            table = self.binance.market_table
+            if table is not None and table.is_fresh():
+                negative_symbols = table.negative_funding(Config.FUNDING_RATE_THRESHOLD)
+                log(f"流式行情: 发现 {len(negative_symbols)} 个负费率币种", "INFO")
+            else:
+                negative_symbols = self.link.funding_symbols() if self.link else None
+                if negative_symbols is None:
+                    negative_symbols = self.coinglass.get_negative_funding_symbols()
+            if self.ring:
+                negative_symbols = [item for item in negative_symbols if self.owns(item["symbol"])]
+                log(f"分片 {self.shard[0]}/{self.shard[1]}: 本分片 {len(negative_symbols)} 个币种", "INFO")
+            
+            # 批量行情快照 (一次请求或流式内存表)，同时开启本周期的数据快照
+            self.binance.refresh_market_snapshot()
         
         if not negative_symbols:
             log("当前市场无符合负费率条件的币种", "INFO")
             # 仍然更新跟踪中的信号
-            self.analyzer.update_tracking()
+            with self._state_lock, metrics.stage("tracking"):
+                self.analyzer.update_tracking()
+            self.tracking_job.postpone()
+            self.report_tracking()
             return
         
-        # 限制分析数量
-        symbols_to_analyze = negative_symbols[:Config.MAX_SYMBOLS_TO_ANALYZE]
-        log(f"分析 {len(symbols_to_analyze)} 个币种...", "INFO")
-        
-        # 步骤2: 分析每个币种
-        for i, symbol_data in enumerate(symbols_to_analyze):
-            symbol = symbol_data["symbol"]
-            # 二次过滤，确保不查 ALLINDEXUSDT
-            if "INDEX" in symbol:
-                 continue
-            
-            # 显示进度
-            if (i + 1) % 5 == 0:
-                log(f"分析进度: {i+1}/{len(symbols_to_analyze)}", "INFO")
+        # 步骤2: 分级筛选 (批量初筛 -> 并发OI筛选 -> 最强的幸存者并发获取增强指标)
+        log(f"筛选 {len(negative_symbols)} 个候选 (并发 {Config.SCAN_WORKERS})...", "INFO")
+        with metrics.stage("analysis"):
+            signals = self.pipeline.run(negative_symbols, on_evaluated=self.mark_evaluated if self.events else None)
+        self.analyzer.prune_enhanced_cache()
+        log(f"分级筛选: {len(negative_symbols)} -> {self.pipeline.summary()}", "INFO")
+        
+        with self._state_lock:
+            for signal_data in signals:
+                signals_found += 1
+                self.process_signal(signal_data)
             
-            try:
-                # 分析轧空潜力
-                signal_data = self.analyzer.analyze_squeeze_potential(symbol_data)
-                
-                if signal_data:
-                    signals_found += 1
-                    score = signal_data["score"]
-                    
-                    log(f"发现信号: {symbol} ({score}分)", "ALERT")
-                    
-                    # 检查冷却时间
-                    if self.analyzer.check_alert_cooldown(symbol, score):
-                        # 发送Telegram警报
-                        telegram_msg = self.analyzer.format_telegram_message(signal_data)
-                        
-                        if send_telegram(telegram_msg):
-                            log(f"Telegram警报已发送: {symbol}", "SUCCESS")
-                        
-                        # 记录信号
-                        self.analyzer.signals_log.append(signal_data)
-                        self.analyzer.save_signals_log()
-                        
-                        # 开始跟踪这个信号
-                        self.analyzer.track_active_signal(symbol, signal_data)
-                    
-                    self.total_signals_found += 1
-                
-                # 避免请求过快
-                time.sleep(0.5)
-                
-            except Exception as e:
-                log(f"分析 {symbol} 失败: {e}", "ERROR")
-                continue
+            # 步骤3: 更新所有活跃信号的跟踪状态 (复用本周期快照，只补取缺失的数据)
+            with metrics.stage("tracking"):
+                self.analyzer.update_tracking()
+        self.tracking_job.postpone()  # 本周期已跟踪过，快速跟踪任务从现在重新计时
+        cycle = self.binance.cycle
+        log(f"周期快照: 命中 {cycle.hits} 次, 请求 {cycle.misses} 次", "DEBUG")
         
-        # 步骤3: 更新所有活跃信号的跟踪状态
-        self.analyzer.update_tracking()
-        
-        # 步骤4: 保存OI历史数据
-        self.binance.save_oi_history()
+        # 步骤4: 保存本周期的时序数据 (OI历史随检查点落盘)
+        with metrics.stage("persistence"):
+            self.binance.flush_series()
         
         # 完成扫描
         elapsed = time.time() - start_time
+        metrics.inc("signals_total", signals_found)
+        metrics.set("active_tracking", len(self.analyzer.active_tracking))
+        self.report_tracking()
         log(f"扫描完成 ({elapsed:.1f}秒)", "INFO")
         log(f"本次发现信号: {signals_found}个 | 历史总信号: {self.total_signals_found}个", "STATS")
+    
+    def process_signal(self, signal_data: Dict):
+        """合并一个信号: 冷却检查 -> 通知 -> 记录 -> 开始跟踪 (调用方持有 _state_lock)"""
+        symbol = signal_data["symbol"]
+        score = signal_data["score"]
+        
+        log(f"发现信号: {symbol} ({score}分)", "ALERT")
+        
+        try:
+            # 检查冷却时间
+            if self.analyzer.check_alert_cooldown(symbol, score):
+                # 发送Telegram警报 (异步队列，同周期的多条信号会合并发送)
+                telegram_msg = self.analyzer.format_telegram_message(signal_data)
+                
+                if self.link:
+                    # 分片模式: 协调进程跨分片去重后通知，并作为唯一写入者记录信号
+                    self.link.send("signal", signal=signal_data, message=telegram_msg)
+                else:
+                    if self.analyzer.notify(telegram_msg):
+                        log(f"Telegram警报已入队: {symbol}", "SUCCESS")
+                    
+                    # 记录信号
+                    self.analyzer.record_signal(signal_data)
+                
+                # 开始跟踪这个信号
+                self.analyzer.track_active_signal(symbol, signal_data)
+            
+            self.total_signals_found += 1
+            
+        except Exception as e:
+            log(f"处理信号 {symbol} 失败: {e}", "ERROR")
+    
+    def _on_market_updates(self, updates: List[Tuple[str, Dict]]):
+        now = time.time()
+        for symbol, values in updates:
+            self.events.observe(symbol, now=now, **values)
+    
+    def mark_evaluated(self, symbol: str):
+        """以当前行情和本周期OI作为事件评估的新基准"""
+        self.events.mark_evaluated(symbol, oi=self.binance.cycle.get("oi", symbol))
+    
+    def evaluate_event(self, symbol: str):
+        """
+        事件触发的单币种评估 (事件线程)
+        费率取自流式行情表，增强指标在 EVENT_ENHANCED_TTL 内复用
+        """
+        table = self.binance.market_table
+        row = table.row(symbol) if table is not None else None
+        if not row or row.get("funding_rate", 0) >= Config.FUNDING_RATE_THRESHOLD or not self.owns(symbol):
+            return
+        
+        symbol_data = {
+            "symbol": symbol,
+            "funding_rate": row["funding_rate"],
+            "next_funding": row.get("next_funding_time", ""),
+            "exchange": "binance",
+            "timestamp": datetime.now().isoformat()
+        }
+        with metrics.stage("event"):
+            signal_data = self.analyzer.analyze_squeeze_potential(symbol_data, incremental=True)
+        self.mark_evaluated(symbol)
+        
+        if signal_data:
+            log(f"事件触发评估: {symbol}", "INFO")
+            with self._state_lock:
+                self.process_signal(signal_data)
+    
+    def run_tracking_cycle(self):
+        """
+        快速跟踪: 只为跟踪中的币种取OI和全平台多空比，检测阶段4/5
+        不做发现扫描，请求量只与跟踪数量有关
+        """
+        if not self.analyzer.active_tracking:
+            return
         
-        # 显示统计信息 (每5次扫描)
-        if self.scan_count % 5 == 0:
-            self.show_statistics()
+        # 独立快照: 不作废扫描周期的行情快照和已取的OI，下次扫描仍可复用
+        cycle = CycleSnapshot()
+        with self._state_lock, metrics.stage("tracking"):
+            self.analyzer.update_tracking(cycle)
+        metrics.set("active_tracking", len(self.analyzer.active_tracking))
+        self.report_tracking()
+        log(f"跟踪轮询: {len(self.analyzer.active_tracking)} 个信号, 请求 {cycle.misses} 次", "DEBUG")
     
-    def show_statistics(self):
-        """显示运行统计"""
-        total = len(self.analyzer.signals_log)
-        strong = len([s for s in self.analyzer.signals_log if s["score"] >= 70])
-        medium = len([s for s in self.analyzer.signals_log if s["score"] >= 50])
-        weak = total - strong - medium
+    def print_summary(self):
+        """定期运行摘要: 信号与跟踪、调度、缓存、接口延迟和阶段耗时"""
+        stats = self.analyzer.signal_store.stats
+        total = stats["total"]
+        strong, medium, weak = stats["strong"], stats["medium"], stats["weak"]
         
         active = len(self.analyzer.active_tracking)
         
         print(f"\n{'='*60}")
-        print(f"📊 运行统计 (第{self.scan_count}次扫描)")
+        print(f"📊 运行摘要 (第{self.scan_count}次扫描)")
         print(f"{'='*60}")
         print(f"• 总扫描次数: {self.scan_count}")
         print(f"• 历史总信号: {total}")
@@ -932,80 +3659,96 @@ class SqueezeMonitor:
         print(f"• 正在跟踪: {active} 个活跃信号")
         
         if total > 0:
-            avg_score = sum(s["score"] for s in self.analyzer.signals_log) / total
+            avg_score = stats["score_sum"] / total
             print(f"• 平均评分: {avg_score:.1f}")
         
         # 显示最近信号
-        if self.analyzer.signals_log:
-            recent = self.analyzer.signals_log[-3:]
-            print(f"\n🕐 最近信号:")
-            for signal in recent:
-                time_str = datetime.fromisoformat(signal["timestamp"]).strftime("%m-%d %H:%M")
-                print(f"   {time_str} | {signal['symbol']}: {signal['score']}分")
+        recent = self.analyzer.signal_store.recent(3)
+        if recent:
+            print("\n🕐 最近信号:")
+            for record in recent:
+                time_str = datetime.fromisoformat(record["timestamp"]).strftime("%m-%d %H:%M")
+                print(f"   {time_str} | {record['symbol']}: {record['score']}分")
         
         # 显示正在跟踪的信号
         if self.analyzer.active_tracking:
-            print(f"\n🔍 正在跟踪的信号:")
+            print("\n🔍 正在跟踪的信号:")
             for symbol, data in list(self.analyzer.active_tracking.items())[:5]:
                 phase = data.get("phase", "PHASE_1_2")
                 start = datetime.fromisoformat(data["start_time"]).strftime("%H:%M")
                 print(f"   {symbol}: {phase} (开始于 {start})")
         
+        print("\n⏱️ 调度:")
+        for job in self.scheduler.jobs:
+            print(f"   {job.summary()}")
+        if self.events:
+            print(f"   {self.events.summary()}")
+        
+        print("\n🗃️ 响应缓存:")
+        for cache in self.response_caches():
+            print(f"   {cache.summary()}")
+        
+        lines = metrics.summary_lines()
+        if lines:
+            print("\n🌐 接口与阶段耗时:")
+            for line in lines:
+                print(f"   {line}")
+        
         print(f"{'='*60}\n")
     
     def run(self):
         """主运行循环"""
         # 显示配置
-        print(f"\n🎯 策略配置 (严格遵循原文)")
+        print("\n🎯 策略配置 (严格遵循原文)")
         print(f"{'='*60}")
-        print(f"核心条件:")
+        print("核心条件:")
         print(f"  • 资金费率 < {Config.FUNDING_RATE_THRESHOLD:.3%}")
-        print(f"  • OI激增比 > {Config.OI_SURGE_RATIO}x (近3次/近10次)")
-        print(f"\n增强指标:")
+        print(f"  • OI激增比 > {Config.OI_SURGE_RATIO}x (近{Config.OI_SHORT_WINDOW}个/近{Config.OI_LONG_WINDOW}个 {Config.OI_SAMPLE_SECONDS} 秒桶)")
+        print("\n增强指标:")
         print(f"  • 散户空头 > {Config.GLOBAL_SHORT_THRESHOLD*100:.0f}%")
         print(f"  • 主动买盘比 > {Config.TAKER_BUY_THRESHOLD}")
-        print(f"  • 大户多空比趋势上升")
-        print(f"\n运行设置:")
+        print("  • 大户多空比趋势上升")
+        print("\n运行设置:")
         print(f"  • 扫描间隔: {Config.SCAN_INTERVAL_SECONDS//60} 分钟")
-        print(f"  • 数据保存: {Config.DATA_DIR}/{{symbol}}.csv")
-        print(f"  • 最大分析: {Config.MAX_SYMBOLS_TO_ANALYZE} 币种/次")
+        print(f"  • 跟踪间隔: {Config.TRACKING_INTERVAL_SECONDS} 秒")
+        print(f"  • 数据保存: {Config.TIMESERIES_DIR}/signals/{{日期}}/{{symbol}}.bin")
+        print(f"  • 请求预算: {Config.SCAN_REQUEST_BUDGET} 次逐币种请求/周期 (含跟踪和增强，全部负费率币种按优先级轮转)")
+        print(f"  • 并发线程: {Config.SCAN_WORKERS}")
+        print(f"  • 增强上限: {Config.MAX_ENRICH_PER_CYCLE} 币种/次")
         print(f"{'='*60}")
         
-        # 测试API
-        if not self.test_apis():
+        # 测试API: 快速启动时在后台与首次扫描并行，失败只记录错误
+        if Config.FAST_START:
+            threading.Thread(target=self.test_apis, name="api-test", daemon=True).start()
+        elif not self.test_apis():
             log("API测试失败，程序退出", "ERROR")
             return
         
         log("开始主监控循环...", "SUCCESS")
         
-        # 主循环
-        last_scan_time = 0
+        # 主循环: 发现扫描和跟踪轮询按各自节奏执行
+        last_scan_count = 0
         while True:
             try:
-                current_time = time.time()
+                wait_time = self.scheduler.run_pending()
                 
-                # 检查是否到达扫描时间
-                if current_time - last_scan_time >= Config.SCAN_INTERVAL_SECONDS:
-                    self.run_scan_cycle()
-                    last_scan_time = current_time
-                    
-                    # 计算下次扫描时间
-                    next_scan = datetime.now() + timedelta(seconds=Config.SCAN_INTERVAL_SECONDS)
+                if self.scan_count != last_scan_count:
+                    last_scan_count = self.scan_count
+                    next_scan = datetime.fromtimestamp(self.discovery_job.next_run)
                     log(f"下次扫描: {next_scan.strftime('%H:%M:%S')}", "INFO")
                 
                 # 等待期间保持活跃
-                wait_time = max(1, Config.SCAN_INTERVAL_SECONDS - (time.time() - last_scan_time))
-                time.sleep(min(wait_time, 30))  # 最多睡30秒，以便及时响应
+                time.sleep(min(max(wait_time, 0.5), 30))  # 最多睡30秒，以便及时响应
                 
             except KeyboardInterrupt:
                 log("用户中断，程序停止", "WARN")
                 
                 # 保存所有数据
-                self.binance.save_oi_history()
-                self.analyzer.save_signals_log()
+                self.save_checkpoint()
+                self.binance.flush_series()
                 
-                # 发送停止通知
-                if Config.TELEGRAM_TOKEN and Config.TELEGRAM_CHAT_ID:
+                # 发送停止通知 (分片模式由协调进程发送)
+                if Config.TELEGRAM_TOKEN and Config.TELEGRAM_CHAT_ID and not self.link:
                     stop_msg = (
                         "🛑 *轧空监控机器人已停止*\n\n"
                         f"• 停止时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
@@ -1014,20 +3757,262 @@ class SqueezeMonitor:
                         f"• 正在跟踪: {len(self.analyzer.active_tracking)} 个信号\n\n"
                         "机器人已保存所有数据，下次启动将恢复运行。"
                     )
-                    send_telegram(stop_msg)
+                    telegram_dispatcher.enqueue(stop_msg)
                 
+                if self.events:
+                    self.events.stop()
+                if self.stream:
+                    self.stream.stop()
+                if self.metrics_server:
+                    self.metrics_server.stop()
+                
+                # 发送队列中剩余的消息
+                telegram_dispatcher.stop(timeout=30)
                 break
                 
             except Exception as e:
                 log(f"主循环异常: {e}", "ERROR")
                 time.sleep(60)  # 异常后等待1分钟
 
+# ==================== 分片部署 ====================
+class HashRing:
+    """一致性哈希环: 币种 -> 分片号。每个分片 replicas 个虚拟节点，分片数变化时只有约 1/N 的币种换分片"""
+    
+    def __init__(self, shards: int, replicas: int = Config.SHARD_RING_REPLICAS):
+        points = sorted((self._hash(f"shard-{shard}-{replica}"), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self.keys = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+    
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+    
+    def owner(self, symbol: str) -> int:
+        index = bisect.bisect(self.keys, self._hash(symbol)) % len(self.keys)
+        return self.owners[index]
+
+class CoordinatorLink:
+    """工作进程到协调进程的本地IPC连接 (multiprocessing.connection)，断开后下次发送时重连"""
+    
+    def __init__(self, address: Tuple[str, int], authkey: bytes, shard: int):
+        self.address = address
+        self.authkey = authkey
+        self.shard = shard
+        self.conn = None
+        self._lock = threading.Lock()
+    
+    def _exchange(self, kind: str, payload: Dict, reply: bool):
+        """发送一条消息，reply=True 时等待协调进程回复；失败返回 None"""
+        message = dict(payload, type=kind, shard=self.shard)
+        with self._lock:
+            for _ in range(2):
+                try:
+                    if self.conn is None:
+                        self.conn = Client(self.address, authkey=self.authkey)
+                    self.conn.send(message)
+                    return self.conn.recv() if reply else True
+                except (OSError, EOFError, AuthenticationError) as e:
+                    error = e
+                    self.conn = None
+        log(f"发送到协调进程失败 ({kind}): {error}", "WARN")
+        return None
+    
+    def send(self, kind: str, **payload) -> bool:
+        return bool(self._exchange(kind, payload, reply=False))
+    
+    def notify(self, message: str) -> bool:
+        """跟踪阶段通知 (替代 telegram_dispatcher.enqueue)"""
+        return self.send("notify", message=message)
+    
+    def funding_symbols(self) -> Optional[List[Dict]]:
+        """协调进程缓存的负费率币种列表 (替代各分片各自请求Coinglass)；连接失败返回 None"""
+        return self._exchange("funding", {}, reply=True)
+
+def run_shard_worker(index: int, count: int, address: Tuple[str, int], authkey: bytes,
+                     proxy: str, own_ip: bool):
+    """
+    工作进程入口 (spawn 启动)
+    与其他工作进程共用出口IP时按分片数分摊限流额度和扫描请求预算；
+    Coinglass 按 API key 限流，总是与协调进程 (负责请求负费率列表) 一起分摊
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由协调进程处理，再经 SIGTERM 停止工作进程
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    
+    Config.PROXY = proxy
+    for name, bucket in rate_limiter.buckets.items():
+        if name == "coinglass":
+            bucket.scale(1 / (count + 1))
+        elif not own_ip:
+            bucket.scale(1 / count)
+    if not own_ip:
+        Config.SCAN_REQUEST_BUDGET = max(1, -(-Config.SCAN_REQUEST_BUDGET // count))
+    if Config.METRICS_PORT:
+        Config.METRICS_PORT += index + 1
+    
+    # 信号日志只由协调进程读写，工作进程用内存存储
+    monitor = SqueezeMonitor(shard=(index, count), link=CoordinatorLink(address, authkey, index),
+                             signal_store=MemorySignalLogStore())
+    monitor.run()
+
+class ShardCoordinator:
+    """
+    分片协调进程
+    启动 N 个工作进程 (意外退出时重启)，经本地IPC接收它们的信号、通知和跟踪摘要；
+    警报按原冷却规则跨分片去重后统一发送，信号日志只由协调进程写入；
+    负费率列表由协调进程请求一次并缓存半个扫描间隔，各分片经IPC取用
+    """
+    
+    def __init__(self, shards: int = Config.SHARD_COUNT, proxies: Optional[List[str]] = None):
+        self.shards = shards
+        self.proxies = Config.SHARD_PROXIES if proxies is None else proxies
+        self.authkey = os.urandom(16)
+        self.context = multiprocessing.get_context("spawn")  # 不 fork 带线程的父进程
+        self.listener = None
+        self.workers = {}  # {分片号: Process}
+        self.analyzer = SqueezeSignalAnalyzer(None, None)  # 只用冷却表和信号日志
+        self.coinglass = CoinglassClient()
+        self.tracking = {}  # {分片号: {symbol: 跟踪摘要}}
+        self.received = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+        self._funding = (0.0, [])  # (请求时间, 负费率币种列表)
+        self._funding_lock = threading.Lock()  # 串行化列表请求，不占用 _lock
+    
+    def start(self):
+        self.listener = Listener((Config.COORDINATOR_HOST, 0), authkey=self.authkey)
+        rate_limiter.buckets["coinglass"].scale(1 / (self.shards + 1))  # 与工作进程分摊同一个 API key
+        threading.Thread(target=self._accept_loop, name="coordinator", daemon=True).start()
+        telegram_dispatcher.session = create_http_session(4)
+        for index in range(self.shards):
+            self._spawn(index)
+        log(f"分片模式: {self.shards} 个工作进程, 代理 {len(self.proxies)} 个, IPC {self.listener.address}", "SUCCESS")
+    
+    def _spawn(self, index: int):
+        proxy = self.proxies[index % len(self.proxies)] if self.proxies else Config.PROXY
+        process = self.context.Process(
+            target=run_shard_worker, name=f"shard-{index}",
+            args=(index, self.shards, self.listener.address, self.authkey, proxy, bool(self.proxies)))
+        process.start()
+        self.workers[index] = process
+    
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                return  # 监听已关闭
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+    
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = self.handle(message)
+                except Exception as e:
+                    log(f"处理分片消息失败: {e}", "ERROR")
+                    reply = None
+                if message.get("type") == "funding":
+                    # 请求类消息必须回复，None 让工作进程自己请求Coinglass
+                    try:
+                        conn.send(reply)
+                    except (OSError, ValueError):
+                        return
+    
+    def funding_symbols(self) -> List[Dict]:
+        """负费率币种列表，半个扫描间隔内各分片共用同一次请求"""
+        with self._funding_lock:
+            fetched_at, symbols = self._funding
+            if time.time() - fetched_at >= Config.SCAN_INTERVAL_SECONDS / 2:
+                symbols = self.coinglass.get_negative_funding_symbols()
+                self._funding = (time.time(), symbols)
+            return symbols
+    
+    def handle(self, message: Dict):
+        kind, shard = message["type"], message["shard"]
+        if kind == "funding":
+            return self.funding_symbols()
+        with self._lock:
+            if kind == "signal":
+                signal_data = message["signal"]
+                self.received += 1
+                if self.analyzer.check_alert_cooldown(signal_data["symbol"], signal_data["score"]):
+                    telegram_dispatcher.enqueue(message["message"])
+                    self.analyzer.record_signal(signal_data)
+                    log(f"分片 {shard} 信号: {signal_data['symbol']} ({signal_data['score']}分)", "ALERT")
+                else:
+                    self.duplicates += 1
+                    log(f"分片 {shard} 重复信号已忽略: {signal_data['symbol']}", "INFO")
+            elif kind == "notify":
+                telegram_dispatcher.enqueue(message["message"])
+            elif kind == "tracking":
+                self.tracking[shard] = message["active"]
+                self.analyzer.active_tracking = {
+                    symbol: data for active in self.tracking.values() for symbol, data in active.items()
+                }
+    
+    def print_summary(self):
+        alive = sum(1 for process in self.workers.values() if process.is_alive())
+        with self._lock:
+            log(f"分片: {alive}/{self.shards} 个工作进程在线 | 收到信号 {self.received} 条, 跨分片去重 {self.duplicates} 条 | "
+                f"跟踪中 {len(self.analyzer.active_tracking)} 个 | 历史总信号 {self.analyzer.signal_store.stats['total']}", "STATS")
+    
+    def stop(self):
+        """SIGTERM 停止所有工作进程 (各自保存检查点)，再关闭IPC和发送队列"""
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.workers.values():
+            process.join(timeout=60)
+        self.listener.close()
+        telegram_dispatcher.stop(timeout=30)
+    
+    def run(self):
+        self.start()
+        last_summary = time.time()
+        while True:
+            try:
+                time.sleep(5)
+                for index, process in list(self.workers.items()):
+                    if not process.is_alive():
+                        log(f"工作进程 shard-{index} 已退出 (exit {process.exitcode})，重新启动", "WARN")
+                        self._spawn(index)
+                if time.time() - last_summary >= Config.SUMMARY_INTERVAL_SECONDS:
+                    last_summary = time.time()
+                    self.print_summary()
+            except KeyboardInterrupt:
+                log("用户中断，停止所有工作进程", "WARN")
+                self.stop()
+                break
+
 # ==================== 主函数 ====================
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
 def main():
     """主函数"""
+    print("=" * 70)
+    print("🔥 山寨币轧空监控机器人 - 完整逻辑版")
+    print("📊 策略: 严格遵循原文五阶段逻辑链条")
+    print(f"🕐 启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 70)
+    
     log("初始化机器人...")
     
-    # 创建并运行监控器
+    # 容器重启/部署发送 SIGTERM: 按用户中断处理，保存检查点后退出
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    
+    # 分片模式: 协调进程 + N 个工作进程；否则单进程运行监控器
+    if Config.SHARD_COUNT > 1:
+        ShardCoordinator().run()
+        return
+    
     monitor = SqueezeMonitor()
     monitor.run()
 
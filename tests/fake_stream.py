@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""测试用的本地假行情 WebSocket 服务"""
+import base64
+import hashlib
+import json
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class FakeStreamServer:
+    """
+    本地假行情 WebSocket 服务 (测试用)，不连外网
+    实现 RFC 6455 握手和服务端文本帧，按币安合并流的消息格式推送随机游走的标记价格/费率/ticker。
+    MarketStream 像连接币安一样连接它，帧解析、断线重连和退避走的都是实盘路径
+    """
+    
+    WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+    
+    def __init__(self, symbols: Optional[List[str]] = None, interval: float = 1.0, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.symbols = symbols or [f"FAKE{i}USDT" for i in range(50)]
+        self.interval = interval
+        self.rng = np.random.default_rng(seed)
+        self.prices = dict(zip(self.symbols, self.rng.uniform(0.1, 100, len(self.symbols))))
+        self.funding = dict(zip(self.symbols, self.rng.normal(-0.0005, 0.001, len(self.symbols))))
+        self.paused = threading.Event()  # 置位时保持连接但不推送 (模拟行情停滞)
+        self.connections = 0  # 累计完成握手的连接数
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def do_GET(self):
+                key = self.headers.get("Sec-WebSocket-Key")
+                if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+                    self.send_error(400)
+                    return
+                accept = base64.b64encode(hashlib.sha1((key + server.WS_GUID).encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.wfile.flush()
+                self.close_connection = True
+                server._serve(self.connection)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"ws://{host}:{self.server.server_port}/stream"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-stream", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self.drop()
+        if self._thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
+    
+    def drop(self):
+        """断开当前所有连接 (模拟网络中断或币安的24小时断线)"""
+        with self._lock:
+            clients, self._clients = self._clients, set()
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def frame(data: bytes, opcode: int = 0x1) -> bytes:
+        """服务端帧 (FIN置位，服务端发出的帧不加掩码)，默认文本帧"""
+        n = len(data)
+        if n < 126:
+            header = bytes([0x80 | opcode, n])
+        elif n < 1 << 16:
+            header = bytes([0x80 | opcode, 126]) + n.to_bytes(2, "big")
+        else:
+            header = bytes([0x80 | opcode, 127]) + n.to_bytes(8, "big")
+        return header + data
+    
+    @staticmethod
+    def _recv_exact(conn: socket.socket, n: int) -> bytes:
+        data = b""
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("连接已关闭")
+            data += chunk
+        return data
+    
+    def _read_frame(self, conn: socket.socket) -> Tuple[int, bytes]:
+        """读取一个客户端帧 (客户端帧总是带掩码)，返回 (opcode, 负载)"""
+        first, second = self._recv_exact(conn, 2)
+        n = second & 0x7F
+        if n == 126:
+            n = int.from_bytes(self._recv_exact(conn, 2), "big")
+        elif n == 127:
+            n = int.from_bytes(self._recv_exact(conn, 8), "big")
+        mask = self._recv_exact(conn, 4) if second & 0x80 else bytes(4)
+        payload = self._recv_exact(conn, n)
+        return first & 0x0F, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    
+    def _serve(self, conn: socket.socket):
+        """
+        连接线程: 按 interval 推送一轮消息，其间处理客户端的 ping (回 pong) 和 close (回 close 后断开)，
+        直到连接断开或服务停止
+        """
+        with self._lock:
+            self._clients.add(conn)
+            self.connections += 1
+        try:
+            next_push = 0.0
+            while not self._stop.is_set():
+                with self._lock:
+                    if conn not in self._clients:
+                        return
+                now = time.time()
+                if now >= next_push:
+                    if not self.paused.is_set():
+                        for raw in self.frames():
+                            conn.sendall(self.frame(raw.encode("utf-8")))
+                    next_push = now + self.interval
+                
+                readable, _, _ = select.select([conn], [], [], max(0.0, next_push - time.time()))
+                if readable:
+                    opcode, payload = self._read_frame(conn)
+                    if opcode == 0x8:  # close
+                        conn.sendall(self.frame(payload[:2], opcode=0x8))
+                        return
+                    if opcode == 0x9:  # ping
+                        conn.sendall(self.frame(payload, opcode=0xA))
+        except (OSError, ValueError):
+            pass  # 客户端断开 (或 drop 关闭了套接字)
+        finally:
+            with self._lock:
+                self._clients.discard(conn)
+    
+    def frames(self) -> List[str]:
+        """生成一轮 (标记价格 + ticker) 消息"""
+        now_ms = int(time.time() * 1000)
+        marks, tickers = [], []
+        for symbol in self.symbols:
+            self.prices[symbol] *= float(np.exp(self.rng.normal(0, 0.002)))
+            self.funding[symbol] += float(self.rng.normal(0, 0.00005))
+            price = self.prices[symbol]
+            marks.append({"e": "markPriceUpdate", "E": now_ms, "s": symbol, "p": f"{price:.6f}",
+                          "i": f"{price:.6f}", "r": f"{self.funding[symbol]:.6f}", "T": now_ms + 3600_000})
+            tickers.append({"e": "24hrTicker", "E": now_ms, "s": symbol, "c": f"{price:.6f}",
+                            "q": f"{self.rng.uniform(1e5, 1e8):.0f}", "h": f"{price * 1.05:.6f}",
+                            "l": f"{price * 0.95:.6f}", "P": f"{self.rng.normal(0, 3):.2f}"})
+        return [json.dumps({"stream": "!markPrice@arr@1s", "data": marks}),
+                json.dumps({"stream": "!ticker@arr", "data": tickers})]
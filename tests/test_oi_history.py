@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""OI历史: 按扫描间隔分桶，窗口跨度与原来的近3次/近10次扫描一致；5m历史回填按阶梯铺满长窗口"""
+import time
+
+import pytest
+
+from squeeze_monitor import Config, BinanceDataClient, OIHistoryBuffer
+
+
+def test_windows_span_scan_cadence():
+    buffer = OIHistoryBuffer()
+    assert buffer.period == Config.SCAN_INTERVAL_SECONDS
+    now = 1_800_000_000.0
+    for k in range(10):
+        buffer.append("AAAUSDT", 100.0, ts=now - (9 - k) * 60)
+    assert buffer.surge_ratio("AAAUSDT", now) == pytest.approx(1.0)
+    # 最近3分钟翻倍: 短窗口均值 200，长窗口均值 (7×100 + 3×200) / 10 = 130
+    for k in range(3):
+        buffer.append("AAAUSDT", 200.0, ts=now - (2 - k) * 60)
+    assert buffer.surge_ratio("AAAUSDT", now) == pytest.approx(200 / 130)
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def test_backfill_holds_coarse_samples_across_buckets(monkeypatch):
+    client = BinanceDataClient()
+    step = 300
+    end = time.time() // step * step
+
+    def fake_get(url, params=None, timeout=None):
+        points = [end - (params["limit"] - 1 - k) * step for k in range(params["limit"])]
+        return FakeResponse([{"timestamp": int(ts * 1000), "sumOpenInterest": "1000"} for ts in points])
+
+    monkeypatch.setattr(client.http, "get", fake_get)
+    assert client.backfill_oi_history("AAAUSDT") >= Config.OI_LONG_WINDOW
+    assert client.oi_history.coverage("AAAUSDT") >= client.oi_history.min_samples
+    assert client.oi_history.surge_ratio("AAAUSDT") == pytest.approx(1.0)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""扫描排期: 预算按请求数计 (跟踪、OI、回填、按通过率估算的增强)，优先级高的先选"""
+from types import SimpleNamespace
+
+import pytest
+
+from squeeze_monitor import Config, CycleSnapshot, PeriodCache, ScanPlanner
+
+
+class FakeBinance:
+    def __init__(self, pending=()):
+        self.cycle = CycleSnapshot()
+        self.ratio_caches = {"global_ls": PeriodCache("global_ls", 3600), "top_ls": PeriodCache("top_ls", 3600)}
+        self.cross_oi = SimpleNamespace(clients={})
+        self.pending = set(pending)
+
+    def backfill_pending(self, symbol, now):
+        return symbol in self.pending
+
+
+def make_planner(tracking=(), pending=()):
+    analyzer = SimpleNamespace(
+        binance=FakeBinance(pending),
+        coinglass=SimpleNamespace(taker_cache=PeriodCache("taker", 3600)),
+        active_tracking={symbol: {} for symbol in tracking},
+    )
+    return ScanPlanner(analyzer, clock=lambda: 1_000_000.0)
+
+
+def candidates(n):
+    # 费率越负优先级越高
+    return [{"symbol": f"S{i}USDT", "funding_rate": Config.FUNDING_RATE_THRESHOLD * (n - i)} for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    monkeypatch.setattr(Config, "MAX_ENRICH_PER_CYCLE", 20)
+
+
+def test_budget_counts_expected_enrichment():
+    planner = make_planner()
+    planner.pass_rate = 0.5
+    skipped = []
+    selected = planner.select(candidates(30), budget=20, on_skip=skipped.append)
+    # 每个币种 1 次OI + 0.5 × 3 次增强 = 2.5
+    assert len(selected) == 8
+    assert len(skipped) == 22
+    assert planner.spent <= 20
+    assert [item["symbol"] for item in selected] == [f"S{i}USDT" for i in range(8)]
+
+
+def test_tracking_is_reserved_from_budget():
+    planner = make_planner(tracking=["S0USDT", "S1USDT"])
+    planner.pass_rate = 0.0
+    selected = planner.select(candidates(30), budget=10)
+    # 跟踪更新先占 2 × (OI + 多空比) = 4，跟踪中的币种扫描不再计OI
+    assert planner.spent == pytest.approx(10)
+    assert len(selected) == 8
+
+
+def test_backfill_costs_an_extra_request():
+    planner = make_planner(pending=["S0USDT"])
+    planner.pass_rate = 0.0
+    skipped = []
+    selected = planner.select(candidates(3), budget=2, on_skip=skipped.append)
+    assert [item["symbol"] for item in selected] == ["S0USDT"]
+    assert len(skipped) == 2
+
+
+def test_select_streams_through_a_bounded_heap():
+    planner = make_planner()
+    planner.pass_rate = 0.0
+    skipped = []
+    selected = planner.select(iter(candidates(1000)), budget=5, on_skip=skipped.append)
+    assert [item["symbol"] for item in selected] == [f"S{i}USDT" for i in range(5)]
+    assert len(skipped) == 995
+
+
+def test_pass_rate_follows_observed_cycles():
+    planner = make_planner()
+    for _ in range(20):
+        planner.observe(screened=10, passed=1)
+    assert planner.pass_rate == pytest.approx(0.1, abs=0.01)
+    planner.observe(screened=0, passed=0)
+    assert planner.pass_rate == pytest.approx(0.1, abs=0.01)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""分片: 工作进程不读写信号日志文件；负费率列表由协调进程请求一次，各分片共用"""
+import os
+
+import pytest
+
+from squeeze_monitor import Config, MemorySignalLogStore, ShardCoordinator
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SIGNALS_LOG_FILE", str(tmp_path / "signals_log.jsonl"))
+    monkeypatch.setattr(Config, "LEGACY_SIGNALS_LOG_FILE", str(tmp_path / "signals_log.json"))
+    return tmp_path
+
+
+def test_worker_store_never_touches_the_log_file(data_dir):
+    path = data_dir / "signals_log.jsonl"
+    path.write_text('{"symbol": "AAAUSDT", "score": 80}\n', encoding="utf-8")
+    before = path.read_text(encoding="utf-8")
+
+    store = MemorySignalLogStore()
+    store.append({"symbol": "BBBUSDT", "score": 60})
+    store.compact()
+
+    assert path.read_text(encoding="utf-8") == before
+    assert not os.path.exists(str(path) + ".tmp")
+    assert store.count == 1
+    assert store.stats["medium"] == 1
+
+
+def test_coordinator_fetches_funding_once_for_all_shards(monkeypatch):
+    coordinator = ShardCoordinator(shards=3, proxies=[])
+    calls = []
+
+    def fake_fetch():
+        calls.append(1)
+        return [{"symbol": "AAAUSDT", "funding_rate": -0.001}]
+
+    monkeypatch.setattr(coordinator.coinglass, "get_negative_funding_symbols", fake_fetch)
+    replies = [coordinator.handle({"type": "funding", "shard": shard}) for shard in range(3)]
+    assert len(calls) == 1
+    assert all(reply == [{"symbol": "AAAUSDT", "funding_rate": -0.001}] for reply in replies)
+
+    coordinator._funding = (0.0, replies[0])  # 缓存过期后重新请求
+    coordinator.handle({"type": "funding", "shard": 0})
+    assert len(calls) == 2
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Telegram发送队列: 合并消息被拒绝时逐条/纯文本重发，超长消息按行截断"""
+import pytest
+
+import squeeze_monitor as sm
+from squeeze_monitor import Config, TelegramDispatcher
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    """记录每次发送; 含 BAD 的消息在Markdown模式下返回400"""
+    sent = []
+
+    def fake_post(message, session=None, parse_mode="Markdown"):
+        sent.append((message, parse_mode))
+        if parse_mode and "BAD" in message:
+            return 400, None
+        return 200, None
+
+    monkeypatch.setattr(sm, "post_telegram", fake_post)
+    monkeypatch.setattr(Config, "TELEGRAM_RETRY_BACKOFF", 0)
+    return sent
+
+
+def test_rejected_batch_is_resent_one_by_one(posts):
+    dispatcher = TelegramDispatcher()
+    for parts in dispatcher._merge(["alert A", "alert BAD_", "alert C"]):
+        dispatcher._deliver(parts)
+
+    delivered = posts[1:]
+    assert ("alert A", "Markdown") in delivered
+    assert ("alert C", "Markdown") in delivered
+    assert ("alert BAD_", None) in delivered
+    assert dispatcher.sent == 3
+    assert dispatcher.failed == 0
+
+
+def test_truncate_on_line_boundary(monkeypatch):
+    monkeypatch.setattr(Config, "TELEGRAM_MAX_LENGTH", 25)
+    message = "*line one*\n*line two*\n*line three*"
+    truncated = TelegramDispatcher._truncate(message)
+    assert truncated == "*line one*\n*line two*"
+    assert TelegramDispatcher._truncate("short") == "short"
+
+
+def test_merge_respects_length_limit(monkeypatch):
+    monkeypatch.setattr(Config, "TELEGRAM_MAX_LENGTH", 25)
+    groups = TelegramDispatcher()._merge(["a" * 10, "b" * 10, "c" * 10])
+    assert groups == [["a" * 10, "b" * 10], ["c" * 10]]
+    for parts in groups:
+        assert len(TelegramDispatcher.SEPARATOR.join(parts)) <= 25